@@ -0,0 +1,82 @@
+"""
+JWT authentication that serves users from the cache
+
+The stock JWTAuthentication loads the User row on every authenticated
+request. CachedJWTAuthentication keeps the loaded user in the cache for a
+short TTL, keyed by the token's user id claim and a per-user profile version.
+Only the profile fields are cached, never the password hash or addresses;
+the others are loaded from the database if a view reads them.
+Saving or deleting a user replaces the version (see signals.py). Entries and
+versions live in the shared cache, so profile updates, verification and
+password changes take effect on the next request in every worker. Versions
+are random rather than counters: a version that was evicted is replaced by a
+new one, never by a value an old entry was cached under.
+Tokens revoked on logout are rejected via token_revocation.
+"""
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+import uuid
+
+from .models import User
+from .shared_cache import shared_cache as cache
+from .token_revocation import is_token_revoked
+
+# Fields kept in the cached copy of a user
+CACHED_USER_FIELDS = [
+    'id', 'username', 'email', 'firstName', 'lastName', 'phone', 'company',
+    'isVerified', 'is_active', 'is_staff', 'is_superuser', 'createdAt', 'updatedAt',
+]
+
+def get_auth_user_cache_ttl():
+    """Seconds a loaded user is served from the cache"""
+    return getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+
+def _version_key(user_id):
+    return f'auth_user_version:{user_id}'
+
+def user_cache_key(user_id):
+    """Cache key for a user's current profile version"""
+    version_key = _version_key(user_id)
+    version = cache.get(version_key)
+    if version is None:
+        # First request or evicted: start a version no entry was cached under
+        cache.add(version_key, uuid.uuid4().hex, None)
+        version = cache.get(version_key)
+    return f'auth_user:{user_id}:{version}'
+
+def invalidate_cached_user(user_id):
+    """Replace the user's profile version so any cached copy is ignored"""
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_token_revoked(validated_token):
+            raise InvalidToken(_("Token has been revoked"))
+        return validated_token
+    
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        
+        key = user_cache_key(user_id)
+        values = cache.get(key)
+        if values is None:
+            # Loads the row and runs the active / revoked-password checks
+            user = super().get_user(validated_token)
+            cache.set(key, {field: getattr(user, field) for field in CACHED_USER_FIELDS}, get_auth_user_cache_ttl())
+            return user
+        
+        # The other fields are deferred, so saving this user only writes the cached ones
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+        user = User.from_db(User.objects.db, names, [values[name] for name in names])
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        
+        return user
@@ -0,0 +1,141 @@
+"""
+Write-behind buffer for builder autosaves
+
+The builder autosaves on nearly every edit. Writing each one to the website
+rewrites the whole row and records a revision. Autosaves are instead stored
+as PendingAutosave rows, one per website and field, with a single
+``INSERT ... ON CONFLICT DO UPDATE`` statement per autosave (later edits of a
+field replace earlier ones), and written to the website with one UPDATE of
+just the buffered columns at most every AUTOSAVE_FLUSH_SECONDS. Explicit
+saves, other updates of the website, and the ``flush_autosaves`` command (run
+it every minute) write any remaining buffer straight away.
+
+Owner reads overlay the buffer on the stored row, so the editor always sees
+its latest state, and report the version the row will have once the buffer
+is written, so the ETag the editor holds stays valid across the flush.
+
+The buffer lives in the database rather than a cache, so it is shared by all
+workers, survives restarts and is never evicted.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+from datetime import timedelta
+from functools import reduce
+import operator
+
+from .models import Website, PendingAutosave
+from .revisions import record_revision
+
+def get_flush_interval():
+    """Longest time, in seconds, an autosave stays buffered while edits keep coming"""
+    return getattr(settings, 'AUTOSAVE_FLUSH_SECONDS', 10)
+
+def _apply(website, name, value):
+    """Set a buffered value, stored as the field's serializable value, on a Website"""
+    field = Website._meta.get_field(name)
+    setattr(website, field.attname, field.to_python(value))
+
+def get_pending(website_id):
+    """Buffered field values of a website, empty if nothing is pending"""
+    return dict(PendingAutosave.objects.filter(website_id=website_id).values_list('field', 'value'))
+
+def overlay_pending(websites):
+    """
+    Apply buffered values to Website instances in place, with one query
+    
+    A website with a buffer gets the version its flush will write.
+    """
+    websites = list(websites)
+    pending = {}
+    rows = PendingAutosave.objects.filter(website__in=[website.pk for website in websites])
+    for website_id, name, value in rows.values_list('website_id', 'field', 'value'):
+        pending.setdefault(website_id, []).append((name, value))
+    for website in websites:
+        if website.pk in pending:
+            for name, value in pending[website.pk]:
+                _apply(website, name, value)
+            website.version += 1
+    return websites
+
+def buffer_autosave(website, changes, user=None):
+    """
+    Store validated field values in the website's buffer
+    
+    The buffer is flushed in the same call once its oldest field is
+    AUTOSAVE_FLUSH_SECONDS old, so a steady stream of edits reaches the
+    website at a bounded rate.
+    
+    Returns:
+        int or None: the version written when the buffer was flushed
+    """
+    now = timezone.now()
+    # Serializable values, the way the fields themselves dump them
+    values = Website()
+    for name, value in changes.items():
+        setattr(values, name, value)
+    PendingAutosave.objects.bulk_create(
+        [
+            PendingAutosave(
+                website_id=website.pk, field=name, user=user, createdAt=now, updatedAt=now,
+                value=Website._meta.get_field(name).value_from_object(values),
+            )
+            for name in changes
+        ],
+        update_conflicts=True,
+        unique_fields=['website', 'field'],
+        update_fields=['value', 'user', 'updatedAt'],
+    )
+    
+    since = PendingAutosave.objects.filter(website_id=website.pk).aggregate(since=Min('createdAt'))['since']
+    if since is not None and now - since >= timedelta(seconds=get_flush_interval()):
+        return flush_autosave(website.pk)
+    return None
+
+def flush_autosave(website_id):
+    """
+    Write a website's buffered autosave to the database now
+    
+    One UPDATE of the buffered columns plus a revision for the coalesced
+    edits. Only the buffered values that were read are deleted, so an
+    autosave arriving during the flush stays pending for the next one.
+    
+    Returns:
+        int or None: the version written, None if nothing was pending
+    """
+    with transaction.atomic():
+        website = Website.objects.select_for_update().filter(pk=website_id).first()
+        if website is None:
+            return None
+        rows = list(PendingAutosave.objects.filter(website_id=website_id).order_by('updatedAt'))
+        if not rows:
+            return None
+        
+        for row in rows:
+            _apply(website, row.field, row.value)
+        # The row is locked, so this is the next version
+        website.version += 1
+        website.save(update_fields=[*{row.field for row in rows}, 'version', 'updatedAt'])
+        record_revision(website, rows[-1].user)
+        
+        PendingAutosave.objects.filter(
+            reduce(operator.or_, (Q(pk=row.pk, updatedAt=row.updatedAt) for row in rows))
+        ).delete()
+    return website.version
+
+def flush_due_autosaves(older_than=None):
+    """
+    Flush every buffer pending for at least ``older_than`` seconds (default: all)
+    
+    Returns:
+        int: websites written
+    """
+    cutoff = timezone.now() - timedelta(seconds=older_than or 0)
+    website_ids = (
+        PendingAutosave.objects.filter(createdAt__lte=cutoff)
+        .values_list('website_id', flat=True)
+        .distinct()
+    )
+    return sum(flush_autosave(website_id) is not None for website_id in list(website_ids))
@@ -0,0 +1,49 @@
+"""
+System checks for the builder API
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Warning, Tags, register
+
+from .shared_cache import SHARED_CACHE_ALIAS
+
+# Backends whose entries are private to one process, or not kept at all
+UNSHARED_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Backends that delete entries beyond OPTIONS['MAX_ENTRIES'], even without a timeout
+CULLING_CACHE_BACKENDS = {
+    'django.core.cache.backends.db.DatabaseCache',
+    'django.core.cache.backends.filebased.FileBasedCache',
+}
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    OTP lockouts, single-use codes and rate limits only hold if their counters
+    are shared by all workers and never evicted
+    """
+    config = settings.CACHES.get(SHARED_CACHE_ALIAS)
+    if config is None:
+        return [Error(
+            f"CACHES has no '{SHARED_CACHE_ALIAS}' alias for OTP, rate limit and guest cart state.",
+            hint='Add a cache shared by all workers, such as RedisCache or DatabaseCache.',
+            id='builderapi.E004',
+        )]
+    if config['BACKEND'] in UNSHARED_CACHE_BACKENDS:
+        return [Error(
+            f"The '{SHARED_CACHE_ALIAS}' cache uses {config['BACKEND'].rsplit('.', 1)[-1]}, which is not "
+            'shared by workers; OTP lockouts and rate limits would only count per process.',
+            hint='Use RedisCache or DatabaseCache.',
+            id='builderapi.E005',
+        )]
+    if config['BACKEND'] in CULLING_CACHE_BACKENDS and config.get('OPTIONS', {}).get('MAX_ENTRIES', 300) < 100_000:
+        return [Warning(
+            f"The '{SHARED_CACHE_ALIAS}' cache deletes entries once it holds MAX_ENTRIES, "
+            'including OTP attempt counters and used-code markers.',
+            hint="Raise OPTIONS['MAX_ENTRIES'] well above the number of entries in use at once.",
+            id='builderapi.W006',
+        )]
+    return []
@@ -0,0 +1,112 @@
+"""
+Optimistic concurrency for websites, products and blog posts
+
+Each of these rows carries a ``version`` number, sent to clients as the
+``ETag`` of detail responses. Updates must send it back in ``If-Match`` and
+are applied with a conditional ``UPDATE ... WHERE version = n`` that also
+bumps the version, so an editor working from a stale copy gets 412 instead
+of silently overwriting a teammate's changes, and no lock is held between
+the read and the write. ``If-Match: *`` skips the check.
+
+Set REQUIRE_IF_MATCH = False to accept updates without the header while
+clients are being upgraded; they are then applied unconditionally.
+"""
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+import re
+
+ETAG_PATTERN = re.compile(r'(?:W/)?"(\d+)"')
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'This item was changed by someone else. Reload it and try again.'
+    default_code = 'precondition_failed'
+
+class PreconditionRequired(APIException):
+    status_code = status.HTTP_428_PRECONDITION_REQUIRED
+    default_detail = 'Send the ETag you last received in an If-Match header.'
+    default_code = 'precondition_required'
+
+def etag_for(instance):
+    return f'"{instance.version}"'
+
+def get_if_match_versions(request):
+    """
+    Versions accepted by the request's If-Match header
+    
+    Returns:
+        list or None: None for ``*``, or when the header is missing and not required
+    
+    Raises:
+        PreconditionRequired: the header is missing and REQUIRE_IF_MATCH is on
+        PreconditionFailed: the header holds no version this API issued
+    """
+    header = request.headers.get('If-Match')
+    if header is None:
+        if getattr(settings, 'REQUIRE_IF_MATCH', True):
+            raise PreconditionRequired()
+        return None
+    if header.strip() == '*':
+        return None
+    versions = [int(version) for version in ETAG_PATTERN.findall(header)]
+    if not versions:
+        raise PreconditionFailed()
+    return versions
+
+def conditional_update(instance, versions, values):
+    """
+    Write ``values`` and bump the version, only if the row is still at one of ``versions``
+    
+    ``instance`` is updated in place to match the row.
+    
+    Raises:
+        PreconditionFailed: the row has moved on (or was deleted)
+    """
+    model = type(instance)
+    rows = model.objects.filter(pk=instance.pk)
+    if versions is not None:
+        rows = rows.filter(version__in=versions)
+    
+    now = timezone.now()
+    if not rows.update(**values, version=F('version') + 1, updatedAt=now):
+        raise PreconditionFailed()
+    
+    for field, value in values.items():
+        setattr(instance, field, value)
+    instance.updatedAt = now
+    if versions is not None and len(versions) == 1:
+        instance.version = versions[0] + 1
+    else:
+        instance.refresh_from_db(fields=['version'])
+
+class VersionedUpdateMixin:
+    """
+    ModelViewSet mixin: If-Match checked updates applied with conditional_update,
+    and ETag headers on detail responses
+    """
+    
+    def get_expected_versions(self):
+        """
+        Versions accepted by the request's If-Match, read once per request
+        
+        A view that writes the row itself before the update (as websites do
+        with buffered autosaves) can widen ``expected_versions`` to match.
+        """
+        if not hasattr(self, 'expected_versions'):
+            self.expected_versions = get_if_match_versions(self.request)
+        return self.expected_versions
+    
+    def perform_update(self, serializer):
+        conditional_update(serializer.instance, self.get_expected_versions(), serializer.validated_data)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if self.action in ('retrieve', 'update', 'partial_update', 'create') and response.status_code < 300:
+            version = response.data.get('version') if isinstance(response.data, dict) else None
+            if version is not None:
+                response['ETag'] = f'"{version}"'
+        return response
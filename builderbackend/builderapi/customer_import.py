@@ -0,0 +1,258 @@
+"""
+Bulk import of customer accounts
+
+Merchants moving from another platform can load their customer list in one
+go instead of signing every customer up through ``customer_signup``. Rows are
+inserted with ``bulk_create`` in chunks; existing accounts are detected with
+one query per chunk and skipped. When a website is given, new and existing
+accounts alike are recorded as its customers.
+
+Passwords may be given as existing hashes in any format PASSWORD_HASHERS can
+verify (Django's ``algorithm$...`` encoding, e.g. pbkdf2_sha256, argon2,
+bcrypt_sha256, scrypt). Raw bcrypt hashes (``$2b$...``) are accepted when
+BCryptPasswordHasher is enabled. Hashes with weaker parameters are upgraded
+on the customer's next login. Plain-text passwords are hashed on a thread
+pool, and rows without a password get an unusable one so the customer has to
+reset it.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import csv
+import json
+import os
+
+from .models import User, Website, WebsiteCustomer
+from .email_utils import queue_template_emails
+from .otp_utils import describe_otp_lifetime, generate_otp
+
+# Accepted spellings of each column, first match wins
+COLUMN_ALIASES = {
+    'email': ('email', 'Email', 'email_address'),
+    'firstName': ('firstName', 'first_name', 'First Name'),
+    'lastName': ('lastName', 'last_name', 'Last Name'),
+    'name': ('name', 'Name', 'full_name'),
+    'phone': ('phone', 'Phone', 'phone_number'),
+    'password': ('password',),
+    'password_hash': ('password_hash', 'passwordHash', 'hashed_password'),
+}
+
+def read_customer_rows(path, file_format=None):
+    """
+    Stream customer rows from a CSV, JSON array or NDJSON file
+    
+    Args:
+        path: file to read
+        file_format: 'csv', 'json' or 'ndjson'; guessed from the extension if omitted
+    
+    Yields:
+        tuple: (row number, dict)
+    """
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        file_format = {'.json': 'json', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}.get(extension, 'csv')
+    
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        if file_format == 'csv':
+            # Row 1 is the header
+            yield from enumerate(csv.DictReader(handle), start=2)
+        elif file_format == 'json':
+            yield from enumerate(json.load(handle), start=1)
+        else:
+            for number, line in enumerate(handle, start=1):
+                if line.strip():
+                    yield number, json.loads(line)
+
+def _column(row, field):
+    for name in COLUMN_ALIASES[field]:
+        value = row.get(name)
+        if value not in (None, ''):
+            return str(value).strip()
+    return ''
+
+def normalize_password_hash(value):
+    """
+    Return a password hash in Django's encoding, ready for ``User.password``
+    
+    Raises:
+        ValueError: the hash is in a format no configured hasher can verify
+    """
+    if value.startswith(('$2a$', '$2b$', '$2y$')):
+        value = f'bcrypt${value}'
+    try:
+        identify_hasher(value)
+    except ValueError:
+        raise ValueError('Unsupported password hash format')
+    return value
+
+class CustomerImportResult:
+    """Counters and per-row errors collected during an import"""
+    
+    def __init__(self):
+        self.created = 0
+        self.existing = 0
+        self.duplicates = 0
+        self.errors = []
+    
+    def __str__(self):
+        return (
+            f'{self.created} created, {self.existing} already registered, '
+            f'{self.duplicates} duplicated in the file, {len(self.errors)} invalid'
+        )
+
+class CustomerImporter:
+    """
+    Import customer rows in chunks
+    
+    Args:
+        chunk_size: users per bulk insert and existing-email query
+        verified: mark imported users as verified (their address was confirmed on the old platform)
+        send_verification: queue an OTP email for every imported unverified user
+        hash_workers: threads hashing plain-text passwords
+        dry_run: validate and count without writing anything
+        website: record imported (and already registered) customers as customers of this Website
+    """
+    
+    def __init__(self, chunk_size=1000, verified=False, send_verification=False, hash_workers=None, dry_run=False,
+                 website=None):
+        self.chunk_size = chunk_size
+        self.website = website
+        self.verified = verified
+        self.send_verification = send_verification and not verified
+        self.hash_workers = hash_workers or getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 2
+        self.dry_run = dry_run
+        self.result = CustomerImportResult()
+        self.seen_emails = set()
+    
+    def _parse(self, number, row):
+        """Build an unsaved User from a row, or record why it is invalid"""
+        email = User.objects.normalize_email(_column(row, 'email'))
+        try:
+            validate_email(email)
+        except ValidationError:
+            self.result.errors.append((number, f'Invalid email {email!r}'))
+            return None, None
+        
+        if email.lower() in self.seen_emails:
+            self.result.duplicates += 1
+            return None, None
+        self.seen_emails.add(email.lower())
+        
+        first_name, last_name = _column(row, 'firstName'), _column(row, 'lastName')
+        if not first_name and not last_name:
+            name_parts = _column(row, 'name').split(' ', 1)
+            first_name = name_parts[0]
+            last_name = name_parts[1] if len(name_parts) > 1 else ''
+        
+        user = User(
+            username=email,
+            email=email,
+            firstName=first_name[:100],
+            lastName=last_name[:100],
+            phone=_column(row, 'phone')[:20],
+            isVerified=self.verified,
+        )
+        
+        password_hash = _column(row, 'password_hash')
+        if password_hash:
+            try:
+                user.password = normalize_password_hash(password_hash)
+            except ValueError as e:
+                self.result.errors.append((number, str(e)))
+                return None, None
+            return user, None
+        
+        return user, _column(row, 'password') or None
+    
+    def _import_chunk(self, rows, executor):
+        users, plain_passwords = [], []
+        for number, row in rows:
+            user, password = self._parse(number, row)
+            if user is not None:
+                users.append(user)
+                plain_passwords.append(password)
+        if not users:
+            return
+        
+        # One query finds every row that already has an account, whatever the
+        # case of the stored address (email__in is case-sensitive on SQLite)
+        emails = {user.email.lower() for user in users}
+        registered = {}
+        for user_id, email, username in User.objects.alias(
+            email_lower=Lower('email'), username_lower=Lower('username'),
+        ).filter(
+            Q(email_lower__in=emails) | Q(username_lower__in=emails)
+        ).values_list('id', 'email', 'username'):
+            registered[email.lower()] = registered[username.lower()] = user_id
+        
+        new = [
+            (user, password) for user, password in zip(users, plain_passwords)
+            if user.email.lower() not in registered
+        ]
+        existing_ids = [registered[user.email.lower()] for user in users if user.email.lower() in registered]
+        self.result.existing += len(existing_ids)
+        if self.dry_run:
+            self.result.created += len(new)
+            return
+        
+        # make_password(None) is cheap and gives an unusable password
+        to_hash = [(user, password) for user, password in new if not user.password]
+        for (user, _), encoded in zip(to_hash, executor.map(make_password, [password for _, password in to_hash])):
+            user.password = encoded
+        
+        with transaction.atomic():
+            created = User.objects.bulk_create([user for user, _ in new])
+            if created and any(user.pk is None for user in created):
+                # Backends that cannot return ids from bulk inserts
+                created = list(User.objects.filter(email__in=[user.email for user in created]))
+            
+            if self.website is not None:
+                self._add_memberships([user.pk for user in created] + existing_ids)
+            
+            if self.send_verification:
+                otp_expires_in = describe_otp_lifetime()
+                queue_template_emails('otp_verification', (
+                    (user.email, {
+                        'user_name': f'{user.firstName} {user.lastName}',
+                        'user_email': user.email,
+                        'otp_code': generate_otp(user),
+                        'otp_expires_in': otp_expires_in,
+                    })
+                    for user in created
+                ))
+        self.result.created += len(created)
+    
+    def _add_memberships(self, user_ids):
+        """Link users to the website, bumping its customerCount once for the whole chunk"""
+        members = set(
+            WebsiteCustomer.objects.filter(website=self.website, user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        memberships = WebsiteCustomer.objects.bulk_create([
+            WebsiteCustomer(website=self.website, user_id=user_id)
+            for user_id in user_ids if user_id not in members
+        ])
+        if memberships:
+            Website.objects.filter(pk=self.website.pk).update(customerCount=F('customerCount') + len(memberships))
+    
+    def run(self, rows):
+        """
+        Import an iterable of (row number, dict) pairs
+        
+        Returns:
+            CustomerImportResult
+        """
+        rows = iter(rows)
+        with ThreadPoolExecutor(max_workers=self.hash_workers) as executor:
+            while True:
+                chunk = list(islice(rows, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(chunk, executor)
+        return self.result
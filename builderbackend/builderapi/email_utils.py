@@ -1,47 +1,121 @@
 """
 Email utilities for sending beautiful, professional emails
+
+Messages are not sent from the request. They are written to the OutboxEmail
+table and delivered by the ``send_queued_emails`` management command, which
+drains the outbox in batches over one reused SMTP connection. Registered
+templates are compiled once per process into static fragments, so rendering
+a queued message only fills in its few dynamic slots.
 """
 
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template.loader import render_to_string
 from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import F
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from html import escape as escape_html
+from datetime import timedelta
 import logging
+import queue
+import re
+import time
+
+from .models import OutboxEmail, Broadcast, WebsiteCustomer
+from .otp_utils import describe_otp_lifetime
 
 logger = logging.getLogger(__name__)
 
-def send_otp_email(user, otp_code):
+# Stand-ins for slot values while rendering static fragments; untouched by HTML escaping
+SLOT_MARKER = '\x00{}\x00'
+SLOT_MARKER_PATTERN = re.compile(r'\x00(\w+)\x00')
+
+class EmailTemplate:
     """
-    Send a beautiful, professional OTP verification email
+    An email split into pre-rendered static fragments and dynamic slots
     
-    Args:
-        user: User instance
-        otp_code: 6-digit OTP code
+    The subject and text body are ``str.format`` strings and the HTML body is
+    a Django template. On first use each part is rendered once with marker
+    values in place of the slots and cut at the markers; rendering a message
+    afterwards only joins the cached fragments with the slot values (HTML
+    escaped for the HTML part). Slots may only be substituted, not used in
+    template tags or filters.
     
-    Returns:
-        bool: True if email sent successfully, False otherwise
+    Args:
+        slots: names of the values that vary per message
+        subject: subject format string
+        text: plain text body format string
+        html_template: optional Django template name for the HTML body
     """
-    try:
-        # Email subject
-        subject = f"🔐 Verify Your Corporate Portal Account - Code: {otp_code}"
-        
-        # Render HTML template
-        html_content = render_to_string('emails/otp_verification.html', {
-            'user_name': f"{user.firstName} {user.lastName}",
-            'user_email': user.email,
-            'otp_code': otp_code,
-        })
+    
+    def __init__(self, slots, subject, text, html_template=None):
+        self.slots = tuple(slots)
+        self.subject = subject
+        self.text = text.strip()
+        self.html_template = html_template
+        self._fragments = None
+    
+    @staticmethod
+    def _split(rendered):
+        # Alternating static text and slot names: [static, slot, static, ...]
+        return tuple(SLOT_MARKER_PATTERN.split(rendered))
+    
+    def compile(self):
+        """Render the static fragments once; later calls reuse them"""
+        if self._fragments is None:
+            markers = {slot: SLOT_MARKER.format(slot) for slot in self.slots}
+            self._fragments = (
+                self._split(self.subject.format(**markers)),
+                self._split(self.text.format(**markers)),
+                self._split(render_to_string(self.html_template, markers)) if self.html_template else None,
+            )
+        return self._fragments
+    
+    @staticmethod
+    def _join(fragments, context, escape_values=False):
+        parts = list(fragments)
+        for index in range(1, len(parts), 2):
+            value = str(context[parts[index]])
+            # Same output as Django's autoescape, without its SafeString overhead
+            parts[index] = escape_html(value) if escape_values else value
+        return ''.join(parts)
+    
+    def render(self, context):
+        """
+        Render one message
         
-        # Create plain text version
-        text_content = f"""
+        Returns:
+            tuple: (subject, text body, HTML body or '')
+        """
+        subject, text, html = self.compile()
+        return (
+            self._join(subject, context),
+            self._join(text, context),
+            self._join(html, context, escape_values=True) if html else '',
+        )
+    
+    def render_many(self, contexts):
+        """Render a message for each context, sharing the compiled fragments"""
+        self.compile()
+        return [self.render(context) for context in contexts]
+
+EMAIL_TEMPLATES = {
+    'otp_verification': EmailTemplate(
+        slots=['user_name', 'user_email', 'otp_code', 'otp_expires_in'],
+        subject="🔐 Verify Your Corporate Portal Account - Code: {otp_code}",
+        html_template='emails/otp_verification.html',
+        text="""
 Corporate Portal - Email Verification
 
-Hello {user.firstName} {user.lastName},
+Hello {user_name},
 
 Welcome to Corporate Portal! To complete your account registration, please verify your email address using the verification code below:
 
 VERIFICATION CODE: {otp_code}
 
-This code expires in 10 minutes.
+This code expires in {otp_expires_in}.
 
 How to verify your account:
 1. Return to the Corporate Portal registration page
@@ -49,7 +123,7 @@ How to verify your account:
 3. Click "Verify Email" to complete your registration
 4. Start building your professional websites!
 
-Security Notice: This verification code is valid for 10 minutes only. If you didn't request this verification, please ignore this email.
+Security Notice: This verification code is valid for {otp_expires_in} only. If you didn't request this verification, please ignore this email.
 
 Thank you for choosing Corporate Portal!
 
@@ -57,45 +131,13 @@ Thank you for choosing Corporate Portal!
 Corporate Portal
 Professional Website Builder & E-commerce Platform
 © 2025 Corporate Portal. All rights reserved.
-        """.strip()
-        
-        # Create email message
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[user.email],
-        )
-        
-        # Attach HTML version
-        email.attach_alternative(html_content, "text/html")
-        
-        # Send email
-        email.send()
-        
-        logger.info(f"OTP email sent successfully to {user.email}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Failed to send OTP email to {user.email}: {str(e)}")
-        return False
-
-def send_welcome_email(user):
-    """
-    Send a welcome email after successful verification
-    
-    Args:
-        user: User instance
-    
-    Returns:
-        bool: True if email sent successfully, False otherwise
-    """
-    try:
-        subject = "🎉 Welcome to Corporate Portal - Your Account is Ready!"
-        
-        # Create welcome message
-        text_content = f"""
-Welcome to Corporate Portal, {user.firstName}!
+        """,
+    ),
+    'welcome': EmailTemplate(
+        slots=['first_name'],
+        subject="🎉 Welcome to Corporate Portal - Your Account is Ready!",
+        text="""
+Welcome to Corporate Portal, {first_name}!
 
 Your account has been successfully verified and is now ready to use.
 
@@ -115,22 +157,369 @@ Welcome aboard!
 ---
 Corporate Portal Team
 Professional Website Builder & E-commerce Platform
-        """.strip()
+        """,
+    ),
+}
+
+def render_email(template_name, context):
+    """Render one registered email template; returns (subject, text, html)"""
+    return EMAIL_TEMPLATES[template_name].render(context)
+
+def render_emails(template_name, contexts):
+    """Render a registered email template for many recipients at once"""
+    return EMAIL_TEMPLATES[template_name].render_many(contexts)
+
+def queue_email(to_email, subject, text_body, html_body=''):
+    """
+    Add a pre-rendered message to the outbox
+    
+    The row is written in the caller's transaction, so a message is only
+    delivered if the request that queued it commits.
+    
+    Returns:
+        OutboxEmail: the queued message
+    """
+    return OutboxEmail.objects.create(
+        to_email=to_email,
+        subject=subject,
+        text_body=text_body,
+        html_body=html_body,
+    )
+
+def queue_template_email(template_name, to_email, context):
+    """
+    Add a templated message to the outbox
+    
+    Only the template name and slot values are stored; the worker renders
+    the message from the compiled template when it is sent.
+    
+    Returns:
+        OutboxEmail: the queued message
+    """
+    return OutboxEmail.objects.create(to_email=to_email, template=template_name, context=context)
+
+def queue_template_emails(template_name, recipients, batch_size=500):
+    """
+    Queue a templated message for many recipients with bulk inserts
+    
+    Args:
+        template_name: key of EMAIL_TEMPLATES
+        recipients: iterable of (email, context) pairs
+    """
+    return OutboxEmail.objects.bulk_create(
+        (OutboxEmail(to_email=email, template=template_name, context=context) for email, context in recipients),
+        batch_size=batch_size,
+    )
+
+def send_otp_email(user, otp_code):
+    """
+    Queue a beautiful, professional OTP verification email
+    
+    Args:
+        user: User instance
+        otp_code: 6-digit OTP code
+    
+    Returns:
+        bool: True if email queued successfully, False otherwise
+    """
+    try:
+        queue_template_email('otp_verification', user.email, {
+            'user_name': f"{user.firstName} {user.lastName}",
+            'user_email': user.email,
+            'otp_code': otp_code,
+            'otp_expires_in': describe_otp_lifetime(),
+        })
         
-        # Create email message
-        email = EmailMultiAlternatives(
-            subject=subject,
-            body=text_content,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[user.email],
-        )
+        logger.info(f"OTP email queued for {user.email}")
+        return True
         
-        # Send email
-        email.send()
+    except Exception as e:
+        logger.error(f"Failed to queue OTP email to {user.email}: {str(e)}")
+        return False
+
+def send_welcome_email(user):
+    """
+    Queue a welcome email after successful verification
+    
+    Args:
+        user: User instance
+    
+    Returns:
+        bool: True if email queued successfully, False otherwise
+    """
+    try:
+        queue_template_email('welcome', user.email, {'first_name': user.firstName})
         
-        logger.info(f"Welcome email sent successfully to {user.email}")
+        logger.info(f"Welcome email queued for {user.email}")
         return True
         
     except Exception as e:
-        logger.error(f"Failed to send welcome email to {user.email}: {str(e)}")
-        return False
\ No newline at end of file
+        logger.error(f"Failed to queue welcome email to {user.email}: {str(e)}")
+        return False
+
+class DomainRateLimiter:
+    """
+    Sliding one-minute send limits per recipient domain
+    
+    Limits come from ``EMAIL_OUTBOX_RATE_LIMITS``, a mapping of domain to
+    messages per minute where ``'*'`` applies to every other domain.
+    """
+    
+    def __init__(self, limits=None):
+        self.limits = limits if limits is not None else getattr(settings, 'EMAIL_OUTBOX_RATE_LIMITS', {})
+        self.sent = defaultdict(deque)
+    
+    def allow(self, email_address):
+        domain = email_address.rsplit('@', 1)[-1].lower()
+        limit = self.limits.get(domain, self.limits.get('*'))
+        if not limit:
+            return True
+        
+        window = self.sent[domain]
+        now = time.monotonic()
+        while window and now - window[0] >= 60:
+            window.popleft()
+        if len(window) >= limit:
+            return False
+        window.append(now)
+        return True
+
+def build_outbox_message(outbox_email, connection=None):
+    """Build the EmailMultiAlternatives for a queued OutboxEmail"""
+    if outbox_email.template:
+        subject, text_body, html_body = render_email(outbox_email.template, outbox_email.context)
+    else:
+        subject, text_body, html_body = outbox_email.subject, outbox_email.text_body, outbox_email.html_body
+    
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=text_body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[outbox_email.to_email],
+        connection=connection,
+    )
+    if html_body:
+        email.attach_alternative(html_body, "text/html")
+    return email
+
+def claim_outbox_batch(batch_size, lease_seconds=300):
+    """
+    Claim up to ``batch_size`` due messages for this worker
+    
+    Claimed rows move to 'sending' with ``next_attempt_at`` set to a lease
+    expiry, so rows left behind by a crashed worker become due again.
+    
+    Workers never claim the same row: rows another worker has locked are
+    skipped where the database supports it, and the UPDATE only takes rows
+    that are still due, so a row claimed since the SELECT is left alone.
+    """
+    now = timezone.now()
+    lease_until = now + timedelta(seconds=lease_seconds)
+    due = OutboxEmail.objects.filter(status__in=['pending', 'sending'], next_attempt_at__lte=now)
+    with transaction.atomic():
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        due.filter(id__in=ids).update(status='sending', next_attempt_at=lease_until)
+    # Rows now leased until exactly our expiry are the ones this UPDATE took
+    return list(OutboxEmail.objects.filter(id__in=ids, status='sending', next_attempt_at=lease_until).order_by('id'))
+
+def deliver_queued_emails(batch_size=None, rate_limiter=None):
+    """
+    Deliver one batch from the outbox over a single SMTP connection
+    
+    Failed messages are retried with exponential backoff up to
+    ``EMAIL_OUTBOX_MAX_ATTEMPTS`` and then marked failed. Messages over a
+    domain's rate limit are put back without counting an attempt.
+    
+    Returns:
+        dict: counts of 'sent', 'retried', 'failed' and 'deferred' messages
+    """
+    batch_size = batch_size or getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    retry_delay = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    rate_limiter = rate_limiter or DomainRateLimiter()
+    
+    counts = {'sent': 0, 'retried': 0, 'failed': 0, 'deferred': 0}
+    batch = claim_outbox_batch(batch_size)
+    if not batch:
+        return counts
+    
+    sent_ids = []
+    deferred_ids = []
+    connection = get_connection()
+    try:
+        connection.open()
+        for outbox_email in batch:
+            if not rate_limiter.allow(outbox_email.to_email):
+                deferred_ids.append(outbox_email.id)
+                continue
+            
+            try:
+                connection.send_messages([build_outbox_message(outbox_email, connection)])
+                sent_ids.append(outbox_email.id)
+            except Exception as e:
+                outbox_email.attempts += 1
+                outbox_email.last_error = str(e)
+                if outbox_email.attempts >= max_attempts:
+                    outbox_email.status = 'failed'
+                    counts['failed'] += 1
+                else:
+                    outbox_email.status = 'pending'
+                    backoff = retry_delay * 2 ** (outbox_email.attempts - 1)
+                    outbox_email.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+                    counts['retried'] += 1
+                outbox_email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+                logger.error(f"Failed to send queued email {outbox_email.id} to {outbox_email.to_email}: {str(e)}")
+                
+                # The connection may be unusable after an SMTP error
+                connection.close()
+                connection.open()
+    except Exception as e:
+        # Could not (re)connect; release the rest of the batch for a later run
+        logger.error(f"Email outbox connection failed: {str(e)}")
+        handled = set(sent_ids) | set(deferred_ids)
+        deferred_ids += [
+            outbox_email.id for outbox_email in batch
+            if outbox_email.id not in handled and outbox_email.status == 'sending'
+        ]
+    finally:
+        connection.close()
+    
+    if sent_ids:
+        OutboxEmail.objects.filter(id__in=sent_ids).update(status='sent', sent_at=timezone.now(), last_error='')
+    if deferred_ids:
+        OutboxEmail.objects.filter(id__in=deferred_ids).update(
+            status='pending', next_attempt_at=timezone.now() + timedelta(seconds=60)
+        )
+    
+    counts['sent'] = len(sent_ids)
+    counts['deferred'] = len(deferred_ids)
+    return counts
+
+def broadcast_recipients_queryset(website):
+    """
+    Emails of a website's customers (its WebsiteCustomer members), in email order
+    
+    Read from the indexed membership table, not by scanning the website's
+    orders; user emails are unique, so no DISTINCT is needed.
+    """
+    return (
+        WebsiteCustomer.objects.filter(website=website)
+        .values_list('user__email', flat=True)
+        .order_by('user__email')
+    )
+
+def iter_broadcast_chunks(broadcast, chunk_size):
+    """
+    Stream a broadcast's recipients in chunks, starting after its cursor
+    
+    Uses keyset pagination on the email so each chunk is one index range
+    scan and the full recipient list is never held in memory.
+    """
+    cursor = broadcast.cursor
+    while True:
+        chunk = list(broadcast_recipients_queryset(broadcast.website).filter(user__email__gt=cursor)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        cursor = chunk[-1]
+
+class SMTPConnectionPool:
+    """
+    A small fixed set of open email connections shared by sender threads
+    
+    Args:
+        size: number of connections to open
+        **connection_kwargs: passed to ``get_connection``, e.g. ``host`` and
+            ``port`` to point at a local SMTP stand-in
+    """
+    
+    def __init__(self, size, **connection_kwargs):
+        self.connections = [get_connection(fail_silently=True, **connection_kwargs) for _ in range(size)]
+        self.available = queue.Queue()
+        for connection in self.connections:
+            connection.open()
+            self.available.put(connection)
+    
+    def send_messages(self, messages):
+        """Send messages over a pooled connection and return how many were accepted"""
+        connection = self.available.get()
+        try:
+            sent = connection.send_messages(messages) or 0
+            if sent < len(messages):
+                # Reconnect in case the failures came from a dropped connection
+                connection.close()
+                connection.open()
+            return sent
+        finally:
+            self.available.put(connection)
+    
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+
+def send_broadcast(broadcast, chunk_size=None, pool_size=None, **connection_kwargs):
+    """
+    Send a broadcast to its website's customers
+    
+    Recipients are streamed in chunks; each chunk is sent as one
+    ``send_messages`` call on a pooled connection, with up to ``pool_size``
+    chunks in flight. Progress and the resume cursor are saved after every
+    round, and sending stops early if the broadcast is cancelled.
+    
+    Returns:
+        Broadcast: the refreshed broadcast
+    """
+    chunk_size = chunk_size or getattr(settings, 'EMAIL_BROADCAST_CHUNK_SIZE', 100)
+    pool_size = pool_size or getattr(settings, 'EMAIL_BROADCAST_CONNECTIONS', 3)
+    
+    Broadcast.objects.filter(id=broadcast.id).update(
+        status='sending',
+        startedAt=broadcast.startedAt or timezone.now(),
+        total_recipients=broadcast_recipients_queryset(broadcast.website).count(),
+    )
+    
+    pool = SMTPConnectionPool(pool_size, **connection_kwargs)
+    chunks = iter_broadcast_chunks(broadcast, chunk_size)
+    try:
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            while True:
+                round_chunks = [chunk for _, chunk in zip(range(pool_size), chunks)]
+                if not round_chunks:
+                    break
+                
+                batches = [
+                    [
+                        EmailMultiAlternatives(
+                            subject=broadcast.subject,
+                            body=broadcast.text_body,
+                            from_email=settings.DEFAULT_FROM_EMAIL,
+                            to=[email],
+                            alternatives=[(broadcast.html_body, "text/html")] if broadcast.html_body else None,
+                        )
+                        for email in chunk
+                    ]
+                    for chunk in round_chunks
+                ]
+                sent = sum(executor.map(pool.send_messages, batches))
+                attempted = sum(len(chunk) for chunk in round_chunks)
+                
+                Broadcast.objects.filter(id=broadcast.id).update(
+                    sent_count=F('sent_count') + sent,
+                    failed_count=F('failed_count') + attempted - sent,
+                    cursor=round_chunks[-1][-1],
+                )
+                
+                if Broadcast.objects.filter(id=broadcast.id, status='cancelled').exists():
+                    logger.info(f"Broadcast {broadcast.id} cancelled")
+                    break
+    finally:
+        pool.close()
+    
+    Broadcast.objects.filter(id=broadcast.id, status='sending').update(status='sent', completedAt=timezone.now())
+    broadcast.refresh_from_db()
+    logger.info(f"Broadcast {broadcast.id} finished: {broadcast.sent_count} sent, {broadcast.failed_count} failed")
+    return broadcast
@@ -0,0 +1,111 @@
+"""
+Model fields stored compressed
+
+Large JSON documents and long texts dominate the database file and the page
+cache. CompressedJSONField and CompressedTextField behave like JSONField and
+TextField in Python and in DRF serializers, but are stored in a binary column:
+values longer than COMPRESSED_FIELD_THRESHOLD bytes are compressed with
+COMPRESSED_FIELD_CODEC ('zlib', or 'zstd' when the zstandard package is
+installed), smaller ones are stored as they are. Each stored value starts
+with a one-byte tag naming its encoding, so the codec and threshold can be
+changed at any time; ``recompress_fields`` rewrites existing rows.
+
+The database cannot look inside compressed values: JSON key lookups and
+``contains``/``icontains`` filters do not work on these fields.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+import json
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# First byte of every stored value
+RAW = b'r'
+ZLIB = b'z'
+ZSTD = b's'
+
+def get_threshold():
+    return getattr(settings, 'COMPRESSED_FIELD_THRESHOLD', 1024)
+
+def get_codec():
+    codec = getattr(settings, 'COMPRESSED_FIELD_CODEC', 'zlib')
+    if codec == 'zstd' and zstandard is None:
+        raise ImproperlyConfigured('COMPRESSED_FIELD_CODEC = "zstd" needs the zstandard package')
+    return codec
+
+def compress(data):
+    """Encode UTF-8 bytes for storage, compressing them when large enough to pay off"""
+    if len(data) >= get_threshold():
+        if get_codec() == 'zstd':
+            packed = ZSTD + zstandard.ZstdCompressor(level=3).compress(data)
+        else:
+            packed = ZLIB + zlib.compress(data, 6)
+        if len(packed) < len(data):
+            return packed
+    return RAW + data
+
+def decompress(value):
+    """
+    Decode a stored value back to text
+    
+    Values written before the column was converted (plain text) pass through.
+    """
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    tag, payload = value[:1], value[1:]
+    if tag == ZLIB:
+        payload = zlib.decompress(payload)
+    elif tag == ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured('Reading zstd-compressed values needs the zstandard package')
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    elif tag != RAW:
+        raise ValueError(f'Unknown compressed value tag {tag!r}')
+    return payload.decode('utf-8')
+
+class CompressedFieldMixin:
+    """Binary column holding compress()-encoded text"""
+    
+    def db_type(self, connection):
+        return connection.data_types['BinaryField']
+    
+    def db_check(self, connection):
+        # JSONField's JSON_VALID check does not apply to the encoded bytes
+        return None
+    
+    def cast_db_type(self, connection):
+        return self.db_type(connection)
+
+class CompressedJSONField(CompressedFieldMixin, models.JSONField):
+    """JSONField stored compressed; see the module docstring for what does not work"""
+    
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is None:
+            return None
+        return compress(json.dumps(value, cls=self.encoder, ensure_ascii=False).encode('utf-8'))
+    
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return json.loads(decompress(value), cls=self.decoder)
+
+class CompressedTextField(CompressedFieldMixin, models.TextField):
+    """TextField stored compressed; see the module docstring for what does not work"""
+    
+    def get_db_prep_value(self, value, connection, prepared=False):
+        value = super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        return compress(value.encode('utf-8'))
+    
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decompress(value)
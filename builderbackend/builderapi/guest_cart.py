@@ -0,0 +1,183 @@
+"""
+Server-side carts for anonymous shoppers
+
+Guest carts live only in the cache backend, keyed by a signed cart token the
+client sends back in the ``X-Cart-Token`` header. Anonymous browsing therefore
+never writes Cart rows; the cart is folded into the customer's Cart with one
+bulk upsert when they log in.
+
+A token expires GUEST_CART_TTL after it was signed, like the cached cart
+after its last write, so every write hands out a freshly signed token.
+Carts live in the shared cache, so every worker sees the same cart, and writes
+hold a per-cart lock so concurrent updates are not lost. Product names and
+prices in the lines come from the client and are only for display; orders are
+priced from Product.
+"""
+
+from django.conf import settings
+from django.core import signing
+import uuid
+
+from .models import Cart, Product, CART_ITEM_FIELDS
+from .shared_cache import shared_cache as cache, shared_cache_lock
+
+TOKEN_SALT = 'builderapi.guest_cart'
+CART_TOKEN_HEADER = 'X-Cart-Token'
+MAX_GUEST_CART_LINES = 200
+
+def get_guest_cart_ttl():
+    """Seconds an idle guest cart is kept in the cache"""
+    return getattr(settings, 'GUEST_CART_TTL', 60 * 60 * 24 * 7)
+
+def issue_cart_token(cart_id=None):
+    """Sign a token for a cart, a new one unless ``cart_id`` is given"""
+    return signing.dumps(cart_id or uuid.uuid4().hex, salt=TOKEN_SALT)
+
+def read_cart_token(token):
+    """
+    Return the cart id inside a signed token, or None if it is missing or forged
+    """
+    if not token:
+        return None
+    try:
+        return signing.loads(token, salt=TOKEN_SALT, max_age=get_guest_cart_ttl())
+    except signing.BadSignature:
+        return None
+
+def get_request_cart_token(request):
+    """Cart token sent by the client in the header or request body"""
+    return request.headers.get(CART_TOKEN_HEADER) or request.data.get('cart_token')
+
+def _cache_key(cart_id):
+    return f'guest_cart:{cart_id}'
+
+def get_guest_cart(token):
+    """
+    Return the lines of a guest cart
+    
+    Returns:
+        list: line dicts with ``product_id``, ``websiteSlug``, ``quantity``
+        and the product snapshot fields; empty for unknown tokens
+    """
+    cart_id = read_cart_token(token)
+    if not cart_id:
+        return []
+    return list(cache.get(_cache_key(cart_id), {}).values())
+
+def apply_guest_operations(token, operations):
+    """
+    Apply set/add/remove operations to a guest cart
+    
+    Uses the same operation format as ``Cart.objects.apply_operations``.
+    
+    Returns:
+        tuple: (token, lines) - the token is re-signed, so it stays valid as
+        long as the cart; a new cart is started if the given one is missing
+        or invalid
+    """
+    cart_id = read_cart_token(token) or uuid.uuid4().hex
+    token = issue_cart_token(cart_id)
+    
+    key = _cache_key(cart_id)
+    with shared_cache_lock(key):
+        lines = cache.get(key, {})
+        _apply_operations(lines, operations)
+        cache.set(key, lines, get_guest_cart_ttl())
+    return token, list(lines.values())
+
+def _apply_operations(lines, operations):
+    for operation in operations:
+        line_key = f"{operation['product_id']}:{operation['websiteSlug']}"
+        quantity = operation.get('quantity', 1)
+        if operation['op'] == 'add' and line_key in lines:
+            quantity += lines[line_key]['quantity']
+        
+        if operation['op'] == 'remove' or quantity <= 0:
+            lines.pop(line_key, None)
+        elif line_key in lines or len(lines) < MAX_GUEST_CART_LINES:
+            line = {field: operation[field] for field in CART_ITEM_FIELDS if field in operation}
+            line.update(product_id=operation['product_id'], websiteSlug=operation['websiteSlug'], quantity=quantity)
+            lines[line_key] = line
+
+def clear_guest_cart(token, website_slug=None):
+    """Remove all lines, or only the lines of one website, from a guest cart"""
+    cart_id = read_cart_token(token)
+    if not cart_id:
+        return
+    
+    key = _cache_key(cart_id)
+    if website_slug is None:
+        cache.delete(key)
+        return
+    
+    with shared_cache_lock(key):
+        lines = cache.get(key, {})
+        remaining = {line_key: line for line_key, line in lines.items() if line['websiteSlug'] != website_slug}
+        cache.set(key, remaining, get_guest_cart_ttl())
+
+def merge_guest_cart(user, token):
+    """
+    Fold a guest cart into the user's Cart and drop it from the cache
+    
+    Quantities are added to any lines the user already has. The merge costs
+    one SELECT and one bulk upsert regardless of cart size.
+    
+    Returns:
+        int: number of merged lines
+    """
+    lines = get_guest_cart(token)
+    if lines:
+        Cart.objects.apply_operations(user, [{'op': 'add', **line} for line in lines])
+        clear_guest_cart(token)
+    return len(lines)
+
+def price_order_items(lines, website_slug):
+    """
+    Order items for cart lines, priced from the website's active products
+    
+    Name, price and SKU come from the current Product, loaded with one query;
+    only the product id and quantity are taken from the lines.
+    
+    Args:
+        lines: dicts with ``product_id`` and ``quantity``
+        website_slug: website the order is placed on
+    
+    Returns:
+        tuple: (items in the shape ``create_order`` stores, product ids of
+        lines whose product is gone, not active or from another website)
+    """
+    product_ids = {int(line['product_id']) for line in lines if str(line['product_id']).isdigit()}
+    products = {
+        str(product.pk): product
+        for product in Product.objects.filter(id__in=product_ids, website__slug=website_slug, status='active')
+        .only('id', 'name', 'price', 'sku', 'images')
+    }
+    items, missing = [], []
+    for line in lines:
+        product = products.get(str(line['product_id']))
+        if product is None:
+            missing.append(line['product_id'])
+            continue
+        items.append({
+            'product_id': line['product_id'],
+            'name': product.name,
+            'price': float(product.price),
+            'quantity': line['quantity'],
+            'image': product.images[0] if product.images else line.get('product_image', ''),
+            'sku': product.sku,
+        })
+    return items, missing
+
+def guest_cart_order_items(token, website_slug):
+    """
+    Guest cart lines for one website, priced by ``price_order_items``
+    
+    Lines of products that are gone or not active are left out.
+    
+    Returns:
+        list or None: None when the guest cart has no lines for the website
+    """
+    lines = [line for line in get_guest_cart(token) if line['websiteSlug'] == website_slug]
+    if not lines:
+        return None
+    return price_order_items(lines, website_slug)[0]
@@ -0,0 +1,276 @@
+"""
+Partial updates of JSON document fields
+
+The builder edits large JSON fields such as ``contentBlocks`` a keystroke at
+a time. Instead of uploading the whole document, clients may PATCH a website
+with an RFC 6902 JSON Patch (``Content-Type: application/json-patch+json``)
+whose paths start with the field name::
+
+    [{"op": "replace", "path": "/contentBlocks/3/text", "value": "Hello"}]
+
+or with an RFC 7396 merge patch (``Content-Type: application/merge-patch+json``)
+keyed by field name::
+
+    {"theme": {"primaryColor": "#000", "font": null}}
+
+Patches are applied to copies, so a failing operation leaves nothing half
+applied.
+"""
+
+from rest_framework.parsers import JSONParser
+import copy
+
+JSON_PATCH_MEDIA_TYPE = 'application/json-patch+json'
+MERGE_PATCH_MEDIA_TYPE = 'application/merge-patch+json'
+
+class JSONPatchError(ValueError):
+    """Raised for malformed patches and operations that cannot be applied"""
+
+class JSONPatchParser(JSONParser):
+    media_type = JSON_PATCH_MEDIA_TYPE
+
+class MergePatchParser(JSONParser):
+    media_type = MERGE_PATCH_MEDIA_TYPE
+
+def split_pointer(pointer):
+    """
+    Split an RFC 6901 JSON pointer into unescaped reference tokens
+    
+    Raises:
+        JSONPatchError: the pointer is not a string starting with ``/``
+    """
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise JSONPatchError(f'Invalid JSON pointer {pointer!r}')
+    if not pointer:
+        return []
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+def join_pointer(tokens):
+    """Inverse of split_pointer"""
+    return ''.join('/' + token.replace('~', '~0').replace('/', '~1') for token in tokens)
+
+def _same(a, b):
+    """JSON equality: unlike ==, 1 and true (also nested) are different values"""
+    if type(a) is not type(b) or a != b:
+        return False
+    if isinstance(a, dict):
+        return all(_same(value, b[key]) for key, value in a.items())
+    if isinstance(a, list):
+        return all(map(_same, a, b))
+    return True
+
+def _index(container, token, allow_end=False):
+    """List index for ``token``; ``-`` (and len) address the end when adding"""
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise JSONPatchError(f'Invalid array index {token!r}')
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise JSONPatchError(f'Array index {index} out of range')
+    return index
+
+def _resolve(document, tokens):
+    """Follow all tokens and return the value they point at"""
+    for token in tokens:
+        if isinstance(document, dict):
+            if token not in document:
+                raise JSONPatchError(f'Path member {token!r} does not exist')
+            document = document[token]
+        elif isinstance(document, list):
+            document = document[_index(document, token)]
+        else:
+            raise JSONPatchError(f'Cannot descend into a scalar at {token!r}')
+    return document
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise JSONPatchError('Cannot add a member to a scalar')
+    return document
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JSONPatchError('Cannot remove the whole document')
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise JSONPatchError(f'Path member {tokens[-1]!r} does not exist')
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_index(parent, tokens[-1]))
+    raise JSONPatchError('Cannot remove a member of a scalar')
+
+def apply_json_patch(document, operations):
+    """
+    Apply RFC 6902 operations to a copy of ``document``
+    
+    Returns:
+        The patched document
+    
+    Raises:
+        JSONPatchError: an operation is malformed, points nowhere or a ``test`` fails
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError('A JSON Patch must be an array of operations')
+    
+    document = copy.deepcopy(document)
+    for number, operation in enumerate(operations):
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JSONPatchError(f'Operation {number} needs "op" and "path"')
+        op = operation['op']
+        tokens = split_pointer(operation['path'])
+        
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JSONPatchError(f'Operation {number} ({op}) needs a "value"')
+        if op in ('move', 'copy'):
+            if 'from' not in operation:
+                raise JSONPatchError(f'Operation {number} ({op}) needs a "from"')
+            source = split_pointer(operation['from'])
+        
+        if op == 'add':
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, tokens)
+        elif op == 'replace':
+            if tokens:
+                _resolve(document, tokens)
+                _remove(document, tokens)
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            if tokens[:len(source)] == source and tokens != source:
+                raise JSONPatchError(f'Operation {number} moves a value into itself')
+            value = _remove(document, source) if source else document
+            document = _add(document, tokens, value)
+        elif op == 'copy':
+            document = _add(document, tokens, copy.deepcopy(_resolve(document, source)))
+        elif op == 'test':
+            if not _same(_resolve(document, tokens), operation['value']):
+                raise JSONPatchError(f'Test failed at {operation["path"]!r}')
+        else:
+            raise JSONPatchError(f'Unknown operation {op!r}')
+    return document
+
+def apply_merge_patch(target, patch):
+    """
+    Apply an RFC 7396 merge patch; returns a new value and leaves ``target`` alone
+    
+    Objects are merged recursively and ``null`` deletes a member; anything
+    else, arrays included, replaces the target value.
+    """
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+def make_json_patch(old, new, tokens=()):
+    """
+    Compute a compact RFC 6902 patch turning ``old`` into ``new``
+    
+    Objects are diffed member by member and arrays after trimming their common
+    head and tail, so an edit deep inside a large document yields a few small
+    operations instead of a copy of the document.
+    
+    Returns:
+        list: operations for apply_json_patch
+    """
+    if _same(old, new):
+        return []
+    
+    if isinstance(old, dict) and isinstance(new, dict):
+        operations = [
+            {'op': 'remove', 'path': join_pointer([*tokens, key])} for key in old if key not in new
+        ]
+        for key, value in new.items():
+            if key in old:
+                operations.extend(make_json_patch(old[key], value, (*tokens, key)))
+            else:
+                operations.append({'op': 'add', 'path': join_pointer([*tokens, key]), 'value': value})
+        return operations
+    
+    if isinstance(old, list) and isinstance(new, list):
+        start = 0
+        while start < len(old) and start < len(new) and _same(old[start], new[start]):
+            start += 1
+        old_end, new_end = len(old), len(new)
+        while old_end > start and new_end > start and _same(old[old_end - 1], new[new_end - 1]):
+            old_end -= 1
+            new_end -= 1
+        
+        # Pair up the changed middles, then drop or append the difference
+        paired = min(old_end, new_end) - start
+        operations = []
+        for index in range(start, start + paired):
+            operations.extend(make_json_patch(old[index], new[index], (*tokens, str(index))))
+        for index in range(old_end - 1, start + paired - 1, -1):
+            operations.append({'op': 'remove', 'path': join_pointer([*tokens, str(index)])})
+        for index in range(start + paired, new_end):
+            operations.append({'op': 'add', 'path': join_pointer([*tokens, str(index)]), 'value': new[index]})
+        return operations
+    
+    return [{'op': 'replace', 'path': join_pointer(tokens), 'value': new}]
+
+def patch_fields(documents, media_type, patch):
+    """
+    Apply a JSON Patch or merge patch addressed by field name
+    
+    Args:
+        documents: current value of every patchable field, keyed by field name
+        media_type: JSON_PATCH_MEDIA_TYPE or MERGE_PATCH_MEDIA_TYPE
+        patch: parsed request body
+    
+    Returns:
+        dict: new values of the fields the patch changed
+    
+    Raises:
+        JSONPatchError: the patch is invalid or touches other fields
+    """
+    if media_type == MERGE_PATCH_MEDIA_TYPE:
+        if not isinstance(patch, dict):
+            raise JSONPatchError('A merge patch must be an object keyed by field name')
+        grouped = patch
+        apply = apply_merge_patch
+    else:
+        if not isinstance(patch, list):
+            raise JSONPatchError('A JSON Patch must be an array of operations')
+        # Operations on each field keep their order; from must stay in the same field
+        grouped = {}
+        for number, operation in enumerate(patch):
+            if not isinstance(operation, dict):
+                raise JSONPatchError(f'Operation {number} must be an object')
+            tokens = split_pointer(operation.get('path'))
+            if not tokens:
+                raise JSONPatchError(f'Operation {number} must target a field, e.g. "/theme/..."')
+            if 'from' in operation and split_pointer(operation['from'])[:1] != tokens[:1]:
+                raise JSONPatchError(f'Operation {number} cannot move values between fields')
+            
+            # Re-address the operation relative to the field's document
+            operation = dict(operation, path=join_pointer(tokens[1:]))
+            if 'from' in operation:
+                operation['from'] = join_pointer(split_pointer(operation['from'])[1:])
+            grouped.setdefault(tokens[0], []).append(operation)
+        apply = apply_json_patch
+    
+    unknown = sorted(set(grouped) - set(documents))
+    if unknown:
+        raise JSONPatchError(f'Only {", ".join(documents)} can be patched, not {", ".join(unknown)}')
+    
+    changed = {}
+    for field, field_patch in grouped.items():
+        value = apply(documents[field], field_patch)
+        if not isinstance(value, type(documents[field])):
+            raise JSONPatchError(f'{field} must stay a {type(documents[field]).__name__}')
+        if not _same(value, documents[field]):
+            changed[field] = value
+    return changed
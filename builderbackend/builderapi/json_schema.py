@@ -0,0 +1,323 @@
+"""
+Schema validation of website content documents
+
+``contentBlocks``, ``theme``, ``services``, ``features``, ``teamInfo`` and
+``template_metadata`` are free-form JSON. Unchecked, a malformed or huge
+payload gets stored and later breaks or bloats public reads of the site.
+Each of these fields is described here by a JSON Schema. A supported subset
+of keywords is compiled once, at import, into nested Python closures, so
+validating a save only walks the document and never interprets the schema.
+
+Supported keywords: type, enum, maxLength, minimum, maximum, items,
+maxItems, properties, required, additionalProperties, maxProperties and
+anyOf.
+
+Every field also has a size limit, in bytes of compact JSON, checked before
+the schema; WEBSITE_CONTENT_MAX_BYTES overrides the limits. Serializing a
+large document costs more than walking it, so the check is skipped when the
+whole request body is within the limit.
+
+Errors name the path of the offending value, e.g. ``contentBlocks/3/type:
+must be a string``. ``benchmark_content_validation`` measures what
+validation adds to a save.
+"""
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+import json
+
+class SchemaError(ValueError):
+    """A value does not match its schema; ``path`` lists the keys and indexes leading to it"""
+    
+    def __init__(self, message, path=()):
+        self.message = message
+        self.path = list(path)
+        super().__init__(message)
+    
+    def __str__(self):
+        return f'{"/".join(map(str, self.path))}: {self.message}' if self.path else self.message
+
+JSON_TYPES = {
+    'object': (dict,),
+    'array': (list,),
+    'string': (str,),
+    # bool is an int subclass; exact type checks keep true out of numbers
+    'integer': (int,),
+    'number': (int, float),
+    'boolean': (bool,),
+    'null': (type(None),),
+}
+
+def compile_schema(schema):
+    """
+    Turn a JSON Schema (see the module docstring for the keywords) into a validator
+    
+    Returns:
+        function: called with a value, raises SchemaError when it does not match
+    
+    Raises:
+        ValueError: the schema uses an unsupported keyword
+    """
+    unsupported = set(schema) - {
+        'type', 'enum', 'maxLength', 'minimum', 'maximum', 'items', 'maxItems',
+        'properties', 'required', 'additionalProperties', 'maxProperties', 'anyOf',
+    }
+    if unsupported:
+        raise ValueError(f'Unsupported schema keywords: {", ".join(sorted(unsupported))}')
+    checks = []
+    
+    if 'type' in schema:
+        names = [schema['type']] if isinstance(schema['type'], str) else schema['type']
+        allowed = frozenset(python_type for name in names for python_type in JSON_TYPES[name])
+        expected = ' or '.join(names)
+        
+        def check_type(value):
+            if type(value) not in allowed:
+                raise SchemaError(f'must be {"an" if expected[0] in "aeiou" else "a"} {expected}')
+        checks.append(check_type)
+    
+    if 'enum' in schema:
+        choices = schema['enum']
+        
+        def check_enum(value):
+            if value not in choices:
+                raise SchemaError(f'must be one of {", ".join(map(json.dumps, choices))}')
+        checks.append(check_enum)
+    
+    if 'maxLength' in schema:
+        max_length = schema['maxLength']
+        
+        def check_length(value):
+            if type(value) is str and len(value) > max_length:
+                raise SchemaError(f'must be at most {max_length} characters')
+        checks.append(check_length)
+    
+    if 'minimum' in schema or 'maximum' in schema:
+        low, high = schema.get('minimum', float('-inf')), schema.get('maximum', float('inf'))
+        
+        def check_range(value):
+            if type(value) in (int, float) and not low <= value <= high:
+                raise SchemaError(f'must be between {low} and {high}')
+        checks.append(check_range)
+    
+    if 'maxItems' in schema or 'items' in schema:
+        max_items = schema.get('maxItems')
+        check_item = compile_schema(schema['items']) if 'items' in schema else None
+        
+        def check_array(value):
+            if type(value) is not list:
+                return
+            if max_items is not None and len(value) > max_items:
+                raise SchemaError(f'must have at most {max_items} items')
+            if check_item is not None:
+                for index, item in enumerate(value):
+                    try:
+                        check_item(item)
+                    except SchemaError as e:
+                        # Paths are only built on the way out of a failure
+                        e.path.insert(0, index)
+                        raise
+        checks.append(check_array)
+    
+    object_keywords = {'properties', 'required', 'additionalProperties', 'maxProperties'}
+    if object_keywords & set(schema):
+        properties = {key: compile_schema(subschema) for key, subschema in schema.get('properties', {}).items()}
+        required = schema.get('required', [])
+        max_properties = schema.get('maxProperties')
+        additional = schema.get('additionalProperties', True)
+        check_additional = compile_schema(additional) if isinstance(additional, dict) else None
+        
+        def check_object(value):
+            if type(value) is not dict:
+                return
+            if max_properties is not None and len(value) > max_properties:
+                raise SchemaError(f'must have at most {max_properties} members')
+            for key in required:
+                if key not in value:
+                    raise SchemaError(f'{key} is required')
+            for key, member in value.items():
+                check = properties.get(key)
+                if check is None:
+                    if additional is False:
+                        raise SchemaError(f'{key} is not allowed')
+                    check = check_additional
+                if check is not None:
+                    try:
+                        check(member)
+                    except SchemaError as e:
+                        e.path.insert(0, key)
+                        raise
+        checks.append(check_object)
+    
+    if 'anyOf' in schema:
+        alternatives = [compile_schema(subschema) for subschema in schema['anyOf']]
+        
+        def check_any(value):
+            errors = []
+            for alternative in alternatives:
+                try:
+                    alternative(value)
+                    return
+                except SchemaError as e:
+                    errors.append(e)
+            # The alternative that got furthest into the value explains it best
+            deepest = max(errors, key=lambda error: len(error.path))
+            if deepest.path:
+                raise deepest
+            messages = [error.message for error in errors]
+            if all(message.startswith('must be ') for message in messages):
+                raise SchemaError('must be ' + ' or '.join(message[len('must be '):] for message in messages))
+            raise SchemaError('; or '.join(messages))
+        checks.append(check_any)
+    
+    if len(checks) == 1:
+        return checks[0]
+    
+    def check_all(value):
+        for check in checks:
+            check(value)
+    return check_all
+
+SHORT_TEXT = {'type': 'string', 'maxLength': 500}
+TEXT = {'type': 'string', 'maxLength': 20000}
+SCALAR = {'anyOf': [SHORT_TEXT, {'type': ['number', 'boolean', 'null']}]}
+
+# Entry of services / features: a plain label or a card
+LIST_ITEM = {'anyOf': [
+    SHORT_TEXT,
+    {
+        'type': 'object',
+        'maxProperties': 50,
+        'properties': {
+            'id': {'type': ['string', 'integer']},
+            'title': SHORT_TEXT,
+            'name': SHORT_TEXT,
+            'description': TEXT,
+            'icon': SHORT_TEXT,
+            'image': {'type': 'string', 'maxLength': 2000},
+            'price': {'type': ['string', 'number', 'null']},
+        },
+    },
+]}
+
+def bounded_json(depth, max_items=100):
+    """Schema for any JSON value nested at most ``depth`` levels, with at most ``max_items`` per array or object"""
+    if depth == 0:
+        return SCALAR
+    nested = bounded_json(depth - 1, max_items)
+    return {'anyOf': [
+        SCALAR,
+        {'type': 'array', 'maxItems': max_items, 'items': nested},
+        {'type': 'object', 'maxProperties': max_items, 'additionalProperties': nested},
+    ]}
+
+WEBSITE_CONTENT_SCHEMAS = {
+    'contentBlocks': {
+        'type': 'array',
+        'maxItems': 200,
+        'items': {
+            'type': 'object',
+            'maxProperties': 100,
+            'properties': {
+                'id': {'type': ['string', 'integer']},
+                'type': {'type': 'string', 'maxLength': 50},
+                'order': {'type': 'number'},
+            },
+        },
+    },
+    'theme': {
+        'type': 'object',
+        'maxProperties': 200,
+        # Colors, fonts and sizes, optionally grouped one level deep
+        'additionalProperties': {'anyOf': [
+            SCALAR,
+            {'type': 'array', 'maxItems': 50, 'items': SCALAR},
+            {'type': 'object', 'maxProperties': 100, 'additionalProperties': SCALAR},
+        ]},
+    },
+    'services': {'type': 'array', 'maxItems': 50, 'items': LIST_ITEM},
+    'features': {'type': 'array', 'maxItems': 100, 'items': LIST_ITEM},
+    'teamInfo': {
+        'type': 'array',
+        'maxItems': 100,
+        'items': {
+            'type': 'object',
+            'maxProperties': 50,
+            'properties': {
+                'id': {'type': ['string', 'integer']},
+                'name': SHORT_TEXT,
+                'role': SHORT_TEXT,
+                'bio': TEXT,
+                'image': {'type': 'string', 'maxLength': 2000},
+                'social': {'type': 'object', 'maxProperties': 20, 'additionalProperties': SHORT_TEXT},
+            },
+        },
+    },
+    # Settings of a template, registered or a site's own: free-form, but
+    # bounded in nesting and size
+    'template_metadata': {'type': 'object', 'maxProperties': 200, 'additionalProperties': bounded_json(4)},
+}
+
+WEBSITE_CONTENT_MAX_BYTES = {
+    'contentBlocks': 512 * 1024,
+    'theme': 16 * 1024,
+    'services': 64 * 1024,
+    'features': 64 * 1024,
+    'teamInfo': 128 * 1024,
+    'template_metadata': 32 * 1024,
+}
+
+WEBSITE_CONTENT_VALIDATORS = {field: compile_schema(schema) for field, schema in WEBSITE_CONTENT_SCHEMAS.items()}
+
+def get_max_bytes(field):
+    return {**WEBSITE_CONTENT_MAX_BYTES, **getattr(settings, 'WEBSITE_CONTENT_MAX_BYTES', {})}[field]
+
+def request_body_size(request):
+    """Length of the request body from its Content-Length, None when missing or not a length"""
+    try:
+        size = int(request.META['CONTENT_LENGTH'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return size if size >= 0 else None
+
+def website_content_errors(values, body_size=None):
+    """
+    Check the content documents among ``values`` (field name to value)
+    
+    ``body_size`` is the length of the request body the values were parsed
+    from, if they were; a field cannot be larger than the body holding it.
+    
+    Returns:
+        dict: error message per invalid field, empty if all are valid
+    """
+    errors = {}
+    for field, value in values.items():
+        validate = WEBSITE_CONTENT_VALIDATORS.get(field)
+        if validate is None:
+            continue
+        max_bytes = get_max_bytes(field)
+        if body_size is None or body_size > max_bytes:
+            size = len(json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+            if size > max_bytes:
+                errors[field] = f'must be at most {max_bytes} bytes of JSON, not {size}'
+                continue
+        try:
+            validate(value)
+        except SchemaError as e:
+            errors[field] = f'{field}/{e}' if e.path else f'{field}: {e}'
+    return errors
+
+def check_website_content(values, body_size=None):
+    """
+    Validate the content documents among ``values``, unless VALIDATE_WEBSITE_CONTENT is off
+    
+    ``body_size`` as for website_content_errors.
+    
+    Raises:
+        ValidationError: with the error message of each invalid field
+    """
+    if not getattr(settings, 'VALIDATE_WEBSITE_CONTENT', True):
+        return
+    errors = website_content_errors(values, body_size)
+    if errors:
+        raise ValidationError({field: [message] for field, message in errors.items()})
@@ -0,0 +1,97 @@
+"""
+Measure what website content validation adds to a save
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from builderapi.json_schema import WEBSITE_CONTENT_VALIDATORS
+from builderapi.serializers import WebsiteSerializer
+
+def sample_website(blocks):
+    """A website payload with ``blocks`` content blocks and typical list and theme sizes"""
+    return {
+        'name': 'Benchmark',
+        'slug': 'benchmark-content-validation',
+        'category': 'business',
+        'contentBlocks': [
+            {
+                'id': f'block-{index}',
+                'type': 'text' if index % 3 else 'gallery',
+                'order': index,
+                'content': {
+                    'heading': f'Section {index}',
+                    'text': 'Lorem ipsum dolor sit amet. ' * 20,
+                    'images': [{'url': f'https://example.com/{index}/{image}.jpg', 'alt': ''} for image in range(4)],
+                },
+                'style': {'padding': 24, 'background': '#ffffff', 'align': 'left'},
+            }
+            for index in range(blocks)
+        ],
+        'theme': {
+            'primaryColor': '#1d4ed8', 'secondaryColor': '#f59e0b', 'fontFamily': 'Inter', 'darkMode': False,
+            'fonts': {'heading': 'Poppins', 'body': 'Inter', 'size': 16},
+            'palette': ['#111827', '#374151', '#9ca3af', '#f3f4f6'],
+        },
+        'services': [
+            {'id': index, 'title': f'Service {index}', 'description': 'What we do. ' * 10, 'icon': 'star', 'price': 99}
+            for index in range(12)
+        ],
+        'features': ['Fast', 'Secure', 'Responsive', 'SEO friendly', *({'title': f'Feature {index}'} for index in range(8))],
+        'teamInfo': [
+            {'name': f'Person {index}', 'role': 'Engineer', 'bio': 'Bio. ' * 30, 'image': 'https://example.com/p.jpg'}
+            for index in range(10)
+        ],
+    }
+
+def time_per_call(function, iterations, repeats=5):
+    """Milliseconds per call, best of ``repeats`` runs to keep scheduler noise out"""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        best = min(best, time.perf_counter() - started)
+    return best / iterations * 1000
+
+class Command(BaseCommand):
+    help = 'Benchmark WebsiteSerializer validation with and without the content schemas'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--blocks', type=int, nargs='+', default=[10, 50, 200], help='Content block counts to measure'
+        )
+        parser.add_argument('--iterations', type=int, default=200, help='Validations per measurement')
+    
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        for blocks in options['blocks']:
+            payload = sample_website(blocks)
+            # The serializer reads the body size from the request, as in a real save
+            request = Request(APIRequestFactory().post('/api/websites/', payload, format='json'))
+            
+            def validate_save(context):
+                serializer = WebsiteSerializer(data=payload, context=context)
+                assert serializer.is_valid(), serializer.errors
+            
+            with override_settings(VALIDATE_WEBSITE_CONTENT=False):
+                baseline = time_per_call(lambda: validate_save({'request': request}), iterations)
+            with override_settings(VALIDATE_WEBSITE_CONTENT=True):
+                validated = time_per_call(lambda: validate_save({'request': request}), iterations)
+                # Without a request body to go by, e.g. after applying a JSON Patch
+                sized = time_per_call(lambda: validate_save({}), iterations)
+            
+            fields = ', '.join(
+                f'{field} {time_per_call(lambda: validator(payload[field]), iterations):.3f}'
+                for field, validator in WEBSITE_CONTENT_VALIDATORS.items()
+            )
+            self.stdout.write(
+                f'{blocks:>4} blocks ({len(request.body) // 1024} KB): serializer {baseline:.3f} ms unvalidated, '
+                f'{validated:.3f} ms validated ({(validated / baseline - 1) * 100:+.1f}%), '
+                f'{sized:.3f} ms with size check ({(sized / baseline - 1) * 100:+.1f}%); '
+                f'schemas alone, ms: {fields}'
+            )
@@ -0,0 +1,110 @@
+"""
+Compare sync and async login throughput under ASGI
+"""
+
+import asyncio
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import AsyncClient
+from django.test.utils import override_settings
+from django.urls import path
+
+from builderapi.models import User
+from builderapi.password_hashing import password_hashing_pool
+from builderapi.views import login, login_async
+
+def ping(request):
+    """Cheap sync view standing in for the rest of the API"""
+    return HttpResponse('ok')
+
+# URLconf used while benchmarking; requests go through Django's ASGI handler,
+# so sync views share one thread exactly as they do in production
+urlpatterns = [
+    path('sync/login/', login),
+    path('async/login/', login_async),
+    path('ping/', ping),
+]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+class Command(BaseCommand):
+    help = 'Benchmark the sync and async login views and the latency they add to other requests'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Logins per run')
+        parser.add_argument('--concurrency', type=int, default=16, help='Logins in flight at once')
+        parser.add_argument(
+            '--ping-interval', type=float, default=0.01,
+            help='Seconds between the cheap requests measured alongside the logins',
+        )
+    
+    async def run_logins(self, url, email, password, total, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+        statuses = set()
+        
+        async def one_login():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(
+                    url, {'email': email, 'password': password}, content_type='application/json'
+                )
+                latencies.append(time.perf_counter() - started)
+                statuses.add(response.status_code)
+        
+        await asyncio.gather(*(one_login() for _ in range(total)))
+        return latencies, statuses
+    
+    async def run_pings(self, done, interval):
+        """Hit the ping view every ``interval`` seconds until the logins finish"""
+        client = AsyncClient()
+        latencies = []
+        while not done.is_set():
+            started = time.perf_counter()
+            await client.get('/ping/')
+            latencies.append(time.perf_counter() - started)
+            await asyncio.sleep(interval)
+        return latencies
+    
+    async def run_mode(self, url, email, password, total, concurrency, interval):
+        done = asyncio.Event()
+        pings = asyncio.create_task(self.run_pings(done, interval))
+        started = time.perf_counter()
+        latencies, statuses = await self.run_logins(url, email, password, total, concurrency)
+        elapsed = time.perf_counter() - started
+        done.set()
+        ping_latencies = await pings
+        return elapsed, latencies, statuses, ping_latencies
+    
+    def handle(self, *args, **options):
+        email = f'benchmark-{uuid.uuid4().hex[:12]}@example.com'
+        password = uuid.uuid4().hex
+        user = User.objects.create_user(
+            username=email, email=email, password=password,
+            firstName='Benchmark', lastName='User', isVerified=True
+        )
+        
+        try:
+            with override_settings(ROOT_URLCONF=__name__, ALLOWED_HOSTS=['testserver']):
+                for mode in ('sync', 'async'):
+                    elapsed, latencies, statuses, ping_latencies = asyncio.run(self.run_mode(
+                        f'/{mode}/login/', email, password, options['requests'], options['concurrency'],
+                        options['ping_interval']
+                    ))
+                    self.stdout.write(
+                        f"{mode:>5}: {options['requests'] / elapsed:7.1f} logins/s, "
+                        f"login p50 {percentile(latencies, 0.5):7.1f} ms, p95 {percentile(latencies, 0.95):7.1f} ms, "
+                        f"other requests p50 {percentile(ping_latencies, 0.5):6.1f} ms, "
+                        f"max {max(ping_latencies) * 1000:7.1f} ms "
+                        f"({len(ping_latencies)} served, statuses {sorted(statuses)})"
+                    )
+                    if mode == 'async':
+                        self.stdout.write(f'hashing pool: {password_hashing_pool.stats()}')
+        finally:
+            user.delete()
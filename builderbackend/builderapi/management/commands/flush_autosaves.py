@@ -0,0 +1,20 @@
+"""
+Write buffered website autosaves to the database
+"""
+
+from django.core.management.base import BaseCommand
+
+from builderapi.autosave import flush_due_autosaves
+
+class Command(BaseCommand):
+    help = 'Flush autosave buffers; run every minute'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=float, default=0,
+            help='Only flush buffers pending for at least this many seconds',
+        )
+    
+    def handle(self, *args, **options):
+        flushed = flush_due_autosaves(options['older_than'])
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} website autosaves'))
@@ -0,0 +1,45 @@
+"""
+Import a product catalog file into a website
+"""
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from builderapi.models import Website
+from builderapi.product_import import CatalogImporter, iter_catalog_rows
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-create products from a CSV (header row) or NDJSON catalog, validating rows '
+        'in a pool of worker processes; for files too large to import through the API'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, or NDJSON file')
+        parser.add_argument('--website', required=True, help='Slug of the website the products belong to')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per validation task and bulk insert')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Validation processes; 1 validates in this process (default: CPU count)',
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            website = Website.objects.get(slug=options['website'])
+        except Website.DoesNotExist:
+            raise CommandError(f'Website {options["website"]!r} not found')
+        
+        importer = CatalogImporter(website, chunk_size=options['chunk_size'], workers=options['workers'])
+        try:
+            with open(options['path'], 'rb') as catalog:
+                report = importer.run(iter_catalog_rows(catalog, options['format']))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+        
+        for error in report['errors'][:50]:
+            self.stderr.write(f'Row {error["row"]}: {error["errors"]}')
+        if report['error_count'] > 50:
+            self.stderr.write(f'... and {report["error_count"] - 50} more invalid rows')
+        self.stdout.write(self.style.SUCCESS(f'Created {report["created"]} products, {report["error_count"]} rows rejected'))
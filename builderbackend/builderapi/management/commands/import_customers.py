@@ -0,0 +1,56 @@
+"""
+Import customer accounts from a CSV, JSON or NDJSON file
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from builderapi.customer_import import CustomerImporter, read_customer_rows
+from builderapi.models import Website
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-create customer accounts. Columns: email, firstName, lastName (or name), phone, '
+        'and either password_hash (an existing hash) or password (plain text, hashed on import)'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file with a header row, JSON array or NDJSON file')
+        parser.add_argument('--website', help='Slug of the website the customers belong to')
+        parser.add_argument('--format', choices=['csv', 'json', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users per bulk insert')
+        parser.add_argument('--verified', action='store_true', help='Mark imported customers as verified')
+        parser.add_argument(
+            '--send-verification', action='store_true',
+            help='Queue a verification code email for every imported unverified customer',
+        )
+        parser.add_argument('--hash-workers', type=int, help='Threads hashing plain-text passwords')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without creating users')
+    
+    def handle(self, *args, **options):
+        website = None
+        if options['website']:
+            try:
+                website = Website.objects.get(slug=options['website'])
+            except Website.DoesNotExist:
+                raise CommandError(f'Website {options["website"]!r} not found')
+        
+        importer = CustomerImporter(
+            chunk_size=options['chunk_size'],
+            verified=options['verified'],
+            send_verification=options['send_verification'],
+            hash_workers=options['hash_workers'],
+            dry_run=options['dry_run'],
+            website=website,
+        )
+        try:
+            result = importer.run(read_customer_rows(options['path'], options['format']))
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+        
+        for number, error in result.errors[:50]:
+            self.stderr.write(f'Row {number}: {error}')
+        if len(result.errors) > 50:
+            self.stderr.write(f'... and {len(result.errors) - 50} more invalid rows')
+        
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{result}'))
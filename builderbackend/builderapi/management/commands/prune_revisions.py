@@ -0,0 +1,24 @@
+"""
+Compact website and blog post history older than the retention window
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+
+from builderapi.revisions import prune_revisions
+
+class Command(BaseCommand):
+    help = 'Fold revisions older than REVISION_RETENTION_DAYS into one snapshot per website or blog post'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Retention window; defaults to REVISION_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, default=500, help='Objects compacted per transaction')
+    
+    def handle(self, *args, **options):
+        before = None
+        if options['days'] is not None:
+            before = timezone.now() - timedelta(days=options['days'])
+        
+        deleted = prune_revisions(before=before, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} revisions'))
@@ -0,0 +1,27 @@
+"""
+Delete revocation records for tokens that have already expired
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from builderapi.models import RevokedToken
+
+class Command(BaseCommand):
+    help = 'Delete RevokedToken rows whose token has expired, in small batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+    
+    def handle(self, *args, **options):
+        expired = RevokedToken.objects.filter(expires_at__lte=timezone.now())
+        
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            RevokedToken.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+        
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired revoked tokens'))
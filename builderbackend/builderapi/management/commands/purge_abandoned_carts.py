@@ -0,0 +1,110 @@
+"""
+Purge idle cart lines, keeping aggregated abandonment statistics
+"""
+
+from datetime import timedelta
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from builderapi.models import Cart, AbandonedCartStat
+
+def record_abandoned_stats(cart_items):
+    """
+    Add the given cart lines to the daily AbandonedCartStat totals
+    
+    Lines are grouped per website, product and last-activity day in one query
+    and merged into the existing totals with one bulk upsert.
+    """
+    groups = list(
+        cart_items.annotate(day=TruncDate('updatedAt'))
+        .values('websiteSlug', 'product_id', 'day')
+        .annotate(
+            website_name=Max('websiteName'),
+            name=Max('product_name'),
+            lines=Count('id'),
+            items=Sum('quantity'),
+            total=Sum(F('product_price') * F('quantity')),
+        )
+        .order_by()
+    )
+    if not groups:
+        return
+    
+    existing = {
+        (stat.websiteSlug, stat.product_id, stat.date): stat
+        for stat in AbandonedCartStat.objects.filter(
+            websiteSlug__in={group['websiteSlug'] for group in groups},
+            product_id__in={group['product_id'] for group in groups},
+            date__in={group['day'] for group in groups},
+        )
+    }
+    
+    stats = []
+    for group in groups:
+        previous = existing.get((group['websiteSlug'], group['product_id'], group['day']))
+        stats.append(AbandonedCartStat(
+            websiteSlug=group['websiteSlug'],
+            websiteName=group['website_name'],
+            product_id=group['product_id'],
+            product_name=group['name'],
+            date=group['day'],
+            line_count=group['lines'] + (previous.line_count if previous else 0),
+            item_count=group['items'] + (previous.item_count if previous else 0),
+            value=group['total'] + (previous.value if previous else 0),
+        ))
+    
+    AbandonedCartStat.objects.bulk_create(
+        stats,
+        update_conflicts=True,
+        unique_fields=['websiteSlug', 'product_id', 'date'],
+        update_fields=['websiteName', 'product_name', 'line_count', 'item_count', 'value'],
+    )
+
+class Command(BaseCommand):
+    help = 'Delete cart lines idle for longer than --days in small batches, recording abandonment stats first'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=getattr(settings, 'CART_ABANDONED_AFTER_DAYS', 30),
+            help='Purge lines not updated for this many days',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Lines deleted per transaction; keeps each SQLite write lock short',
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches so request traffic can take the write lock',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many lines would be purged')
+    
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        idle_items = Cart.objects.filter(updatedAt__lt=cutoff)
+        
+        if options['dry_run']:
+            self.stdout.write(f'{idle_items.count()} cart lines idle since before {cutoff:%Y-%m-%d %H:%M}')
+            return
+        
+        purged = 0
+        while True:
+            with transaction.atomic():
+                ids = list(idle_items.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+                if not ids:
+                    break
+                batch = Cart.objects.filter(id__in=ids)
+                record_abandoned_stats(batch)
+                batch.delete()
+            
+            purged += len(ids)
+            self.stdout.write(f'Purged {purged} cart lines so far')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} idle cart lines'))
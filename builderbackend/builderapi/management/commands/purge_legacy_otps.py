@@ -0,0 +1,33 @@
+"""
+Delete rows from the legacy OTPVerification table
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from builderapi.models import OTPVerification
+
+class Command(BaseCommand):
+    help = 'Delete legacy OTPVerification rows in small batches (OTPs are now stateless)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows deleted per statement')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches so request traffic can take the write lock',
+        )
+    
+    def handle(self, *args, **options):
+        deleted = 0
+        while True:
+            ids = list(OTPVerification.objects.order_by('id').values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            OTPVerification.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            self.stdout.write(f'Deleted {deleted} legacy OTP rows so far')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} legacy OTP rows'))
@@ -0,0 +1,52 @@
+"""
+Rewrite compressed columns with the current codec and threshold
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from builderapi.fields import CompressedFieldMixin
+
+class Command(BaseCommand):
+    help = (
+        'Re-encode every compressed field (after the migration that introduced them, '
+        'or after changing COMPRESSED_FIELD_CODEC / COMPRESSED_FIELD_THRESHOLD), in batches'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', help='Only this model, e.g. Website; repeatable')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows rewritten per transaction')
+    
+    def handle(self, *args, **options):
+        models = [
+            model for model in apps.get_app_config('builderapi').get_models()
+            if any(isinstance(field, CompressedFieldMixin) for field in model._meta.concrete_fields)
+        ]
+        if options['model']:
+            wanted = {name.lower() for name in options['model']}
+            unknown = wanted - {model.__name__.lower() for model in models}
+            if unknown:
+                raise CommandError(f'No compressed fields on: {", ".join(sorted(unknown))}')
+            models = [model for model in models if model.__name__.lower() in wanted]
+        
+        for model in models:
+            fields = [field.name for field in model._meta.concrete_fields if isinstance(field, CompressedFieldMixin)]
+            rows = model.objects.only('pk', *fields).order_by('pk')
+            
+            last_pk = None
+            rewritten = 0
+            while True:
+                batch = rows if last_pk is None else rows.filter(pk__gt=last_pk)
+                batch = list(batch[:options['batch_size']])
+                if not batch:
+                    break
+                # Reading decodes whatever encoding a row has; writing re-encodes it
+                with transaction.atomic():
+                    model.objects.bulk_update(batch, fields)
+                last_pk = batch[-1].pk
+                rewritten += len(batch)
+            
+            self.stdout.write(f'{model.__name__}: rewrote {", ".join(fields)} on {rewritten} rows')
+        
+        self.stdout.write(self.style.SUCCESS('Done'))
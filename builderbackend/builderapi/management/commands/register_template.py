@@ -0,0 +1,42 @@
+"""
+Add a website template, or a new version of one, to the public catalog
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+import json
+
+from builderapi.json_schema import website_content_errors
+from builderapi.models import Template
+from builderapi.template_registry import DEFAULT_TEMPLATE
+
+class Command(BaseCommand):
+    help = (
+        'Register a template version from a JSON file of its metadata. Templates are listed publicly by '
+        '/api/templates/; sites using the id move onto the new version the next time they are saved'
+    )
+    
+    def add_arguments(self, parser):
+        parser.add_argument('key', help="Template id, e.g. 'modern-business'")
+        parser.add_argument('path', help='JSON file with the template metadata object')
+        parser.add_argument('--name', required=True, help='Display name of the template')
+    
+    def handle(self, *args, **options):
+        key, name = options['key'], options['name']
+        if not key or len(key) > 100 or '/' in key:
+            raise CommandError('The template id must be 1 to 100 characters without "/"')
+        if key == DEFAULT_TEMPLATE['key']:
+            raise CommandError(f'{key!r} is the built-in default template')
+        if len(name) > 200:
+            raise CommandError('The name must be at most 200 characters')
+        
+        try:
+            with open(options['path'], encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not read {options["path"]}: {e}')
+        errors = website_content_errors({'template_metadata': metadata})
+        if errors:
+            raise CommandError(errors['template_metadata'])
+        
+        template = Template.objects.register(key, name, metadata)
+        self.stdout.write(self.style.SUCCESS(f'{template} ({template.contentHash})'))
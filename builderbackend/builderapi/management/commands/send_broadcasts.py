@@ -0,0 +1,44 @@
+"""
+Deliver queued merchant broadcast emails
+"""
+
+from django.core.management.base import BaseCommand
+
+from builderapi.email_utils import send_broadcast
+from builderapi.models import Broadcast
+
+class Command(BaseCommand):
+    help = 'Send queued broadcasts to website customers over a small pool of reused SMTP connections'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--id', type=int, help='Send (or resume) only this broadcast')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Recipients per send_messages call')
+        parser.add_argument('--connections', type=int, default=None, help='SMTP connections kept open')
+        parser.add_argument('--host', help='SMTP host, e.g. a local stand-in such as localhost')
+        parser.add_argument('--port', type=int, help='SMTP port')
+        parser.add_argument('--no-tls', action='store_true', help='Disable STARTTLS, for a local SMTP stand-in')
+    
+    def handle(self, *args, **options):
+        connection_kwargs = {}
+        if options['host']:
+            # An explicit host always means SMTP, whatever EMAIL_BACKEND is
+            connection_kwargs['backend'] = 'django.core.mail.backends.smtp.EmailBackend'
+            connection_kwargs['host'] = options['host']
+        if options['port']:
+            connection_kwargs['port'] = options['port']
+        if options['no_tls']:
+            connection_kwargs.update(use_tls=False, use_ssl=False, username='', password='')
+        
+        # 'sending' rows are broadcasts interrupted mid-way; they resume from their cursor
+        broadcasts = Broadcast.objects.filter(status__in=['queued', 'sending']).order_by('createdAt')
+        if options['id']:
+            broadcasts = broadcasts.filter(id=options['id'])
+        
+        for broadcast in broadcasts:
+            broadcast = send_broadcast(
+                broadcast, options['chunk_size'], options['connections'], **connection_kwargs
+            )
+            self.stdout.write(
+                f'Broadcast {broadcast.id}: {broadcast.sent_count} sent, '
+                f'{broadcast.failed_count} failed of {broadcast.total_recipients} ({broadcast.status})'
+            )
@@ -0,0 +1,38 @@
+"""
+Deliver queued transactional emails from the outbox
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from builderapi.email_utils import DomainRateLimiter, deliver_queued_emails
+
+class Command(BaseCommand):
+    help = 'Drain the email outbox in batches over one reused SMTP connection per batch'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Messages claimed per batch')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox has no due messages')
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds to wait before polling again when the outbox is empty',
+        )
+    
+    def handle(self, *args, **options):
+        # Shared across batches so per-domain limits hold for the life of the worker
+        rate_limiter = DomainRateLimiter()
+        
+        while True:
+            counts = deliver_queued_emails(options['batch_size'], rate_limiter)
+            if any(counts.values()):
+                self.stdout.write(
+                    f"Sent {counts['sent']}, retrying {counts['retried']}, "
+                    f"failed {counts['failed']}, deferred {counts['deferred']}"
+                )
+            
+            # Only deferred messages left means we are rate limited; back off too
+            if counts['sent'] + counts['retried'] + counts['failed'] == 0:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
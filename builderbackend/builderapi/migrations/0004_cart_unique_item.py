@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:09
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_items(apps, schema_editor):
+    """Fold duplicate (user, product_id, websiteSlug) lines into the oldest one."""
+    Cart = apps.get_model('builderapi', 'Cart')
+    duplicates = (
+        Cart.objects.values('user_id', 'product_id', 'websiteSlug')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total_quantity=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        Cart.objects.filter(id=duplicate['keep_id']).update(quantity=duplicate['total_quantity'])
+        Cart.objects.filter(
+            user_id=duplicate['user_id'],
+            product_id=duplicate['product_id'],
+            websiteSlug=duplicate['websiteSlug'],
+        ).exclude(id=duplicate['keep_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0003_user_addresses_user_company'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_items, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='cart',
+            unique_together={('user', 'product_id', 'websiteSlug')},
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:13
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_cart_updated_at(apps, schema_editor):
+    # Existing lines were last touched no later than when they were added
+    Cart = apps.get_model('builderapi', 'Cart')
+    Cart.objects.update(updatedAt=F('addedAt'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0004_cart_unique_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='updatedAt',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.RunPython(backfill_cart_updated_at, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='AbandonedCartStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('websiteSlug', models.CharField(max_length=200)),
+                ('websiteName', models.CharField(max_length=200)),
+                ('product_id', models.CharField(max_length=100)),
+                ('product_name', models.CharField(max_length=200)),
+                ('date', models.DateField()),
+                ('line_count', models.IntegerField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+            options={
+                'unique_together': {('websiteSlug', 'product_id', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0006_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('text_body', models.TextField()),
+                ('html_body', models.TextField(blank=True)),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('queued', 'Queued'), ('sending', 'Sending'), ('sent', 'Sent'), ('cancelled', 'Cancelled')], default='draft', max_length=20)),
+                ('total_recipients', models.IntegerField(default=0)),
+                ('sent_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('cursor', models.CharField(blank=True, max_length=254)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('startedAt', models.DateTimeField(blank=True, null=True)),
+                ('completedAt', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['website', 'customerEmail'], name='builderapi__website_cc7820_idx'),
+        ),
+        migrations.AddField(
+            model_name='broadcast',
+            name='website',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='broadcasts', to='builderapi.website'),
+        ),
+    ]
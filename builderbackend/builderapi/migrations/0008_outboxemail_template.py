@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0007_broadcast'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='context',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='outboxemail',
+            name='template',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='subject',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='outboxemail',
+            name='text_body',
+            field=models.TextField(blank=True),
+        ),
+    ]
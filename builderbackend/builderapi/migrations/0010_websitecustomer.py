@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_website_customers(apps, schema_editor):
+    # Signups were never tied to a website; infer memberships from the
+    # customers' orders and cart lines
+    User = apps.get_model('builderapi', 'User')
+    Website = apps.get_model('builderapi', 'Website')
+    Order = apps.get_model('builderapi', 'Order')
+    Cart = apps.get_model('builderapi', 'Cart')
+    WebsiteCustomer = apps.get_model('builderapi', 'WebsiteCustomer')
+    
+    website_ids = dict(Website.objects.values_list('slug', 'id'))
+    user_ids = dict(User.objects.values_list('email', 'id'))
+    pairs = {
+        (website_id, user_ids[email])
+        for website_id, email in Order.objects.values_list('website_id', 'customerEmail').distinct()
+        if email in user_ids
+    }
+    pairs.update(
+        (website_ids[slug], user_id)
+        for user_id, slug in Cart.objects.values_list('user_id', 'websiteSlug').distinct()
+        if slug in website_ids
+    )
+    WebsiteCustomer.objects.bulk_create(
+        [WebsiteCustomer(website_id=website_id, user_id=user_id) for website_id, user_id in pairs],
+        batch_size=1000,
+    )
+    
+    counts = (
+        WebsiteCustomer.objects.filter(website=OuterRef('pk'))
+        .order_by().values('website').annotate(total=Count('id')).values('total')
+    )
+    Website.objects.update(customerCount=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0009_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='website',
+            name='customerCount',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='WebsiteCustomer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='website_memberships', to=settings.AUTH_USER_MODEL)),
+                ('website', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='customers', to='builderapi.website')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['website', 'createdAt'], name='builderapi__website_2b6d0f_idx')],
+                'unique_together': {('website', 'user')},
+            },
+        ),
+        migrations.RunPython(backfill_website_customers, migrations.RunPython.noop),
+    ]
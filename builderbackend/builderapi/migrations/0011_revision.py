@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0010_websitecustomer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Revision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('objectType', models.CharField(choices=[('website', 'Website'), ('blogpost', 'Blog post')], max_length=20)),
+                ('objectId', models.BigIntegerField()),
+                ('version', models.PositiveIntegerField()),
+                ('isSnapshot', models.BooleanField(default=False)),
+                ('data', models.JSONField()),
+                ('createdAt', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('objectType', 'objectId', 'version')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0011_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blogpost',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='website',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
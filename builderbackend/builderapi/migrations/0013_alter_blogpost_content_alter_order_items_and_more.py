@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:00
+
+import builderapi.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0012_blogpost_version_product_version_website_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blogpost',
+            name='content',
+            field=builderapi.fields.CompressedTextField(),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='items',
+            field=builderapi.fields.CompressedJSONField(default=list),
+        ),
+        migrations.AlterField(
+            model_name='website',
+            name='contentBlocks',
+            field=builderapi.fields.CompressedJSONField(default=list),
+        ),
+        migrations.AlterField(
+            model_name='website',
+            name='customizations',
+            field=builderapi.fields.CompressedJSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='website',
+            name='template_metadata',
+            field=builderapi.fields.CompressedJSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='website',
+            name='theme',
+            field=builderapi.fields.CompressedJSONField(default=dict),
+        ),
+    ]
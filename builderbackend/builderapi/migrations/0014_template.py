@@ -0,0 +1,99 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:06
+
+import builderapi.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+from builderapi.json_patch import apply_json_patch, make_json_patch
+
+
+DEFAULT_DOCUMENT = {'id': 'default', 'name': 'Default Template', 'metadata': {}}
+
+
+def move_template_metadata(apps, schema_editor):
+    # Site content is never published as a Template: every site starts on the
+    # default template, keeping its id, name and metadata as overrides
+    Website = apps.get_model('builderapi', 'Website')
+    rows = Website.objects.only('id', 'template_id', 'template_name', 'template_metadata').order_by('pk')
+    
+    batch = []
+    for website in rows.iterator(chunk_size=500):
+        document = {
+            'id': website.template_id, 'name': website.template_name, 'metadata': website.template_metadata,
+        }
+        if document == DEFAULT_DOCUMENT:
+            continue
+        website.templateOverrides = make_json_patch(DEFAULT_DOCUMENT, document)
+        batch.append(website)
+        if len(batch) >= 500:
+            Website.objects.bulk_update(batch, ['templateOverrides'])
+            batch = []
+    Website.objects.bulk_update(batch, ['templateOverrides'])
+
+
+def restore_template_metadata(apps, schema_editor):
+    Website = apps.get_model('builderapi', 'Website')
+    batch = []
+    for website in Website.objects.select_related('templateVersion').order_by('pk').iterator(chunk_size=500):
+        template = website.templateVersion
+        base = (
+            {'id': template.key, 'name': template.name, 'metadata': template.metadata}
+            if template else DEFAULT_DOCUMENT
+        )
+        document = apply_json_patch(base, website.templateOverrides)
+        website.template_id = document.get('id', base['id'])
+        website.template_name = document['name']
+        website.template_metadata = document['metadata']
+        batch.append(website)
+        if len(batch) >= 500:
+            Website.objects.bulk_update(batch, ['template_id', 'template_name', 'template_metadata'])
+            batch = []
+    Website.objects.bulk_update(batch, ['template_id', 'template_name', 'template_metadata'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0013_alter_blogpost_content_alter_order_items_and_more'),
+    ]
+    
+    operations = [
+        migrations.AddField(
+            model_name='website',
+            name='templateOverrides',
+            field=models.JSONField(default=list),
+        ),
+        migrations.CreateModel(
+            name='Template',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100)),
+                ('version', models.PositiveIntegerField()),
+                ('name', models.CharField(max_length=200)),
+                ('metadata', builderapi.fields.CompressedJSONField(default=dict)),
+                ('contentHash', models.CharField(max_length=64, unique=True)),
+                ('createdAt', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('key', 'version')},
+            },
+        ),
+        migrations.AddField(
+            model_name='website',
+            name='templateVersion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='websites', to='builderapi.template'),
+        ),
+        migrations.RunPython(move_template_metadata, restore_template_metadata),
+        migrations.RemoveField(
+            model_name='website',
+            name='template_id',
+        ),
+        migrations.RemoveField(
+            model_name='website',
+            name='template_metadata',
+        ),
+        migrations.RemoveField(
+            model_name='website',
+            name='template_name',
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:54
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0014_template'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='builderapi__website_cc7820_idx',
+        ),
+    ]
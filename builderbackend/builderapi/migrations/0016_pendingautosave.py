@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-19 15:56
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('builderapi', '0015_remove_order_website_customeremail_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingAutosave',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=100)),
+                ('value', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('createdAt', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('updatedAt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('website', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_autosaves', to='builderapi.website')),
+            ],
+            options={
+                'unique_together': {('website', 'field')},
+            },
+        ),
+    ]
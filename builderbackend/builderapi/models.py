@@ -1,8 +1,17 @@
-from django.db import models
+from django.db import models, connections, router, transaction, IntegrityError
+from django.db.models import F, Q, Max, Value
+from django.db.models.functions import Greatest, Round
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
+from django.utils.text import slugify
+from functools import reduce
+import hashlib
+import operator
 import json
 
+from .fields import CompressedJSONField, CompressedTextField
+
 class User(AbstractUser):
     firstName = models.CharField(max_length=100)
     lastName = models.CharField(max_length=100)
@@ -21,6 +30,7 @@ class User(AbstractUser):
         return f"{self.firstName} {self.lastName} ({self.email})"
 
 class OTPVerification(models.Model):
+    # Legacy: OTPs are now derived statelessly (see otp_utils); rows are removed by purge_legacy_otps
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     otp = models.CharField(max_length=6)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -29,6 +39,219 @@ class OTPVerification(models.Model):
     def is_expired(self):
         return timezone.now() > self.created_at + timezone.timedelta(minutes=10)
 
+class OutboxEmail(models.Model):
+    """Transactional email queued by a request and delivered by the send_queued_emails worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    
+    to_email = models.EmailField()
+    # Either a registered email template plus its slot values...
+    template = models.CharField(max_length=100, blank=True)
+    context = models.JSONField(default=dict, blank=True)
+    # ...or a pre-rendered message
+    subject = models.CharField(max_length=255, blank=True)
+    text_body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    # When the message is next due; while 'sending' this is the worker's lease expiry
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+    
+    def __str__(self):
+        return f"{self.subject or self.template} -> {self.to_email} ({self.status})"
+
+class RevokedToken(models.Model):
+    """JWT id revoked by logout or refresh rotation, kept until the token expires"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    def __str__(self):
+        return f"{self.jti} (expires {self.expires_at})"
+
+def _copy_rows(queryset, batch_size=1000, **overrides):
+    """
+    Copy every row of ``queryset`` with ``bulk_create``, replacing ``overrides``
+    
+    Rows are streamed and inserted ``batch_size`` at a time, so memory stays
+    flat however many there are. auto_now(_add) timestamps are set afresh.
+    
+    Returns:
+        int: rows copied
+    """
+    model = queryset.model
+    fields = [field.attname for field in model._meta.concrete_fields if not field.primary_key]
+    copied = 0
+    batch = []
+    for values in queryset.values(*fields).iterator(chunk_size=batch_size):
+        values.update(overrides)
+        batch.append(model(**values))
+        if len(batch) >= batch_size:
+            model.objects.bulk_create(batch)
+            copied += len(batch)
+            batch = []
+    if batch:
+        model.objects.bulk_create(batch)
+        copied += len(batch)
+    return copied
+
+class Revision(models.Model):
+    """
+    One saved version of a Website or BlogPost
+    
+    Every REVISION_SNAPSHOT_INTERVAL versions (and whenever a diff would be
+    large) ``data`` holds the full state; otherwise it holds a JSON Patch from
+    the previous version. See revisions.py.
+    """
+    OBJECT_TYPE_CHOICES = [
+        ('website', 'Website'),
+        ('blogpost', 'Blog post'),
+    ]
+    
+    objectType = models.CharField(max_length=20, choices=OBJECT_TYPE_CHOICES)
+    objectId = models.BigIntegerField()
+    version = models.PositiveIntegerField()
+    isSnapshot = models.BooleanField(default=False)
+    data = models.JSONField()
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    createdAt = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        unique_together = ['objectType', 'objectId', 'version']
+    
+    def __str__(self):
+        return f"{self.objectType} #{self.objectId} v{self.version}"
+
+# JSON document fields of Website that can be edited with JSON Patch / merge patch
+WEBSITE_DOCUMENT_FIELDS = [
+    'contentBlocks', 'theme', 'customizations', 'features', 'teamInfo', 'services', 'contactInfo',
+    'template_metadata',
+]
+
+# Columns behind them; template_metadata is a shared Template plus this site's overrides
+WEBSITE_DOCUMENT_COLUMNS = [*WEBSITE_DOCUMENT_FIELDS[:-1], 'templateVersion', 'templateOverrides']
+
+def template_hash(key, name, metadata):
+    """Content hash identifying a template version; equal content, equal hash"""
+    canonical = json.dumps(
+        {'key': key, 'name': name, 'metadata': metadata}, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class TemplateManager(models.Manager):
+    def register(self, key, name, metadata):
+        """
+        The Template holding exactly this content, added as the key's next version if it is new
+        
+        Templates are public and cached by every worker, so only trusted
+        content is registered, through the ``register_template`` command.
+        
+        Returns:
+            Template
+        """
+        content_hash = template_hash(key, name, metadata)
+        for attempt in range(2):
+            existing = self.filter(contentHash=content_hash).first()
+            if existing is not None:
+                return existing
+            version = (self.filter(key=key).aggregate(version=Max('version'))['version'] or 0) + 1
+            try:
+                with transaction.atomic():
+                    return self.create(key=key, version=version, name=name, metadata=metadata, contentHash=content_hash)
+            except IntegrityError:
+                # Registered concurrently, either this content or another version
+                if attempt:
+                    raise
+
+class Template(models.Model):
+    """
+    One version of a website template, stored once and shared by every site built from it
+    
+    Rows are never changed once written: sites pin a version and keep their own
+    changes as overrides, and template_registry caches the rows per process.
+    """
+    # Public template id, e.g. 'modern-business'
+    key = models.CharField(max_length=100)
+    version = models.PositiveIntegerField()
+    name = models.CharField(max_length=200)
+    metadata = CompressedJSONField(default=dict)
+    contentHash = models.CharField(max_length=64, unique=True)
+    createdAt = models.DateTimeField(auto_now_add=True)
+    
+    objects = TemplateManager()
+    
+    class Meta:
+        unique_together = ['key', 'version']
+    
+    def __str__(self):
+        return f"{self.key} v{self.version}"
+
+class WebsiteManager(models.Manager):
+    def unique_slug(self, base):
+        """``base``, or ``base-2``, ``base-3``... whichever is free, found with one query"""
+        base = base[:45].rstrip('-')
+        taken = set(self.filter(slug__startswith=base).values_list('slug', flat=True))
+        if base not in taken:
+            return base
+        suffix = 2
+        while f'{base}-{suffix}' in taken:
+            suffix += 1
+        return f'{base}-{suffix}'
+    
+    def clone(self, source, user, slug=None, name=None, include_drafts=True, include_orders=False):
+        """
+        Copy a website with its products and blog posts in one transaction
+        
+        Args:
+            source: Website to copy
+            user: owner of the copy
+            slug: slug for the copy; made unique with a numeric suffix, defaults to ``<slug>-copy``
+            name: name for the copy, defaults to the source name
+            include_drafts: also copy draft blog posts
+            include_orders: also copy orders (normally customer data stays with the source site)
+        
+        Returns:
+            tuple: (new Website, dict of copied row counts)
+        """
+        with transaction.atomic():
+            website = self.model(**{
+                field.attname: getattr(source, field.attname)
+                for field in self.model._meta.concrete_fields if not field.primary_key
+            })
+            website.user = user
+            website.slug = self.unique_slug(slugify(slug or f'{source.slug}-copy'))
+            website.name = name or source.name
+            website.status = 'draft'
+            website.version = 1
+            # Customers belong to the source site
+            website.customerCount = 0
+            website.save(force_insert=True)
+            
+            posts = BlogPost.objects.filter(website=source)
+            if not include_drafts:
+                posts = posts.exclude(status='draft')
+            counts = {
+                'products': _copy_rows(Product.objects.filter(website=source), website_id=website.pk, version=1),
+                'blog_posts': _copy_rows(posts, website_id=website.pk, version=1),
+                'orders': 0,
+            }
+            if include_orders:
+                counts['orders'] = _copy_rows(
+                    Order.objects.filter(website=source),
+                    website_id=website.pk, websiteSlug=website.slug, websiteName=website.name,
+                )
+        return website, counts
+
 class Website(models.Model):
     CATEGORY_CHOICES = [
         ('business', 'Business'),
@@ -52,10 +275,13 @@ class Website(models.Model):
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
     logoUrl = models.URLField(blank=True)
     
-    # Template information
-    template_id = models.CharField(max_length=100, default='default')
-    template_name = models.CharField(max_length=200, default='Default Template')
-    template_metadata = models.JSONField(default=dict)
+    # Template information: a shared template version (none: the default
+    # template) and this site's changes to it, as a JSON Patch against
+    # {"id": ..., "name": ..., "metadata": ...}; see template_registry
+    templateVersion = models.ForeignKey(
+        Template, on_delete=models.PROTECT, null=True, blank=True, related_name='websites'
+    )
+    templateOverrides = models.JSONField(default=list)
     
     # Template content
     heroTitle = models.CharField(max_length=200, blank=True)
@@ -65,11 +291,11 @@ class Website(models.Model):
     productSectionTitle = models.CharField(max_length=200, blank=True)
     blogSectionTitle = models.CharField(max_length=200, blank=True)
     services = models.JSONField(default=list)
-    contentBlocks = models.JSONField(default=list)
+    contentBlocks = CompressedJSONField(default=list)
     
     # Theme and customizations
-    theme = models.JSONField(default=dict)
-    customizations = models.JSONField(default=dict)
+    theme = CompressedJSONField(default=dict)
+    customizations = CompressedJSONField(default=dict)
     
     # About content
     companyStory = models.TextField(blank=True)
@@ -86,12 +312,79 @@ class Website(models.Model):
     seoKeywords = models.TextField(blank=True)
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    # Maintained by WebsiteCustomer.objects.record and the post_delete signal
+    customerCount = models.PositiveIntegerField(default=0)
     createdAt = models.DateTimeField(auto_now_add=True)
+    # Bumped on every update; sent as the ETag and checked against If-Match (see concurrency.py)
+    version = models.PositiveIntegerField(default=1)
     updatedAt = models.DateTimeField(auto_now=True)
     
+    objects = WebsiteManager()
+    
+    def save(self, *args, **kwargs):
+        # customerCount only changes through F() updates; never write back a stale copy
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'customerCount'
+            ]
+        super().save(*args, **kwargs)
+    
     def __str__(self):
         return f"{self.name} ({self.slug})"
 
+class WebsiteCustomerManager(models.Manager):
+    def record(self, website, user):
+        """
+        Record that a user is a customer of a website
+        
+        The website's customerCount is bumped only when the membership is new,
+        so repeated logins cost a single indexed lookup.
+        
+        Returns:
+            tuple: (membership, created)
+        """
+        with transaction.atomic():
+            membership, created = self.get_or_create(website=website, user=user)
+            if created:
+                Website.objects.filter(pk=website.pk).update(customerCount=F('customerCount') + 1)
+        return membership, created
+
+class WebsiteCustomer(models.Model):
+    """Customer account that signed up or logged in through a website"""
+    website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='customers')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='website_memberships')
+    createdAt = models.DateTimeField(auto_now_add=True)
+    
+    objects = WebsiteCustomerManager()
+    
+    class Meta:
+        unique_together = ['website', 'user']
+        indexes = [models.Index(fields=['website', 'createdAt'])]
+    
+    def __str__(self):
+        return f"{self.user.email} @ {self.website.slug}"
+
+class PendingAutosave(models.Model):
+    """
+    A website field changed by autosave and not yet written to the website (see autosave.py)
+    
+    The value is stored as the field's serializable value; relations by their id.
+    """
+    website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='pending_autosaves')
+    field = models.CharField(max_length=100)
+    value = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # When the field was first buffered; later autosaves of it keep this
+    createdAt = models.DateTimeField(default=timezone.now, db_index=True)
+    updatedAt = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        unique_together = ['website', 'field']
+    
+    def __str__(self):
+        return f"{self.website_id}.{self.field} (pending since {self.createdAt})"
+
 class BlogPost(models.Model):
     STATUS_CHOICES = [
         ('draft', 'Draft'),
@@ -102,7 +395,7 @@ class BlogPost(models.Model):
     website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='blog_posts')
     title = models.CharField(max_length=200)
     slug = models.SlugField()
-    content = models.TextField()
+    content = CompressedTextField()
     excerpt = models.TextField(blank=True)
     featuredImage = models.URLField(blank=True)
     author = models.CharField(max_length=200)
@@ -121,6 +414,8 @@ class BlogPost(models.Model):
     customizations = models.JSONField(default=dict)
     
     createdAt = models.DateTimeField(auto_now_add=True)
+    # Bumped on every update; sent as the ETag and checked against If-Match (see concurrency.py)
+    version = models.PositiveIntegerField(default=1)
     updatedAt = models.DateTimeField(auto_now=True)
     
     class Meta:
@@ -129,6 +424,90 @@ class BlogPost(models.Model):
     def __str__(self):
         return f"{self.title} - {self.website.name}"
 
+# Fields the bulk product API may change
+PRODUCT_BULK_FIELDS = ['price', 'originalPrice', 'inventory', 'status', 'category']
+
+# Bulk filter keys and the lookups they map to
+PRODUCT_FILTER_LOOKUPS = {
+    'website': 'website_id',
+    'ids': 'id__in',
+    'skus': 'sku__in',
+    'category': 'category',
+    'status': 'status',
+    'price_min': 'price__gte',
+    'price_max': 'price__lte',
+    'inventory_max': 'inventory__lte',
+}
+
+class ProductManager(models.Manager):
+    def owned_filter(self, user, criteria):
+        """Products of the user's websites matching bulk filter criteria"""
+        return self.filter(website__user=user, **{
+            PRODUCT_FILTER_LOOKUPS[key]: value for key, value in criteria.items()
+        })
+    
+    def bulk_change(self, user, updates=(), rules=(), delete=None):
+        """
+        Apply explicit updates, rule-based updates and a delete in one transaction
+        
+        Args:
+            user: owner; products of other users are never touched
+            updates: dicts with ``id`` and new values for PRODUCT_BULK_FIELDS,
+                loaded with one query and written with ``bulk_update``
+            rules: dicts with ``filter`` criteria and any of ``price_percent``,
+                ``price_amount``, ``inventory_delta`` and ``values``, each run as
+                one filtered UPDATE with F() expressions
+            delete: filter criteria of products to delete
+        
+        Returns:
+            dict: ``updated``, ``rules`` (rows per rule) and ``deleted`` counts
+        
+        Raises:
+            Product.DoesNotExist: an updated id is missing or belongs to another user
+        """
+        now = timezone.now()
+        result = {'updated': 0, 'rules': [], 'deleted': 0}
+        
+        with transaction.atomic():
+            if updates:
+                # The one ownership query also loads the rows to update
+                products = self.filter(website__user=user, id__in=[update['id'] for update in updates]).in_bulk()
+                missing = sorted({update['id'] for update in updates} - set(products))
+                if missing:
+                    raise self.model.DoesNotExist(f'Products not found: {missing}')
+                
+                fields = {'updatedAt'}
+                for update in updates:
+                    product = products[update['id']]
+                    for field in PRODUCT_BULK_FIELDS:
+                        if field in update:
+                            setattr(product, field, update[field])
+                            fields.add(field)
+                    product.updatedAt = now
+                    product.version = F('version') + 1
+                fields.add('version')
+                self.bulk_update(products.values(), sorted(fields), batch_size=500)
+                result['updated'] = len(products)
+            
+            for rule in rules:
+                changes = dict(rule.get('values', {}), updatedAt=now, version=F('version') + 1)
+                if 'price_percent' in rule or 'price_amount' in rule:
+                    price = F('price')
+                    if 'price_percent' in rule:
+                        price = price * (1 + rule['price_percent'] / 100)
+                    if 'price_amount' in rule:
+                        price = price + rule['price_amount']
+                    changes['price'] = Greatest(Round(price, 2), Value(0), output_field=models.DecimalField())
+                if 'inventory_delta' in rule:
+                    changes['inventory'] = Greatest(F('inventory') + rule['inventory_delta'], Value(0))
+                result['rules'].append(self.owned_filter(user, rule['filter']).update(**changes))
+            
+            if delete:
+                # Only count products, not cascaded rows
+                result['deleted'] = self.owned_filter(user, delete).delete()[1].get(self.model._meta.label, 0)
+        
+        return result
+
 class Product(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
@@ -163,8 +542,12 @@ class Product(models.Model):
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     createdAt = models.DateTimeField(auto_now_add=True)
+    # Bumped on every update; sent as the ETag and checked against If-Match (see concurrency.py)
+    version = models.PositiveIntegerField(default=1)
     updatedAt = models.DateTimeField(auto_now=True)
     
+    objects = ProductManager()
+    
     class Meta:
         unique_together = ['website', 'sku']
     
@@ -187,7 +570,7 @@ class Order(models.Model):
     websiteName = models.CharField(max_length=200)
     
     # Order items
-    items = models.JSONField(default=list)
+    items = CompressedJSONField(default=list)
     total = models.DecimalField(max_digits=10, decimal_places=2)
     
     # Customer information
@@ -205,6 +588,141 @@ class Order(models.Model):
     def __str__(self):
         return f"Order #{self.id} - {self.websiteName}"
 
+# Snapshot columns copied from the product onto a cart line
+CART_ITEM_FIELDS = ['product_name', 'product_price', 'product_image', 'product_sku', 'websiteId', 'websiteName']
+
+def cart_keys_q(keys):
+    """Build a Q matching any of the given (product_id, websiteSlug) cart keys"""
+    return reduce(operator.or_, (Q(product_id=product_id, websiteSlug=website_slug) for product_id, website_slug in keys))
+
+class CartManager(models.Manager):
+    def add_item(self, user, product_id, websiteSlug, quantity=1, **defaults):
+        """
+        Add ``quantity`` of a product to the user's cart as an atomic upsert.
+        
+        Where the backend supports it (SQLite 3.35+, PostgreSQL) this is one
+        ``INSERT ... ON CONFLICT (user_id, product_id, websiteSlug) DO UPDATE SET
+        quantity = quantity + excluded.quantity RETURNING ...`` statement. Other
+        backends increment an existing line with ``UPDATE ... SET quantity =
+        quantity + n`` and insert otherwise; a concurrent insert that wins the
+        race trips the unique constraint and we fall back to the increment.
+        Concurrent requests never lose increments either way.
+        
+        Returns:
+            tuple: (cart item, created)
+        """
+        using = router.db_for_write(self.model)
+        features = connections[using].features
+        if features.supports_update_conflicts_with_target and features.can_return_columns_from_insert:
+            return self._upsert_item(using, user, product_id, websiteSlug, quantity, defaults)
+        
+        lookup = {'user': user, 'product_id': product_id, 'websiteSlug': websiteSlug}
+        
+        if self.filter(**lookup).update(quantity=F('quantity') + quantity, updatedAt=timezone.now()):
+            return self.get(**lookup), False
+        
+        try:
+            with transaction.atomic():
+                return self.create(quantity=quantity, **lookup, **defaults), True
+        except IntegrityError:
+            self.filter(**lookup).update(quantity=F('quantity') + quantity, updatedAt=timezone.now())
+            return self.get(**lookup), False
+    
+    def _upsert_item(self, using, user, product_id, websiteSlug, quantity, defaults):
+        connection = connections[using]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        now = timezone.now()
+        item = self.model(
+            user=user, product_id=product_id, websiteSlug=websiteSlug, quantity=quantity,
+            addedAt=now, updatedAt=now, **defaults,
+        )
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        table = quote(opts.db_table)
+        target = ', '.join(quote(opts.get_field(name).column) for name in ('user', 'product_id', 'websiteSlug'))
+        quantity_column = quote(opts.get_field('quantity').column)
+        updated_column = quote(opts.get_field('updatedAt').column)
+        sql = (
+            f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+            f'VALUES ({", ".join(["%s"] * len(fields))}) '
+            f'ON CONFLICT ({target}) DO UPDATE SET '
+            f'{quantity_column} = {table}.{quantity_column} + excluded.{quantity_column}, '
+            f'{updated_column} = excluded.{updated_column} '
+            f'RETURNING {", ".join(quote(field.column) for field in opts.concrete_fields)}'
+        )
+        params = [field.get_db_prep_save(getattr(item, field.attname), connection) for field in fields]
+        item = next(iter(self.db_manager(using).raw(sql, params)))
+        # addedAt is left alone on conflict, so it only matches for a new line
+        return item, item.addedAt == now
+    
+    def apply_operations(self, user, operations):
+        """
+        Apply a list of cart operations for one user in a single transaction.
+        
+        Operations are folded in order into a final state per cart line, so the
+        database sees at most one SELECT (current quantities for ``add`` lines),
+        one DELETE for removed lines and one bulk upsert for everything else.
+        
+        Args:
+            user: User instance owning the cart
+            operations: list of dicts with ``op`` ('set', 'add' or 'remove'),
+                ``product_id``, ``websiteSlug`` and, for set/add, ``quantity``
+                plus the product snapshot fields
+        """
+        with transaction.atomic():
+            # Lines whose first operation is an add build on the stored quantity
+            base_keys = set()
+            seen = set()
+            for operation in operations:
+                key = (operation['product_id'], operation['websiteSlug'])
+                if operation['op'] == 'add' and key not in seen:
+                    base_keys.add(key)
+                seen.add(key)
+            
+            current = {}
+            if base_keys:
+                rows = (
+                    self.select_for_update()
+                    .filter(cart_keys_q(base_keys), user=user)
+                    .values_list('product_id', 'websiteSlug', 'quantity')
+                )
+                current = {(product_id, website_slug): quantity for product_id, website_slug, quantity in rows}
+            
+            # key -> field values to upsert, or None when the line is removed
+            state = {}
+            for operation in operations:
+                key = (operation['product_id'], operation['websiteSlug'])
+                quantity = operation.get('quantity', 1)
+                
+                if operation['op'] == 'add':
+                    if key in state:
+                        quantity += state[key]['quantity'] if state[key] else 0
+                    else:
+                        quantity += current.get(key, 0)
+                
+                if operation['op'] == 'remove' or quantity <= 0:
+                    state[key] = None
+                else:
+                    state[key] = {field: operation[field] for field in CART_ITEM_FIELDS if field in operation}
+                    state[key]['quantity'] = quantity
+            
+            removed = [key for key, values in state.items() if values is None]
+            if removed:
+                self.filter(cart_keys_q(removed), user=user).delete()
+            
+            items = [
+                self.model(user=user, product_id=product_id, websiteSlug=website_slug, **values)
+                for (product_id, website_slug), values in state.items()
+                if values is not None
+            ]
+            if items:
+                self.bulk_create(
+                    items,
+                    update_conflicts=True,
+                    unique_fields=['user', 'product_id', 'websiteSlug'],
+                    update_fields=['quantity', 'updatedAt', *CART_ITEM_FIELDS],
+                )
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items')
     product_id = models.CharField(max_length=100)
@@ -217,6 +735,12 @@ class Cart(models.Model):
     websiteId = models.CharField(max_length=100)
     websiteName = models.CharField(max_length=200)
     addedAt = models.DateTimeField(auto_now_add=True)
+    updatedAt = models.DateTimeField(auto_now=True, db_index=True)
+    
+    objects = CartManager()
+    
+    class Meta:
+        unique_together = ['user', 'product_id', 'websiteSlug']
     
     def __str__(self):
         return f"{self.product_name} x {self.quantity} - {self.user.email}"
@@ -224,3 +748,50 @@ class Cart(models.Model):
     @property
     def total_price(self):
         return self.product_price * self.quantity
+
+class AbandonedCartStat(models.Model):
+    """Daily abandonment totals per website and product, kept after idle carts are purged"""
+    websiteSlug = models.CharField(max_length=200)
+    websiteName = models.CharField(max_length=200)
+    product_id = models.CharField(max_length=100)
+    product_name = models.CharField(max_length=200)
+    date = models.DateField()
+    line_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+    value = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
+    class Meta:
+        unique_together = ['websiteSlug', 'product_id', 'date']
+    
+    def __str__(self):
+        return f"{self.product_name} abandoned x {self.item_count} - {self.websiteSlug} ({self.date})"
+
+class Broadcast(models.Model):
+    """Email composed by a website owner and sent to the website's customers"""
+    STATUS_CHOICES = [
+        ('draft', 'Draft'),
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    website = models.ForeignKey(Website, on_delete=models.CASCADE, related_name='broadcasts')
+    subject = models.CharField(max_length=255)
+    text_body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='draft')
+    
+    # Delivery progress; cursor is the last recipient handed to SMTP so a stopped send can resume
+    total_recipients = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    cursor = models.CharField(max_length=254, blank=True)
+    
+    createdAt = models.DateTimeField(auto_now_add=True)
+    startedAt = models.DateTimeField(null=True, blank=True)
+    completedAt = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.subject} - {self.website.name} ({self.status})"
+
@@ -0,0 +1,119 @@
+"""
+Stateless one-time passwords for email verification
+
+Codes are derived with an HMAC over the user's identity and a time step,
+so issuing a code writes nothing and verifying it is pure computation.
+Single use is enforced by a short-lived cache marker plus the fact that the
+user's ``isVerified`` flag is part of the HMAC input: once a user is verified,
+every code issued before stops matching. Failed attempts are counted in the
+cache as well. Both live in the shared cache, so a lockout or a used code holds
+on every worker.
+"""
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+import time
+
+from .shared_cache import shared_cache as cache
+
+OTP_KEY_SALT = 'builderapi.otp'
+OTP_DIGITS = 6
+
+# Result codes returned by check_otp
+OTP_VALID = 'valid'
+OTP_INVALID = 'invalid'
+OTP_EXPIRED = 'expired'
+OTP_USED = 'used'
+OTP_LOCKED = 'locked'
+
+def get_otp_step():
+    """Seconds per time step"""
+    return getattr(settings, 'OTP_STEP_SECONDS', 300)
+
+def get_otp_valid_steps():
+    """Number of steps (current one included) a code is accepted for"""
+    return getattr(settings, 'OTP_VALID_STEPS', 3)
+
+def get_otp_max_attempts():
+    """Failed verifications allowed before the user has to wait for a new code"""
+    return getattr(settings, 'OTP_MAX_ATTEMPTS', 5)
+
+def describe_otp_lifetime():
+    """
+    How long a new code stays valid, for the verification email
+    
+    A code is accepted until the end of its time step plus the following
+    OTP_VALID_STEPS - 1 steps, so its lifetime depends on when in the step it
+    was issued.
+    
+    Returns:
+        str: e.g. "10 to 15 minutes"
+    """
+    step_seconds = get_otp_step()
+    valid_steps = get_otp_valid_steps()
+    shortest = (valid_steps - 1) * step_seconds // 60
+    longest = valid_steps * step_seconds // 60
+    if shortest <= 0:
+        return f'up to {longest} minutes'
+    return f'{shortest} to {longest} minutes'
+
+def _current_step():
+    return int(time.time()) // get_otp_step()
+
+def _code_for_step(user, step):
+    message = f'{user.pk}:{user.email}:{int(user.isVerified)}:{step}'
+    digest = salted_hmac(OTP_KEY_SALT, message, algorithm='sha256').digest()
+    # Dynamic truncation as in RFC 4226
+    offset = digest[-1] & 0x0f
+    value = int.from_bytes(digest[offset:offset + 4], 'big') & 0x7fffffff
+    return str(value % 10 ** OTP_DIGITS).zfill(OTP_DIGITS)
+
+def generate_otp(user):
+    """
+    Return the current verification code for a user
+    
+    Calling this again within the same time step returns the same code.
+    """
+    return _code_for_step(user, _current_step())
+
+def check_otp(user, code):
+    """
+    Verify a code and consume it if it is valid
+    
+    Args:
+        user: User instance
+        code: code entered by the user
+    
+    Returns:
+        str: one of OTP_VALID, OTP_INVALID, OTP_EXPIRED, OTP_USED or OTP_LOCKED
+    """
+    step_seconds = get_otp_step()
+    valid_steps = get_otp_valid_steps()
+    lifetime = step_seconds * (valid_steps + 1)
+    
+    attempts_key = f'otp_attempts:{user.pk}'
+    if cache.get(attempts_key, 0) >= get_otp_max_attempts():
+        return OTP_LOCKED
+    
+    code = str(code or '')
+    current = _current_step()
+    for step in range(current, current - valid_steps, -1):
+        if constant_time_compare(code, _code_for_step(user, step)):
+            # cache.add is atomic: only the first verifier of this code wins
+            if not cache.add(f'otp_used:{user.pk}:{step}', True, lifetime):
+                return OTP_USED
+            cache.delete(attempts_key)
+            return OTP_VALID
+    
+    cache.add(attempts_key, 0, lifetime)
+    try:
+        cache.incr(attempts_key)
+    except ValueError:
+        # Key expired between add and incr
+        cache.set(attempts_key, 1, lifetime)
+    
+    # Recognise codes from the previous hour so users get a clearer error
+    for step in range(current - valid_steps, current - valid_steps - 3600 // step_seconds, -1):
+        if constant_time_compare(code, _code_for_step(user, step)):
+            return OTP_EXPIRED
+    return OTP_INVALID
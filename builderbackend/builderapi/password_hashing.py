@@ -0,0 +1,152 @@
+"""
+Password hashing off the request path
+
+PBKDF2 costs tens of milliseconds of CPU per call. Under ASGI every sync view
+runs on one shared thread, so a burst of logins hashed inline stalls every
+other request on the worker. The async auth views hand hashing to a bounded
+thread pool instead (hashlib releases the GIL while hashing, so the workers
+run in parallel) and await the result, leaving the event loop free.
+
+At most PASSWORD_HASH_MAX_PENDING hashes may be running or queued; beyond
+that PasswordHashingBusy is raised and the views answer 503 rather than let
+the queue grow without bound. ``password_hashing_pool.stats()`` reports queue
+depth, rejections and wait times.
+"""
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
+import time
+
+from .models import User
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+class PasswordHashingPool:
+    """Bounded thread pool for password hashing with queueing metrics"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_hash_time = 0.0
+    
+    def get_workers(self):
+        return getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 2
+    
+    def get_max_pending(self):
+        return getattr(settings, 'PASSWORD_HASH_MAX_PENDING', 64)
+    
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.get_workers(), thread_name_prefix='password-hash')
+        return self.executor
+    
+    def _run(self, func, args, submitted_at):
+        started_at = time.monotonic()
+        wait = started_at - submitted_at
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            return func(*args)
+        finally:
+            with self.lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_hash_time += time.monotonic() - started_at
+    
+    async def run(self, func, *args):
+        """
+        Run ``func(*args)`` on the pool and await its result
+        
+        Raises:
+            PasswordHashingBusy: too many hashes are already running or queued
+        """
+        with self.lock:
+            if self.running + self.queued >= self.get_max_pending():
+                self.rejected += 1
+                raise PasswordHashingBusy()
+            self.queued += 1
+            executor = self._get_executor()
+        
+        future = executor.submit(self._run, func, args, time.monotonic())
+        return await asyncio.wrap_future(future)
+    
+    def stats(self):
+        """Snapshot of the queue; times are in milliseconds"""
+        with self.lock:
+            completed = self.completed or 1
+            return {
+                'workers': self.get_workers(),
+                'max_pending': self.get_max_pending(),
+                'running': self.running,
+                'queued': self.queued,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_wait_ms': round(self.total_wait / completed * 1000, 2),
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+                'avg_hash_ms': round(self.total_hash_time / completed * 1000, 2),
+            }
+
+password_hashing_pool = PasswordHashingPool()
+
+def _verify(password, encoded):
+    """
+    Check a password and, if the stored hash uses outdated parameters,
+    compute its replacement in the same pool slot
+    
+    Returns:
+        tuple: (valid, new_encoded or None)
+    """
+    if not check_password(password, encoded):
+        return False, None
+    
+    preferred = get_hasher('default')
+    hasher = identify_hasher(encoded)
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        return True, make_password(password)
+    return True, None
+
+async def amake_password(password):
+    """Hash a new password on the pool"""
+    return await password_hashing_pool.run(make_password, password)
+
+async def aauthenticate(email, password):
+    """
+    Async counterpart of ``authenticate(email=..., password=...)``
+    
+    Mirrors ModelBackend: unknown emails still pay for one hash so response
+    times do not reveal which addresses have accounts, inactive users are
+    rejected and outdated hashes are upgraded.
+    
+    Returns:
+        User or None
+    """
+    if not email or not password:
+        return None
+    
+    user = await User.objects.filter(email=email).afirst()
+    if user is None:
+        await password_hashing_pool.run(make_password, password)
+        return None
+    
+    valid, new_encoded = await password_hashing_pool.run(_verify, password, user.password)
+    if not valid or not user.is_active:
+        return None
+    
+    if new_encoded:
+        user.password = new_encoded
+        await user.asave(update_fields=['password'])
+    return user
@@ -0,0 +1,200 @@
+"""
+Bulk import of product catalogs
+
+Catalog files (CSV with a header row, or NDJSON) are parsed as a stream and
+handled in chunks: rows are validated, SKUs are checked against the
+website's existing products with one query per chunk, and valid rows are
+inserted with ``bulk_create``. Every rejected row is reported with its row
+number and field errors instead of failing the whole import.
+
+Imports through the API validate in the request's own process. The
+``import_catalog`` command can spread validation of large files over one
+shared, bounded pool of worker processes. The workers are started with
+forkserver or spawn, never forked from a threaded server.
+"""
+
+from django.conf import settings
+from django.utils.text import slugify
+from rest_framework.exceptions import ValidationError
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import csv
+import django
+import io
+import json
+import multiprocessing
+import threading
+
+from .models import Product
+from .serializers import ProductImportSerializer
+
+JSON_COLUMNS = ('images', 'variants')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_validation_pool(workers):
+    """
+    The process pool validating rows, created on first use and shared afterwards
+    
+    Workers run a fresh interpreter (forkserver where available, else spawn)
+    and set Django up before their first task.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(method), initializer=django.setup
+            )
+        return _pool
+
+def iter_catalog_rows(uploaded_file, file_format=None):
+    """
+    Stream rows from an uploaded catalog without reading it into memory
+    
+    Args:
+        uploaded_file: binary file object, e.g. request.FILES['file']
+        file_format: 'csv' or 'ndjson'; guessed from the file name if omitted
+    
+    Yields:
+        tuple: (row number, dict); unparseable NDJSON lines yield an error string instead
+    """
+    if file_format is None:
+        name = getattr(uploaded_file, 'name', '') or ''
+        file_format = 'ndjson' if name.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+    
+    text = io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline='')
+    if file_format == 'csv':
+        # Row 1 is the header
+        yield from enumerate(csv.DictReader(text), start=2)
+        return
+    
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, f'Invalid JSON: {e}'
+
+def _clean_row(row):
+    """Drop empty CSV cells so model defaults apply, and decode JSON list columns"""
+    cleaned = {}
+    for field, value in row.items():
+        if field is None or value in (None, ''):
+            continue
+        if field in JSON_COLUMNS and isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                # Plain CSV cells may list image URLs separated by |
+                value = [part.strip() for part in value.split('|') if part.strip()]
+        cleaned[field] = value
+    if 'slug' not in cleaned and cleaned.get('name'):
+        cleaned['slug'] = slugify(str(cleaned['name']))[:50]
+    return cleaned
+
+def validate_rows(rows):
+    """
+    Validate a chunk of catalog rows; runs in the worker processes
+    
+    Returns:
+        list: (row number, validated data or None, errors or None) per row
+    """
+    # One serializer for the whole chunk, as ListSerializer does: building a
+    # ModelSerializer's fields costs more than validating a row
+    serializer = ProductImportSerializer()
+    results = []
+    for number, row in rows:
+        if not isinstance(row, dict):
+            results.append((number, None, {'row': [row if isinstance(row, str) else 'Expected an object']}))
+            continue
+        try:
+            results.append((number, dict(serializer.run_validation(_clean_row(row))), None))
+        except ValidationError as e:
+            errors = {field: [str(error) for error in field_errors] for field, field_errors in e.detail.items()}
+            results.append((number, None, errors))
+    return results
+
+class CatalogImporter:
+    """
+    Import catalog rows into one website
+    
+    Args:
+        website: Website the products belong to
+        chunk_size: rows per validation task, SKU query and bulk insert
+        workers: validation processes (the shared pool is sized by the first
+            importer that uses it); 0 or 1 validates in the calling process,
+            the default for CATALOG_IMPORT_WORKERS
+    """
+    
+    def __init__(self, website, chunk_size=1000, workers=None):
+        self.website = website
+        self.chunk_size = chunk_size
+        if workers is None:
+            workers = getattr(settings, 'CATALOG_IMPORT_WORKERS', 0)
+        self.workers = workers
+        self.created = 0
+        self.errors = []
+        self.seen_skus = set()
+    
+    def _chunks(self, rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+    
+    def _save_chunk(self, results):
+        valid = []
+        for number, data, errors in results:
+            if errors:
+                self.errors.append({'row': number, 'errors': errors})
+            elif data['sku'] in self.seen_skus:
+                self.errors.append({'row': number, 'errors': {'sku': ['Duplicate SKU earlier in the file']}})
+            else:
+                self.seen_skus.add(data['sku'])
+                valid.append((number, data))
+        
+        # One query finds every SKU the website already has
+        existing = set(
+            Product.objects.filter(website=self.website, sku__in=[data['sku'] for _, data in valid])
+            .values_list('sku', flat=True)
+        )
+        products = []
+        for number, data in valid:
+            if data['sku'] in existing:
+                self.errors.append({'row': number, 'errors': {'sku': ['A product with this SKU already exists']}})
+            else:
+                products.append(Product(website=self.website, **data))
+        
+        Product.objects.bulk_create(products)
+        self.created += len(products)
+    
+    def run(self, rows):
+        """
+        Validate and insert an iterable of (row number, dict) pairs
+        
+        Returns:
+            dict: ``created`` count, ``error_count`` and per-row ``errors``
+        """
+        if self.workers > 1:
+            # Workers never touch the database; this process does the inserts
+            executor = get_validation_pool(self.workers)
+            # Keep a couple of chunks per worker in flight so the file is read
+            # only as fast as it is validated
+            pending = deque()
+            for chunk in self._chunks(rows):
+                pending.append(executor.submit(validate_rows, chunk))
+                if len(pending) >= self.workers * 2:
+                    self._save_chunk(pending.popleft().result())
+            while pending:
+                self._save_chunk(pending.popleft().result())
+        else:
+            for chunk in self._chunks(rows):
+                self._save_chunk(validate_rows(chunk))
+        
+        return {'created': self.created, 'error_count': len(self.errors), 'errors': self.errors}
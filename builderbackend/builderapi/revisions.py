@@ -0,0 +1,188 @@
+"""
+Revision history for websites and blog posts
+
+Each save records a Revision. Storing the whole row every time would multiply
+storage for large ``contentBlocks`` documents, so most revisions hold only a
+JSON Patch (see json_patch.make_json_patch) from the previous version. Every
+REVISION_SNAPSHOT_INTERVAL versions, or when the diff would be larger than
+half the state, a full snapshot is stored instead. Any version is rebuilt
+from the snapshot at or before it plus at most that many diffs, with two
+queries.
+
+``prune_revisions`` compacts history older than REVISION_RETENTION_DAYS: the
+newest expired version of each object becomes a snapshot and everything
+before it is deleted, so undo still reaches back to the edge of the window.
+"""
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+from datetime import timedelta
+import json
+
+from .json_patch import apply_json_patch, make_json_patch
+from .models import Revision, Website, BlogPost
+from .template_registry import TEMPLATE_FIELDS, template_changes
+
+# Fields that are not part of the edited content; slugs are left out so a
+# restore can never collide with a slug taken since
+UNTRACKED_FIELDS = {
+    'website': {'id', 'user', 'slug', 'customerCount', 'version', 'createdAt', 'updatedAt'},
+    'blogpost': {'id', 'website', 'slug', 'version', 'createdAt', 'updatedAt'},
+}
+
+OBJECT_TYPES = {Website: 'website', BlogPost: 'blogpost'}
+
+def get_snapshot_interval():
+    return getattr(settings, 'REVISION_SNAPSHOT_INTERVAL', 25)
+
+def object_type(instance):
+    return OBJECT_TYPES[type(instance)]
+
+def tracked_fields(model):
+    untracked = UNTRACKED_FIELDS[OBJECT_TYPES[model]]
+    return [field for field in model._meta.concrete_fields if field.name not in untracked]
+
+def revision_state(instance):
+    """Tracked field values of ``instance`` as plain JSON (dates become ISO strings)"""
+    fields = tracked_fields(type(instance))
+    deferred = instance.get_deferred_fields()
+    if deferred:
+        # e.g. loaded with only() by the JSON Patch view; one query for the rest
+        instance.refresh_from_db(fields=[field.attname for field in fields if field.attname in deferred])
+    return json.loads(json.dumps(
+        {field.attname: getattr(instance, field.attname) for field in fields}, cls=DjangoJSONEncoder
+    ))
+
+def revisions_for(instance):
+    return Revision.objects.filter(objectType=object_type(instance), objectId=instance.pk)
+
+def _rebuild(revisions, version=None):
+    """(state, version, snapshot version) of the newest revision in ``revisions`` up to ``version``"""
+    if version is not None:
+        revisions = revisions.filter(version__lte=version)
+    
+    base = revisions.filter(isSnapshot=True).aggregate(version=Max('version'))['version']
+    if base is None:
+        raise Revision.DoesNotExist('No such revision')
+    chain = list(revisions.filter(version__gte=base).order_by('version').values_list('version', 'data'))
+    if version is not None and chain[-1][0] != version:
+        raise Revision.DoesNotExist('No such revision')
+    
+    state = chain[0][1]
+    for _, patch in chain[1:]:
+        state = apply_json_patch(state, patch)
+    return state, chain[-1][0], base
+
+def reconstruct(instance, version=None):
+    """
+    Rebuild the state of one version, the latest if ``version`` is None
+    
+    Returns:
+        tuple: (state dict, version number)
+    
+    Raises:
+        Revision.DoesNotExist: the object has no such version
+    """
+    state, version, _ = _rebuild(revisions_for(instance), version)
+    return state, version
+
+def record_revision(instance, user=None):
+    """
+    Record the current state of a Website or BlogPost as a new version
+    
+    Nothing is recorded when the tracked fields did not change.
+    
+    Returns:
+        Revision or None
+    """
+    state = revision_state(instance)
+    serialized_size = len(json.dumps(state))
+    
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return _record(instance, user, state, serialized_size)
+        except IntegrityError:
+            # Another save took the version number; diff against it instead
+            if attempt:
+                raise
+
+def _record(instance, user, state, serialized_size):
+    revisions = revisions_for(instance)
+    key = {'objectType': object_type(instance), 'objectId': instance.pk, 'user': user}
+    try:
+        previous, version, last_snapshot = _rebuild(revisions)
+    except Revision.DoesNotExist:
+        return Revision.objects.create(version=1, isSnapshot=True, data=state, **key)
+    
+    patch = make_json_patch(previous, state)
+    if not patch:
+        return None
+    
+    # Bound the chain replayed by reconstruct, and skip diffs that save little
+    snapshot = (
+        version + 1 - last_snapshot >= get_snapshot_interval()
+        or len(json.dumps(patch)) * 2 > serialized_size
+    )
+    return Revision.objects.create(
+        version=version + 1, isSnapshot=snapshot, data=state if snapshot else patch, **key
+    )
+
+def restore_revision(instance, version, user=None):
+    """
+    Put an old version back; the restore is itself recorded as a new version
+    
+    Raises:
+        Revision.DoesNotExist: the object has no such version
+    """
+    state, _ = reconstruct(instance, version=version)
+    for field in tracked_fields(type(instance)):
+        if field.attname in state:
+            setattr(instance, field.attname, field.to_python(state[field.attname]))
+    # Website versions recorded before templates were shared hold the template fields themselves
+    legacy = {field: state[field] for field in TEMPLATE_FIELDS if field in state}
+    if legacy:
+        for field, value in template_changes(instance, legacy).items():
+            setattr(instance, field, value)
+    # A restore is a change like any other: stale copies must not overwrite it
+    instance.version = F('version') + 1
+    instance.save()
+    instance.refresh_from_db(fields=['version'])
+    return record_revision(instance, user)
+
+def prune_revisions(before=None, batch_size=500):
+    """
+    Compact revisions created before ``before`` (default: REVISION_RETENTION_DAYS ago)
+    
+    Objects are handled ``batch_size`` at a time, each batch in its own transaction.
+    
+    Returns:
+        int: revisions deleted
+    """
+    if before is None:
+        before = timezone.now() - timedelta(days=getattr(settings, 'REVISION_RETENTION_DAYS', 90))
+    
+    # Objects with more than one expired revision still have something to compact
+    expired = (
+        Revision.objects.filter(createdAt__lt=before)
+        .values('objectType', 'objectId').annotate(count=Count('id'), last=Max('version'))
+        .filter(count__gt=1).order_by('objectType', 'objectId')
+    )
+    deleted = 0
+    while True:
+        batch = list(expired[:batch_size])
+        if not batch:
+            break
+        
+        with transaction.atomic():
+            for row in batch:
+                revisions = Revision.objects.filter(objectType=row['objectType'], objectId=row['objectId'])
+                # The newest expired version becomes the base of what is kept
+                state, _, base = _rebuild(revisions, row['last'])
+                if base != row['last']:
+                    revisions.filter(version=row['last']).update(isSnapshot=True, data=state)
+                deleted += revisions.filter(version__lt=row['last']).delete()[0]
+    return deleted
@@ -1,7 +1,15 @@
 from rest_framework import serializers
 from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
-from .models import User, Website, BlogPost, Product, Order, Cart, OTPVerification
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import User, Website, WebsiteCustomer, BlogPost, Product, Order, Cart, OTPVerification, Broadcast, Revision
+from .token_revocation import revoke_token, is_token_revoked
+from .template_registry import template_changes, website_template
+from .json_schema import check_website_content, request_body_size
+from decimal import Decimal
 import random
 import string
 
@@ -20,14 +28,22 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data.pop('confirmPassword')
-        user = User.objects.create_user(
-            username=validated_data['email'],
-            email=validated_data['email'],
-            firstName=validated_data['firstName'],
-            lastName=validated_data['lastName'],
-            phone=validated_data.get('phone', ''),
-            password=validated_data['password']
-        )
+        fields = {
+            'username': validated_data['email'],
+            'email': User.objects.normalize_email(validated_data['email']),
+            'firstName': validated_data['firstName'],
+            'lastName': validated_data['lastName'],
+            'phone': validated_data.get('phone', ''),
+        }
+        
+        # The async register view hashes the password on the hashing pool
+        # and passes it in through save(password_hash=...)
+        if validated_data.get('password_hash'):
+            user = User(password=validated_data['password_hash'], **fields)
+            user.save()
+            return user
+        
+        user = User.objects.create_user(password=validated_data['password'], **fields)
         return user
 
 class UserLoginSerializer(serializers.Serializer):
@@ -39,7 +55,11 @@ class UserLoginSerializer(serializers.Serializer):
         password = attrs.get('password')
         
         if email and password:
-            user = authenticate(username=email, password=password)
+            # The async login view authenticates on the hashing pool beforehand
+            if 'user' in self.context:
+                user = self.context['user']
+            else:
+                user = authenticate(username=email, password=password)
             if not user:
                 raise serializers.ValidationError('Invalid email or password')
             if not user.isVerified:
@@ -56,6 +76,20 @@ class OTPVerificationSerializer(serializers.Serializer):
             raise serializers.ValidationError('OTP must be 6 digits')
         return value
 
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """Token refresh that rejects revoked refresh tokens and revokes rotated ones"""
+    
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        if is_token_revoked(refresh):
+            raise InvalidToken('Token has been revoked')
+        
+        data = super().validate(attrs)
+        
+        if jwt_settings.ROTATE_REFRESH_TOKENS and jwt_settings.BLACKLIST_AFTER_ROTATION:
+            revoke_token(refresh)
+        return data
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -65,35 +99,154 @@ class UserSerializer(serializers.ModelSerializer):
 class WebsiteSerializer(serializers.ModelSerializer):
     # Add computed fields for template object
     template = serializers.SerializerMethodField()
+    # Written as before, stored as a shared template plus overrides (see template_registry)
+    template_id = serializers.CharField(max_length=100, write_only=True, required=False)
+    template_name = serializers.CharField(max_length=200, write_only=True, required=False)
+    template_metadata = serializers.DictField(write_only=True, required=False)
     
     class Meta:
         model = Website
-        fields = '__all__'
-        read_only_fields = ['user', 'createdAt', 'updatedAt']
+        exclude = ['templateVersion', 'templateOverrides']
+        read_only_fields = ['user', 'customerCount', 'version', 'createdAt', 'updatedAt']
     
     def get_template(self, obj):
-        """Return template as an object with id, name, and metadata"""
-        return {
-            'id': obj.template_id,
-            'name': obj.template_name,
-            'metadata': obj.template_metadata
-        }
+        """
+        Return template as an object with id, name, version, hash and metadata
+        
+        With ``?template=ref`` the metadata is left out and ``overrides`` (a JSON
+        Patch against the template's id, name and metadata) sent instead, for
+        clients that cache templates from /api/templates/ by hash.
+        """
+        request = self.context.get('request')
+        expand = request is None or request.query_params.get('template') != 'ref'
+        return website_template(obj, expand=expand)
+    
+    def validate(self, attrs):
+        request = self.context.get('request')
+        check_website_content(attrs, request_body_size(request) if request else None)
+        return template_changes(self.instance, attrs)
     
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class WebsiteCloneSerializer(serializers.Serializer):
+    slug = serializers.SlugField(max_length=50, required=False)
+    name = serializers.CharField(max_length=200, required=False)
+    include_drafts = serializers.BooleanField(default=True)
+    include_orders = serializers.BooleanField(default=False)
+
+class WebsiteCustomerSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='user.id', read_only=True)
+    email = serializers.EmailField(source='user.email', read_only=True)
+    name = serializers.SerializerMethodField()
+    phone = serializers.CharField(source='user.phone', read_only=True)
+    isVerified = serializers.BooleanField(source='user.isVerified', read_only=True)
+    
+    class Meta:
+        model = WebsiteCustomer
+        fields = ['id', 'email', 'name', 'phone', 'isVerified', 'createdAt']
+    
+    def get_name(self, obj):
+        return f"{obj.user.firstName} {obj.user.lastName}".strip()
+
+class RevisionSerializer(serializers.ModelSerializer):
+    userEmail = serializers.EmailField(source='user.email', read_only=True, default=None)
+    
+    class Meta:
+        model = Revision
+        fields = ['version', 'isSnapshot', 'userEmail', 'createdAt']
+
 class BlogPostSerializer(serializers.ModelSerializer):
     class Meta:
         model = BlogPost
         fields = '__all__'
-        read_only_fields = ['createdAt', 'updatedAt']
+        read_only_fields = ['version', 'createdAt', 'updatedAt']
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
-        read_only_fields = ['createdAt', 'updatedAt']
+        read_only_fields = ['version', 'createdAt', 'updatedAt']
+
+class ProductImportSerializer(ProductSerializer):
+    """Validates one catalog row; the website comes from the import request"""
+    class Meta(ProductSerializer.Meta):
+        fields = None
+        exclude = ['website']
+
+class ProductFilterSerializer(serializers.Serializer):
+    """Selects products for a bulk rule or delete; criteria are ANDed"""
+    website = serializers.IntegerField(required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    skus = serializers.ListField(child=serializers.CharField(max_length=100), required=False, allow_empty=False)
+    category = serializers.CharField(max_length=100, required=False)
+    status = serializers.ChoiceField(choices=Product.STATUS_CHOICES, required=False)
+    price_min = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    price_max = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    inventory_max = serializers.IntegerField(required=False)
+    
+    def validate(self, attrs):
+        # An empty filter would match the whole catalog
+        if not attrs:
+            raise serializers.ValidationError('At least one filter criterion is required')
+        return attrs
+
+class ProductUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal(0), required=False)
+    originalPrice = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True, required=False)
+    inventory = serializers.IntegerField(min_value=0, required=False)
+    status = serializers.ChoiceField(choices=Product.STATUS_CHOICES, required=False)
+    category = serializers.CharField(max_length=100, required=False)
+    
+    def validate(self, attrs):
+        if len(attrs) == 1:
+            raise serializers.ValidationError('At least one field to update is required')
+        return attrs
+
+class ProductRuleValuesSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=Product.STATUS_CHOICES, required=False)
+    category = serializers.CharField(max_length=100, required=False)
+    originalPrice = serializers.DecimalField(max_digits=10, decimal_places=2, allow_null=True, required=False)
+
+class ProductRuleSerializer(serializers.Serializer):
+    """A set-based update, e.g. ``{"filter": {"category": "Shoes"}, "price_percent": 10}``"""
+    filter = ProductFilterSerializer()
+    price_percent = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=Decimal(-100), required=False)
+    price_amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    inventory_delta = serializers.IntegerField(required=False)
+    values = ProductRuleValuesSerializer(required=False)
+    
+    def validate(self, attrs):
+        if not set(attrs) - {'filter'} or attrs.get('values') == {}:
+            raise serializers.ValidationError('A rule needs a change to apply')
+        return attrs
+
+class ProductBulkSerializer(serializers.Serializer):
+    MAX_UPDATES = 1000
+    MAX_RULES = 50
+    
+    updates = ProductUpdateSerializer(many=True, required=False)
+    rules = ProductRuleSerializer(many=True, required=False)
+    delete = ProductFilterSerializer(required=False)
+    
+    def validate_updates(self, value):
+        if len(value) > self.MAX_UPDATES:
+            raise serializers.ValidationError(f'At most {self.MAX_UPDATES} updates are allowed per request')
+        if len({update['id'] for update in value}) != len(value):
+            raise serializers.ValidationError('Each product may only be updated once per request')
+        return value
+    
+    def validate_rules(self, value):
+        if len(value) > self.MAX_RULES:
+            raise serializers.ValidationError(f'At most {self.MAX_RULES} rules are allowed per request')
+        return value
+    
+    def validate(self, attrs):
+        if not any(attrs.get(key) for key in ['updates', 'rules', 'delete']):
+            raise serializers.ValidationError('Nothing to do: give updates, rules or delete')
+        return attrs
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -101,6 +254,15 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['createdAt', 'updatedAt']
 
+class BroadcastSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Broadcast
+        fields = '__all__'
+        read_only_fields = [
+            'status', 'total_recipients', 'sent_count', 'failed_count', 'cursor',
+            'createdAt', 'startedAt', 'completedAt'
+        ]
+
 class CartSerializer(serializers.ModelSerializer):
     total_price = serializers.ReadOnlyField()
     
@@ -113,6 +275,41 @@ class CartSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class CartOperationSerializer(serializers.Serializer):
+    OP_CHOICES = ['set', 'add', 'remove']
+    
+    op = serializers.ChoiceField(choices=OP_CHOICES)
+    product_id = serializers.CharField(max_length=100)
+    websiteSlug = serializers.CharField(max_length=200)
+    quantity = serializers.IntegerField(min_value=0, default=1)
+    product_name = serializers.CharField(max_length=200, required=False)
+    product_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    product_image = serializers.URLField(required=False, allow_blank=True)
+    product_sku = serializers.CharField(max_length=100, required=False)
+    websiteId = serializers.CharField(max_length=100, required=False)
+    websiteName = serializers.CharField(max_length=200, required=False)
+    
+    def validate(self, attrs):
+        # set/add may insert a new line, so they need the full product snapshot
+        if attrs['op'] != 'remove':
+            missing = [
+                field for field in ['product_name', 'product_price', 'product_sku', 'websiteId', 'websiteName']
+                if field not in attrs
+            ]
+            if missing:
+                raise serializers.ValidationError({field: 'This field is required.' for field in missing})
+        return attrs
+
+class CartBatchSerializer(serializers.Serializer):
+    MAX_OPERATIONS = 200
+    
+    operations = CartOperationSerializer(many=True, allow_empty=False)
+    
+    def validate_operations(self, value):
+        if len(value) > self.MAX_OPERATIONS:
+            raise serializers.ValidationError(f'At most {self.MAX_OPERATIONS} operations are allowed per batch')
+        return value
+
 class CheckoutSerializer(serializers.Serializer):
     customerName = serializers.CharField(max_length=200)
     customerEmail = serializers.EmailField()
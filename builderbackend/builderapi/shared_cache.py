@@ -0,0 +1,53 @@
+"""
+Cache for state every worker must see
+
+OTP attempt counters and used-code markers, rate limit counters, cached
+authenticated users and guest carts are only correct if all workers read and
+write the same entries and none are dropped early: a lost attempt counter
+lifts a lockout, a lost used marker lets a code verify twice. They use the
+``shared`` cache alias instead of ``default``, and a system check rejects
+per-process backends for it.
+"""
+
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from contextlib import contextmanager
+import time
+import uuid
+
+SHARED_CACHE_ALIAS = 'shared'
+
+# Used like django.core.cache.cache
+shared_cache = ConnectionProxy(caches, SHARED_CACHE_ALIAS)
+
+class SharedCacheBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The request could not be completed right now. Try again.'
+    default_code = 'busy'
+
+@contextmanager
+def shared_cache_lock(name, timeout=5):
+    """
+    Short mutual exclusion across workers built on the atomic ``cache.add``
+    
+    Wrap read-modify-write sequences on shared cache entries with it. The lock
+    holds a token unique to its holder, so a holder whose lock expired never
+    releases the lock another worker has taken since.
+    
+    Raises:
+        SharedCacheBusy: the lock was not free within ``timeout`` seconds
+    """
+    key = f'lock:{name}'
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + timeout
+    while not shared_cache.add(key, token, timeout):
+        if time.monotonic() > deadline:
+            raise SharedCacheBusy()
+        time.sleep(0.005)
+    try:
+        yield
+    finally:
+        if shared_cache.get(key) == token:
+            shared_cache.delete(key)
@@ -0,0 +1,24 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import invalidate_cached_user
+from .models import User, Website, WebsiteCustomer, BlogPost, Revision
+from .revisions import object_type
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_auth_user(sender, instance, **kwargs):
+    # Profile updates, verification and password changes all save the user
+    invalidate_cached_user(instance.pk)
+
+@receiver(post_delete, sender=WebsiteCustomer)
+def decrement_website_customer_count(sender, instance, **kwargs):
+    Website.objects.filter(pk=instance.website_id, customerCount__gt=0).update(
+        customerCount=F('customerCount') - 1
+    )
+
+@receiver(post_delete, sender=Website)
+@receiver(post_delete, sender=BlogPost)
+def delete_revisions(sender, instance, **kwargs):
+    Revision.objects.filter(objectType=object_type(instance), objectId=instance.pk).delete()
@@ -0,0 +1,186 @@
+"""
+Shared website templates
+
+Every website used to store its own copy of its template's name and
+metadata. A website now points at a Template row, one version of a template
+stored once under a hash of its content, and keeps only its own changes to
+it as a JSON Patch against ``{"id": ..., "name": ..., "metadata": ...}``.
+Most sites have none. The API still takes ``template_id``, ``template_name``
+and ``template_metadata`` and still shows the ``template`` object, with the
+template's ``version`` and ``hash`` added.
+
+Templates are public (see TemplateViewSet) and loaded by every worker, so
+only ``python manage.py register_template`` adds them. A site saved with a
+template id that is not registered keeps its template as overrides of the
+default template instead.
+
+Template rows never change once written. Each worker therefore loads them
+all on first use. After that it only fetches rows added since, and only when
+it meets an id it does not know or a write needs a template's newest version.
+Reading websites does not query templates.
+"""
+
+import json
+import threading
+
+from .json_patch import apply_json_patch, make_json_patch
+from .models import Template, WEBSITE_DOCUMENT_FIELDS
+
+DEFAULT_TEMPLATE = {'key': 'default', 'name': 'Default Template', 'metadata': {}}
+
+# API fields stored as templateVersion and templateOverrides
+TEMPLATE_FIELDS = ['template_id', 'template_name', 'template_metadata']
+
+class TemplateRegistry:
+    """In-process cache of Template rows, by id and newest version of each key"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+    
+    def clear(self):
+        """Forget every row; the next lookup loads them all again"""
+        self._by_id = {}
+        self._by_version = {}
+        self._latest = {}
+        self._last_id = 0
+    
+    def refresh(self):
+        """Load the rows added since the last load, all of them the first time"""
+        with self._lock:
+            for template in Template.objects.filter(pk__gt=self._last_id).order_by('pk'):
+                self._by_id[template.pk] = template
+                self._by_version[template.key, template.version] = template
+                newest = self._latest.get(template.key)
+                if newest is None or template.version > newest.version:
+                    self._latest[template.key] = template
+                self._last_id = template.pk
+    
+    def get(self, template_id):
+        """
+        The Template with this id
+        
+        Raises:
+            Template.DoesNotExist
+        """
+        template = self._by_id.get(template_id)
+        if template is None:
+            self.refresh()
+            template = self._by_id.get(template_id)
+            if template is None:
+                raise Template.DoesNotExist(f'No template with id {template_id}')
+        return template
+    
+    def get_version(self, key, version):
+        """One version of a template, None if there is no such version"""
+        template = self._by_version.get((key, version))
+        if template is None:
+            self.refresh()
+            template = self._by_version.get((key, version))
+        return template
+    
+    def latest(self, key):
+        """Newest version of a template, None if the key is not registered"""
+        self.refresh()
+        return self._latest.get(key)
+    
+    def all_latest(self):
+        """Newest version of every template, by key"""
+        self.refresh()
+        return sorted(self._latest.values(), key=lambda template: template.key)
+
+template_registry = TemplateRegistry()
+
+def template_document(template):
+    """What overrides are diffed against; the default template when ``template`` is None"""
+    if template is None:
+        return {'id': DEFAULT_TEMPLATE['key'], 'name': DEFAULT_TEMPLATE['name'], 'metadata': DEFAULT_TEMPLATE['metadata']}
+    return {'id': template.key, 'name': template.name, 'metadata': template.metadata}
+
+def template_payload(template, document=None):
+    """The ``template`` object of the API; ``document`` replaces the template's id, name and metadata"""
+    document = document or template_document(template)
+    return {
+        'id': document['id'],
+        'name': document['name'],
+        'version': template.version if template else None,
+        'hash': template.contentHash if template else None,
+        'metadata': document['metadata'],
+    }
+
+def website_template(website, expand=True):
+    """
+    A website's template with its overrides applied
+    
+    Without overrides the metadata is the registry's own copy; do not modify
+    it. With ``expand=False`` the shared template is described by reference
+    only: its own id and name, no metadata, and the site's ``overrides``.
+    """
+    template = template_registry.get(website.templateVersion_id) if website.templateVersion_id else None
+    if not expand:
+        payload = template_payload(template)
+        del payload['metadata']
+        payload['overrides'] = website.templateOverrides
+        return payload
+    document = template_document(template)
+    if website.templateOverrides:
+        document = apply_json_patch(document, website.templateOverrides)
+    return template_payload(template, document)
+
+def website_documents(website):
+    """Current value of every WEBSITE_DOCUMENT_FIELDS field, for json_patch.patch_fields"""
+    return {
+        field: website_template(website)['metadata'] if field == 'template_metadata' else getattr(website, field)
+        for field in WEBSITE_DOCUMENT_FIELDS
+    }
+
+def resolve_template(key, name, metadata, current=None):
+    """
+    Store a template as a shared version plus the smallest overrides
+    
+    The content is diffed against the newest version of ``key`` and against
+    ``current`` (the version the site is on) when it has the same key. Site
+    content never registers a template: with an unregistered key it is kept
+    as overrides of the default template.
+    
+    Returns:
+        dict: values for the templateVersion and templateOverrides columns
+    """
+    document = {'id': key, 'name': name, 'metadata': metadata}
+    candidates = [current] if current is not None and current.key == key else []
+    latest = template_registry.latest(key)
+    if latest is not None and latest not in candidates:
+        candidates.append(latest)
+    if not candidates:
+        return {'templateVersion': None, 'templateOverrides': make_json_patch(template_document(None), document)}
+    
+    # The current version wins ties, so saving unchanged content never moves a site
+    best = None
+    for template in candidates:
+        overrides = make_json_patch(template_document(template), document)
+        if best is None or len(json.dumps(overrides)) < len(json.dumps(best[1])):
+            best = template, overrides
+    return {'templateVersion': best[0], 'templateOverrides': best[1]}
+
+def template_changes(website, changes):
+    """
+    Replace the API template fields in ``changes`` by the columns storing them
+    
+    Fields that are not given keep the website's current values (the default
+    template's for a new site, ``website`` None). ``changes`` is updated in place.
+    """
+    given = {field: changes.pop(field) for field in TEMPLATE_FIELDS if field in changes}
+    if not given:
+        return changes
+    
+    current = None
+    if website is not None and website.templateVersion_id:
+        current = template_registry.get(website.templateVersion_id)
+    existing = website_template(website) if website is not None else template_payload(None)
+    changes.update(resolve_template(
+        given.get('template_id', existing['id']),
+        given.get('template_name', existing['name']),
+        given.get('template_metadata', existing['metadata']),
+        current,
+    ))
+    return changes
@@ -1,3 +1,1339 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, make_password
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import io
+import json
+import tempfile
+import time
 
-# Create your tests here.
+from .authentication import user_cache_key
+from .autosave import flush_autosave, get_pending, overlay_pending
+from .checks import check_shared_cache
+from .customer_import import CustomerImporter
+from .fields import compress, decompress, zstandard
+from .guest_cart import apply_guest_operations, get_guest_cart, read_cart_token
+from .json_patch import (
+    JSONPatchError, JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE,
+    apply_json_patch, apply_merge_patch, make_json_patch, patch_fields,
+)
+from .json_schema import SchemaError, compile_schema, request_body_size, website_content_errors
+from .email_utils import (
+    EmailTemplate, claim_outbox_batch, deliver_queued_emails, queue_template_email, render_email, render_emails,
+    send_broadcast,
+)
+from .models import (
+    User, Website, WebsiteCustomer, PendingAutosave, Product, BlogPost, Cart, Order, OutboxEmail, Broadcast,
+    RevokedToken, Template, AbandonedCartStat,
+)
+from .otp_utils import OTP_EXPIRED, OTP_INVALID, OTP_LOCKED, OTP_USED, OTP_VALID, check_otp, describe_otp_lifetime, generate_otp
+from .password_hashing import PasswordHashingBusy, aauthenticate, amake_password, password_hashing_pool
+from .revisions import reconstruct, record_revision, revisions_for
+from .serializers import WebsiteSerializer
+from .template_registry import template_registry
+from .shared_cache import SharedCacheBusy, shared_cache, shared_cache_lock
+from .throttling import get_client_ip, hit
+from .token_revocation import BloomFilter, revocation_filter
+from .views import customer_signup, customer_signup_async, login_async, register, register_async
+
+class JSONPatchTests(SimpleTestCase):
+    def test_operations(self):
+        document = {'blocks': [{'text': 'a'}, {'text': 'b'}], 'title': 'T'}
+        patched = apply_json_patch(document, [
+            {'op': 'replace', 'path': '/blocks/0/text', 'value': 'x'},
+            {'op': 'add', 'path': '/blocks/-', 'value': {'text': 'c'}},
+            {'op': 'move', 'from': '/title', 'path': '/name'},
+            {'op': 'copy', 'from': '/name', 'path': '/slug'},
+            {'op': 'remove', 'path': '/blocks/1'},
+            {'op': 'test', 'path': '/slug', 'value': 'T'},
+        ])
+        self.assertEqual(patched, {'blocks': [{'text': 'x'}, {'text': 'c'}], 'name': 'T', 'slug': 'T'})
+        # The input is never modified
+        self.assertEqual(document['blocks'][0], {'text': 'a'})
+    
+    def test_escaped_pointer(self):
+        self.assertEqual(apply_json_patch({'a/b': {'~': 1}}, [{'op': 'replace', 'path': '/a~1b/~0', 'value': 2}]), {'a/b': {'~': 2}})
+    
+    def test_errors(self):
+        invalid = [
+            {'op': 'add', 'path': '/a'},
+            {'op': 'remove', 'path': '/missing'},
+            {'op': 'replace', 'path': '/list/5', 'value': 1},
+            {'op': 'add', 'path': '/list/01', 'value': 1},
+            {'op': 'move', 'from': '/obj', 'path': '/obj/inner'},
+            {'op': 'copy', 'path': '/a'},
+            {'op': 'test', 'path': '/flag', 'value': 1},
+            {'op': 'frobnicate', 'path': '/a'},
+            {'op': 'add', 'path': 'a', 'value': 1},
+            {'op': 'remove', 'path': ''},
+        ]
+        document = {'list': [1], 'obj': {}, 'flag': True}
+        for operation in invalid:
+            with self.subTest(operation=operation):
+                with self.assertRaises(JSONPatchError):
+                    apply_json_patch(document, [operation])
+        with self.assertRaises(JSONPatchError):
+            apply_json_patch(document, {'op': 'remove', 'path': '/flag'})
+    
+    def test_failed_patch_applies_nothing(self):
+        document = {'a': 1}
+        with self.assertRaises(JSONPatchError):
+            apply_json_patch(document, [{'op': 'replace', 'path': '/a', 'value': 2}, {'op': 'remove', 'path': '/b'}])
+        self.assertEqual(document, {'a': 1})
+    
+    def test_merge_patch(self):
+        self.assertEqual(
+            apply_merge_patch({'a': 1, 'b': {'c': 2, 'd': 3}, 'e': [1]}, {'a': None, 'b': {'c': None, 'f': 4}, 'e': [2]}),
+            {'b': {'d': 3, 'f': 4}, 'e': [2]},
+        )
+    
+    def test_make_json_patch_round_trip(self):
+        old = {'blocks': [{'id': i, 'text': 't'} for i in range(20)], 'theme': {'color': 'red', 'font': 'a'}}
+        new = json.loads(json.dumps(old))
+        new['blocks'][7]['text'] = 'u'
+        del new['blocks'][12]
+        new['theme'] = {'color': 'blue', 'size': 2}
+        patch = make_json_patch(old, new)
+        self.assertEqual(apply_json_patch(old, patch), new)
+        self.assertEqual(make_json_patch(old, old), [])
+        # 1 and true are different JSON values
+        self.assertEqual(make_json_patch({'a': 1}, {'a': True}), [{'op': 'replace', 'path': '/a', 'value': True}])
+    
+    def test_patch_fields(self):
+        documents = {'theme': {'color': 'red'}, 'contentBlocks': []}
+        self.assertEqual(
+            patch_fields(documents, JSON_PATCH_MEDIA_TYPE, [{'op': 'add', 'path': '/contentBlocks/-', 'value': {'type': 'hero'}}]),
+            {'contentBlocks': [{'type': 'hero'}]},
+        )
+        self.assertEqual(patch_fields(documents, MERGE_PATCH_MEDIA_TYPE, {'theme': {'font': 'a'}}), {'theme': {'color': 'red', 'font': 'a'}})
+        for media_type, patch in [
+            (JSON_PATCH_MEDIA_TYPE, [{'op': 'replace', 'path': '/name', 'value': 'x'}]),
+            (JSON_PATCH_MEDIA_TYPE, [{'op': 'replace', 'path': '', 'value': {}}]),
+            (JSON_PATCH_MEDIA_TYPE, [{'op': 'move', 'from': '/theme/color', 'path': '/contentBlocks/0'}]),
+            (MERGE_PATCH_MEDIA_TYPE, [{'theme': {}}]),
+        ]:
+            with self.subTest(patch=patch):
+                with self.assertRaises(JSONPatchError):
+                    patch_fields(documents, media_type, patch)
+
+class WebsiteConcurrencyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.website = Website.objects.create(user=self.user, name='Site', slug='site', category='other')
+        self.url = f'/api/websites/{self.website.id}/'
+    
+    def test_etag_and_if_match(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['ETag'], '"1"')
+        
+        response = self.client.patch(self.url, {'name': 'A'}, format='json')
+        self.assertEqual(response.status_code, 428)
+        
+        response = self.client.patch(self.url, {'name': 'A'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        
+        # A stale copy is refused and changes nothing
+        response = self.client.patch(self.url, {'name': 'B'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(Website.objects.get(pk=self.website.pk).name, 'A')
+        
+        response = self.client.patch(self.url, {'name': 'C'}, format='json', HTTP_IF_MATCH='W/"2"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.patch(self.url, {'name': 'D'}, format='json', HTTP_IF_MATCH='*').status_code, 200)
+        self.assertEqual(self.client.patch(self.url, {'name': 'E'}, format='json', HTTP_IF_MATCH='garbage').status_code, 412)
+    
+    def test_json_patch_request(self):
+        operations = [{'op': 'add', 'path': '/theme/primaryColor', 'value': '#000'}]
+        response = self.client.patch(self.url, json.dumps(operations), content_type=JSON_PATCH_MEDIA_TYPE)
+        self.assertEqual(response.status_code, 428)
+        
+        response = self.client.patch(self.url, json.dumps(operations), content_type=JSON_PATCH_MEDIA_TYPE, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], ['theme'])
+        self.assertEqual(Website.objects.get(pk=self.website.pk).theme, {'primaryColor': '#000'})
+        
+        response = self.client.patch(self.url, json.dumps(operations), content_type=JSON_PATCH_MEDIA_TYPE, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 412)
+        
+        operations = [{'op': 'remove', 'path': '/theme/missing'}]
+        response = self.client.patch(self.url, json.dumps(operations), content_type=JSON_PATCH_MEDIA_TYPE, HTTP_IF_MATCH='"2"')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_own_autosave_keeps_etag_valid(self):
+        response = self.client.post(f'{self.url}autosave/', {'heroTitle': 'Draft'}, format='json')
+        self.assertEqual(response['ETag'], '"2"')
+        
+        response = self.client.patch(self.url, {'name': 'A'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        website = Website.objects.get(pk=self.website.pk)
+        self.assertEqual((website.heroTitle, website.name, website.version), ('Draft', 'A', 3))
+    
+    @override_settings(REQUIRE_IF_MATCH=False)
+    def test_if_match_optional(self):
+        self.assertEqual(self.client.patch(self.url, {'name': 'A'}, format='json').status_code, 200)
+
+class VersionedModelTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.website = Website.objects.create(user=self.user, name='Site', slug='site', category='other')
+    
+    def test_product_versions(self):
+        product = Product.objects.create(
+            website=self.website, name='P', slug='p', description='d', price='1.00', category='c', sku='P1'
+        )
+        url = f'/api/products/{product.id}/'
+        response = self.client.patch(url, {'price': '2.00'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 2)
+        # Set-based bulk changes bump the version too
+        self.client.post('/api/products/bulk/', {'updates': [{'id': product.id, 'price': '3.00'}]}, format='json')
+        self.assertEqual(Product.objects.get(pk=product.pk).version, 3)
+        self.assertEqual(self.client.patch(url, {'price': '4.00'}, format='json', HTTP_IF_MATCH='"2"').status_code, 412)
+    
+    def test_blog_post_versions(self):
+        post = BlogPost.objects.create(website=self.website, title='T', slug='t', content='c', author='a')
+        url = f'/api/blogs/{post.id}/'
+        self.assertEqual(self.client.patch(url, {'title': 'U'}, format='json', HTTP_IF_MATCH='"1"').status_code, 200)
+        self.assertEqual(self.client.patch(url, {'title': 'V'}, format='json', HTTP_IF_MATCH='"1"').status_code, 412)
+        self.assertEqual(BlogPost.objects.get(pk=post.pk).title, 'U')
+
+class ContentSchemaTests(SimpleTestCase):
+    def test_compiled_schema(self):
+        validate = compile_schema({
+            'type': 'array',
+            'maxItems': 2,
+            'items': {
+                'type': 'object',
+                'required': ['type'],
+                'properties': {'type': {'enum': ['hero', 'text']}, 'order': {'type': 'integer', 'minimum': 0}},
+                'additionalProperties': False,
+            },
+        })
+        validate([{'type': 'hero', 'order': 1}])
+        cases = [
+            ({}, '', 'must be an array'),
+            ([{'type': 'x'}], '0/type', 'must be one of "hero", "text"'),
+            ([{'type': 'hero'}, {'order': 1}], '1', 'type is required'),
+            ([{'type': 'text', 'order': True}], '0/order', 'must be an integer'),
+            ([{'type': 'text', 'order': -1}], '0/order', 'must be between 0 and inf'),
+            ([{'type': 'text', 'extra': 1}], '0', 'extra is not allowed'),
+            ([{'type': 'text'}] * 3, '', 'must have at most 2 items'),
+        ]
+        for value, path, message in cases:
+            with self.subTest(value=value):
+                with self.assertRaises(SchemaError) as raised:
+                    validate(value)
+                self.assertEqual('/'.join(map(str, raised.exception.path)), path)
+                self.assertEqual(raised.exception.message, message)
+    
+    def test_unsupported_keyword(self):
+        with self.assertRaises(ValueError):
+            compile_schema({'type': 'string', 'pattern': '^a'})
+    
+    def test_website_content_errors(self):
+        self.assertEqual(website_content_errors({'theme': {'primaryColor': '#000'}, 'name': 'not a document'}), {})
+        errors = website_content_errors({'contentBlocks': [{'type': 1}], 'services': 'x'})
+        self.assertEqual(errors, {'contentBlocks': 'contentBlocks/0/type: must be a string', 'services': 'services: must be an array'})
+    
+    @override_settings(WEBSITE_CONTENT_MAX_BYTES={'theme': 20})
+    def test_size_limit(self):
+        theme = {'primaryColor': '#000000'}
+        self.assertEqual(website_content_errors({'theme': theme}), {'theme': 'must be at most 20 bytes of JSON, not 26'})
+        # A body within the limit cannot hold a larger field, so it is not measured again
+        self.assertEqual(website_content_errors({'theme': theme}, body_size=20), {})
+        self.assertIn('theme', website_content_errors({'theme': theme}, body_size=100))
+    
+    def test_request_body_size(self):
+        request = APIRequestFactory().post('/', {'a': 1}, format='json')
+        self.assertEqual(request_body_size(request), len(request.body))
+        for header in (None, '', 'chunked', '-1'):
+            with self.subTest(header=header):
+                if header is None:
+                    request.META.pop('CONTENT_LENGTH', None)
+                else:
+                    request.META['CONTENT_LENGTH'] = header
+                self.assertIsNone(request_body_size(request))
+
+class WebsiteSerializerSizeTests(TestCase):
+    @override_settings(WEBSITE_CONTENT_MAX_BYTES={'theme': 20})
+    def test_missing_content_length_still_checks_size(self):
+        data = {'name': 'S', 'slug': 's', 'category': 'other', 'theme': {'primaryColor': '#000000'}}
+        request = APIRequestFactory().post('/api/websites/', data, format='json')
+        del request.META['CONTENT_LENGTH']
+        serializer = WebsiteSerializer(data=data, context={'request': Request(request)})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('theme', serializer.errors)
+
+class BloomFilterTests(SimpleTestCase):
+    def test_membership(self):
+        bloom = BloomFilter(1000, error_rate=0.01)
+        added = [f'jti-{i}' for i in range(1000)]
+        for item in added:
+            bloom.add(item)
+        # No false negatives
+        self.assertTrue(all(item in bloom for item in added))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+        self.assertEqual(bloom.count, 1000)
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.refresh.access_token}')
+    
+    def test_logout_revokes_both_tokens(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        response = self.client.post('/api/auth/logout/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+        response = APIClient().post('/api/auth/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+    
+    def test_refresh_rotation_revokes_the_old_token(self):
+        response = APIClient().post('/api/auth/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('refresh', response.json())
+        response = APIClient().post('/api/auth/refresh/', {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 401)
+    
+    def test_revocations_by_other_processes_are_synced(self):
+        self.assertFalse(revocation_filter.is_revoked('elsewhere'))
+        RevokedToken.objects.create(jti='elsewhere', expires_at=timezone.now() + timedelta(hours=1))
+        revocation_filter.next_sync = 0
+        self.assertTrue(revocation_filter.is_revoked('elsewhere'))
+
+class OTPTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='c@x.com', email='c@x.com', password='pw', firstName='C', lastName='X')
+        self.website = Website.objects.create(user=self.user, name='Shop', slug='shop')
+    
+    def test_codes_are_single_use(self):
+        code = generate_otp(self.user)
+        self.assertEqual(check_otp(self.user, code), OTP_VALID)
+        self.assertEqual(check_otp(self.user, code), OTP_USED)
+    
+    def test_lockout_survives_a_cleared_default_cache(self):
+        for _ in range(5):
+            self.assertEqual(check_otp(self.user, 'nope'), OTP_INVALID)
+        caches['default'].clear()
+        self.assertEqual(check_otp(self.user, generate_otp(self.user)), OTP_LOCKED)
+    
+    def test_used_marker_survives_a_cleared_default_cache(self):
+        code = generate_otp(self.user)
+        self.assertEqual(check_otp(self.user, code), OTP_VALID)
+        caches['default'].clear()
+        self.assertEqual(check_otp(self.user, code), OTP_USED)
+    
+    def test_old_codes_are_reported_as_expired(self):
+        with mock.patch('builderapi.otp_utils.time', **{'time.return_value': time.time() - 3600}):
+            code = generate_otp(self.user)
+        self.assertEqual(check_otp(self.user, code), OTP_EXPIRED)
+    
+    def test_lifetime_in_email_matches_the_accepted_window(self):
+        self.assertEqual(describe_otp_lifetime(), '10 to 15 minutes')
+        with override_settings(OTP_VALID_STEPS=1):
+            self.assertEqual(describe_otp_lifetime(), 'up to 5 minutes')
+    
+    @override_settings(RATE_LIMITS={'customer_verify_otp': {'email': '2/h'}})
+    def test_customer_verify_otp_is_rate_limited(self):
+        data = {'email': self.user.email, 'otp': '000000', 'website_slug': 'shop'}
+        for _ in range(2):
+            self.assertEqual(APIClient().post('/api/customer-auth/verify-otp/', data, format='json').status_code, 400)
+        self.assertEqual(APIClient().post('/api/customer-auth/verify-otp/', data, format='json').status_code, 429)
+
+class SharedCacheCheckTests(SimpleTestCase):
+    def check_ids(self):
+        return [message.id for message in check_shared_cache(None)]
+    
+    def test_per_process_cache_is_rejected(self):
+        with override_settings(CACHES={**settings.CACHES, 'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual(self.check_ids(), ['builderapi.E005'])
+    
+    def test_missing_alias_is_rejected(self):
+        with override_settings(CACHES={'default': settings.CACHES['default']}):
+            self.assertEqual(self.check_ids(), ['builderapi.E004'])
+    
+    def test_configured_cache_passes(self):
+        self.assertEqual(self.check_ids(), [])
+
+class RateLimitTests(TestCase):
+    def test_sliding_window_counts_the_previous_window(self):
+        with mock.patch('builderapi.throttling.time', **{'time.return_value': 1000 * 60 + 59}):
+            for _ in range(10):
+                self.assertTrue(hit('test', 10, 60).allowed)
+            self.assertFalse(hit('test', 10, 60).allowed)
+        # Half of the next window: 11 * 0.5 earlier requests still count
+        with mock.patch('builderapi.throttling.time', **{'time.return_value': 1001 * 60 + 30}):
+            results = [hit('test', 10, 60) for _ in range(5)]
+        self.assertEqual([result.allowed for result in results], [True, True, True, True, False])
+        self.assertGreater(results[-1].retry_after, 0)
+    
+    def test_counters_survive_a_cleared_default_cache(self):
+        self.assertTrue(hit('test', 1, 3600).allowed)
+        caches['default'].clear()
+        self.assertFalse(hit('test', 1, 3600).allowed)
+    
+    def test_forwarded_for_header_does_not_pick_the_key(self):
+        factory = APIRequestFactory()
+        request = factory.get('/', HTTP_X_FORWARDED_FOR='203.0.113.9', REMOTE_ADDR='198.51.100.1')
+        self.assertEqual(get_client_ip(Request(request)), '198.51.100.1')
+    
+    @override_settings(RATE_LIMITS={'login': {'ip': '2/h'}})
+    def test_login_is_limited_per_ip_with_headers(self):
+        data = {'email': 'nobody@x.com', 'password': 'pw'}
+        for forwarded in ('203.0.113.1', '203.0.113.2'):
+            response = APIClient().post('/api/auth/login/', data, format='json', HTTP_X_FORWARDED_FOR=forwarded)
+            self.assertNotEqual(response.status_code, 429)
+            self.assertIn('RateLimit-Remaining', response)
+        response = APIClient().post('/api/auth/login/', data, format='json', HTTP_X_FORWARDED_FOR='203.0.113.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+    
+    def test_cached_user_is_served_without_a_user_query(self):
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/auth/profile/').status_code, 200)
+        user_queries = [query['sql'] for query in queries if 'FROM "builderapi_user"' in query['sql']]
+        # Only the deferred addresses the serializer reads
+        self.assertEqual(len(user_queries), 1)
+        self.assertIn('"builderapi_user"."addresses" FROM', user_queries[0])
+    
+    def test_profile_changes_take_effect_on_the_next_request(self):
+        self.client.get('/api/auth/profile/')
+        self.user.firstName = 'Changed'
+        self.user.save()
+        caches['default'].clear()
+        self.assertEqual(self.client.get('/api/auth/profile/').json()['firstName'], 'Changed')
+    
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/auth/profile/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/profile/').status_code, 401)
+    
+    def test_evicted_version_does_not_revive_an_old_entry(self):
+        self.client.get('/api/auth/profile/')
+        stale_key = user_cache_key(self.user.pk)
+        shared_cache.delete(f'auth_user_version:{self.user.pk}')
+        self.assertNotEqual(user_cache_key(self.user.pk), stale_key)
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.owner, name='Shop', slug='shop')
+        self.product = Product.objects.create(website=self.website, name='Mug', slug='mug', description='d', price='4.00', category='c', sku='M1')
+        self.order = {
+            'customerName': 'C', 'customerEmail': 'c@x.com', 'customerPhone': '1', 'customerAddress': 'A',
+            'customerCity': 'C', 'customerZipCode': 'Z', 'websiteSlug': 'shop', 'websiteName': 'Shop',
+        }
+    
+    def add(self, token=None, quantity=1, price='0.01'):
+        operation = {'op': 'add', 'product_id': str(self.product.pk), 'websiteSlug': 'shop', 'quantity': quantity, 'product_price': price}
+        return apply_guest_operations(token, [operation])
+    
+    def test_cart_is_shared_and_adds_up(self):
+        token, _ = self.add(quantity=2)
+        token, _ = self.add(token, quantity=3)
+        caches['default'].clear()
+        self.assertEqual([line['quantity'] for line in get_guest_cart(token)], [5])
+        self.assertEqual(get_guest_cart(token + 'x'), [])
+    
+    def test_writes_wait_for_the_cart_lock(self):
+        token, _ = self.add()
+        with shared_cache_lock(f'guest_cart:{read_cart_token(token)}'):
+            with mock.patch('builderapi.shared_cache.time', **{'monotonic.side_effect': [0, 10]}):
+                with self.assertRaises(SharedCacheBusy):
+                    self.add(token)
+        self.add(token)
+        self.assertEqual(get_guest_cart(token)[0]['quantity'], 2)
+    
+    def test_order_from_guest_cart_is_priced_from_products(self):
+        token, _ = self.add(quantity=3)
+        response = APIClient().post('/api/orders/create_order/', self.order, format='json', HTTP_X_CART_TOKEN=token)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(float(response.json()['total']), 12.0)
+        self.assertEqual(get_guest_cart(token), [])
+    
+    def test_client_items_are_priced_from_products(self):
+        items = [{'product_id': str(self.product.pk), 'name': 'Free mug', 'price': 0.01, 'quantity': 2}]
+        response = APIClient().post('/api/orders/create_order/', {**self.order, 'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(float(response.json()['total']), 8.0)
+        self.assertEqual(response.json()['items'][0]['name'], 'Mug')
+    
+    def test_unknown_client_items_are_rejected(self):
+        other = Website.objects.create(user=self.owner, name='Other', slug='other')
+        foreign = Product.objects.create(website=other, name='Cup', slug='cup', description='d', price='1.00', category='c', sku='C1')
+        items = [{'product_id': str(foreign.pk), 'price': 1, 'quantity': 1}]
+        response = APIClient().post('/api/orders/create_order/', {**self.order, 'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['product_ids'], [str(foreign.pk)])
+        items = [{'product_id': str(self.product.pk), 'quantity': -1}]
+        response = APIClient().post('/api/orders/create_order/', {**self.order, 'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+class CartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.line = {
+            'product_id': '7', 'websiteSlug': 'shop', 'product_name': 'Mug', 'product_price': '4.00',
+            'product_sku': 'M1', 'websiteId': '1', 'websiteName': 'Shop',
+        }
+    
+    def test_add_item_is_one_statement(self):
+        with self.assertNumQueries(1):
+            item, created = Cart.objects.add_item(self.user, quantity=2, **self.line)
+        self.assertTrue(created)
+        with self.assertNumQueries(1):
+            again, created = Cart.objects.add_item(self.user, quantity=3, **self.line)
+        self.assertFalse(created)
+        self.assertEqual((again.pk, again.quantity, again.product_price), (item.pk, 5, Decimal('4.00')))
+        self.assertEqual(Cart.objects.get().quantity, 5)
+    
+    def test_add_item_keeps_the_first_snapshot(self):
+        Cart.objects.add_item(self.user, **self.line)
+        item, _ = Cart.objects.add_item(self.user, **{**self.line, 'product_name': 'Renamed'})
+        self.assertEqual((item.product_name, item.quantity), ('Mug', 2))
+    
+    def test_batch_operations(self):
+        Cart.objects.add_item(self.user, quantity=2, **self.line)
+        other = {**self.line, 'product_id': '8'}
+        Cart.objects.apply_operations(self.user, [
+            {'op': 'add', **self.line, 'quantity': 1},
+            {'op': 'set', **other, 'quantity': 4},
+            {'op': 'add', **other, 'quantity': 1},
+        ])
+        self.assertEqual(dict(Cart.objects.values_list('product_id', 'quantity')), {'7': 3, '8': 5})
+        Cart.objects.apply_operations(self.user, [{'op': 'remove', **self.line}, {'op': 'set', **other, 'quantity': 0}])
+        self.assertFalse(Cart.objects.exists())
+
+class SignupOutboxTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=owner, name='Shop', slug='shop')
+        self.register_data = {
+            'firstName': 'N', 'lastName': 'U', 'email': 'new@x.com',
+            'password': 'a-Long-passw0rd', 'confirmPassword': 'a-Long-passw0rd',
+        }
+        self.signup_data = {'email': 'new@x.com', 'password': 'a-Long-passw0rd', 'name': 'N U', 'website_slug': 'shop'}
+    
+    def test_signups_queue_the_otp_email(self):
+        for view, data in ((register, self.register_data), (customer_signup, self.signup_data)):
+            User.objects.filter(email='new@x.com').delete()
+            response = view(APIRequestFactory().post('/', data, format='json'))
+            self.assertEqual(response.status_code, 201)
+            message = OutboxEmail.objects.filter(to_email='new@x.com').latest('id')
+            self.assertEqual(message.template, 'otp_verification')
+            self.assertEqual(message.context['otp_expires_in'], '10 to 15 minutes')
+    
+    def test_failed_email_queue_leaves_no_account(self):
+        cases = (
+            (register, self.register_data), (customer_signup, self.signup_data),
+            (register_async, self.register_data), (customer_signup_async, self.signup_data),
+        )
+        with mock.patch('builderapi.email_utils.OutboxEmail.objects.create', side_effect=RuntimeError('down')):
+            for view, data in cases:
+                request = APIRequestFactory().post('/', data, format='json')
+                response = async_to_sync(view)(request) if view in (register_async, customer_signup_async) else view(request)
+                self.assertEqual(response.status_code, 500)
+                self.assertFalse(User.objects.filter(email='new@x.com').exists())
+        self.assertFalse(WebsiteCustomer.objects.filter(website=self.website).exists())
+    
+    def test_async_signup_creates_the_account(self):
+        response = self.client.post('/api/customer-auth/signup/', self.signup_data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(WebsiteCustomer.objects.filter(website=self.website, user__email='new@x.com').exists())
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.message = queue_template_email('otp_verification', 'c@x.com', {
+            'user_name': 'C <X>', 'user_email': 'c@x.com', 'otp_code': '123456', 'otp_expires_in': '10 to 15 minutes',
+        })
+    
+    def test_claimed_rows_are_not_claimed_again(self):
+        self.assertEqual([row.id for row in claim_outbox_batch(10)], [self.message.id])
+        self.assertEqual(claim_outbox_batch(10), [])
+        # An expired lease makes the row due again
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([row.id for row in claim_outbox_batch(10)], [self.message.id])
+    
+    def test_delivery_renders_the_template(self):
+        self.assertEqual(deliver_queued_emails()['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('123456', mail.outbox[0].subject)
+        self.assertIn('expires in 10 to 15 minutes', mail.outbox[0].body)
+        self.assertIn('C &lt;X&gt;', mail.outbox[0].alternatives[0][0])
+        self.assertEqual(OutboxEmail.objects.get().status, 'sent')
+    
+    def test_failed_sends_are_retried_with_backoff(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('refused')):
+            self.assertEqual(deliver_queued_emails()['retried'], 1)
+        message = OutboxEmail.objects.get()
+        self.assertEqual((message.status, message.attempts), ('pending', 1))
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        self.assertEqual(claim_outbox_batch(10), [])
+
+class CustomerImportTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='Owner@X.com', email='Owner@X.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.owner, name='Shop', slug='shop')
+    
+    def run_import(self, rows, **options):
+        return CustomerImporter(chunk_size=2, hash_workers=1, website=self.website, **options).run(enumerate(rows, 1))
+    
+    def test_existing_accounts_match_case_insensitively(self):
+        result = self.run_import([{'email': 'owner@x.com'}, {'email': 'OWNER@x.com'}, {'email': 'new@x.com', 'name': 'N U'}])
+        self.assertEqual((result.created, result.existing, result.duplicates), (1, 1, 1))
+        self.assertEqual(User.objects.filter(email__iexact='owner@x.com').count(), 1)
+        self.assertEqual(self.website.customers.count(), 2)
+        self.website.refresh_from_db()
+        self.assertEqual(self.website.customerCount, 2)
+    
+    def test_passwords_and_invalid_rows(self):
+        encoded = make_password('secret')
+        result = self.run_import([
+            {'email': 'a@x.com', 'password_hash': encoded},
+            {'email': 'b@x.com', 'password': 'plain'},
+            {'email': 'c@x.com'},
+            {'email': 'not an email'},
+        ])
+        self.assertEqual((result.created, len(result.errors)), (3, 1))
+        self.assertTrue(User.objects.get(email='a@x.com').check_password('secret'))
+        self.assertTrue(User.objects.get(email='b@x.com').check_password('plain'))
+        self.assertFalse(User.objects.get(email='c@x.com').has_usable_password())
+    
+    def test_verification_emails_and_dry_run(self):
+        self.run_import([{'email': 'a@x.com'}], dry_run=True)
+        self.assertFalse(User.objects.filter(email='a@x.com').exists())
+        self.run_import([{'email': 'a@x.com'}], send_verification=True)
+        self.assertEqual(OutboxEmail.objects.get().context['otp_expires_in'], '10 to 15 minutes')
+
+class BroadcastTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=owner, name='Shop', slug='shop')
+        for email in ('c@x.com', 'a@x.com', 'b@x.com'):
+            customer = User.objects.create_user(username=email, email=email, password='pw', firstName='C', lastName='X')
+            WebsiteCustomer.objects.record(self.website, customer)
+        # Orders alone do not make someone a recipient
+        Order.objects.create(
+            website=self.website, websiteSlug='shop', websiteName='Shop', items=[], total=0, customerName='G',
+            customerEmail='guest@x.com', customerPhone='1', customerAddress='A', customerCity='C', customerZipCode='Z',
+        )
+        self.broadcast = Broadcast.objects.create(website=self.website, subject='News', text_body='Hello', status='queued')
+    
+    def test_membership_is_counted_once(self):
+        WebsiteCustomer.objects.record(self.website, User.objects.get(email='a@x.com'))
+        self.website.refresh_from_db()
+        self.assertEqual(self.website.customerCount, 3)
+    
+    def test_sends_to_members_in_chunks(self):
+        broadcast = send_broadcast(self.broadcast, chunk_size=1, pool_size=2)
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.total_recipients), ('sent', 3, 3))
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@x.com', 'b@x.com', 'c@x.com'])
+        self.assertEqual(broadcast.cursor, 'c@x.com')
+    
+    def test_resumes_after_the_cursor(self):
+        Broadcast.objects.filter(pk=self.broadcast.pk).update(cursor='a@x.com')
+        self.broadcast.refresh_from_db()
+        send_broadcast(self.broadcast, chunk_size=10, pool_size=1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['b@x.com', 'c@x.com'])
+
+@override_settings(REQUIRE_IF_MATCH=False)
+class AutosaveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.website = Website.objects.create(user=self.user, name='Site', slug='site', category='other', theme={'color': 'red'})
+        self.url = f'/api/websites/{self.website.id}/'
+    
+    def autosave(self, data, **kwargs):
+        return self.client.post(f'{self.url}autosave/', data, format='json', **kwargs)
+    
+    def test_each_autosave_is_one_write_statement(self):
+        for index in range(5):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.autosave({'heroTitle': f'T{index}', 'heroDescription': 'D'})
+            writes = [query['sql'] for query in queries if query['sql'].split(' ', 1)[0] in ('INSERT', 'UPDATE', 'DELETE')]
+            self.assertEqual(len(writes), 1, writes)
+            self.assertIn('ON CONFLICT', writes[0])
+        self.assertEqual(response.json(), {'id': self.website.id, 'flushed': False, 'pending': ['heroDescription', 'heroTitle'], 'version': 2})
+        self.assertEqual(PendingAutosave.objects.count(), 2)
+        self.assertEqual(Website.objects.get(pk=self.website.pk).heroTitle, '')
+    
+    def test_reads_overlay_the_buffer(self):
+        self.autosave({'heroTitle': 'T'})
+        response = self.client.get(self.url)
+        self.assertEqual((response.json()['heroTitle'], response['ETag']), ('T', '"2"'))
+        self.assertEqual(self.client.get('/api/websites/').json()['results'][0]['heroTitle'], 'T')
+    
+    def test_patches_build_on_buffered_values(self):
+        self.autosave({'theme': {'color': 'blue'}})
+        self.client.generic('POST', f'{self.url}autosave/', json.dumps({'theme': {'font': 'serif'}}), content_type='application/merge-patch+json')
+        self.assertEqual(get_pending(self.website.pk)['theme'], {'color': 'blue', 'font': 'serif'})
+    
+    def test_old_buffer_is_flushed_by_the_next_autosave(self):
+        self.autosave({'heroTitle': 'T'})
+        PendingAutosave.objects.update(createdAt=timezone.now() - timedelta(seconds=11))
+        response = self.autosave({'heroDescription': 'D'})
+        self.assertEqual(response.json()['flushed'], True)
+        website = Website.objects.get(pk=self.website.pk)
+        self.assertEqual((website.heroTitle, website.heroDescription, website.version), ('T', 'D', 2))
+        self.assertFalse(PendingAutosave.objects.exists())
+        # One revision for the coalesced edits
+        self.assertEqual(revisions_for(website).count(), 1)
+    
+    def test_saves_and_the_command_flush(self):
+        self.autosave({'heroTitle': 'A'})
+        self.assertEqual(self.client.post(f'{self.url}flush/').json()['heroTitle'], 'A')
+        self.autosave({'heroTitle': 'B'})
+        self.client.patch(self.url, {'status': 'published'}, format='json')
+        website = Website.objects.get(pk=self.website.pk)
+        self.assertEqual((website.heroTitle, website.status), ('B', 'published'))
+        self.autosave({'heroTitle': 'C'})
+        call_command('flush_autosaves', stdout=io.StringIO())
+        self.assertEqual(Website.objects.get(pk=self.website.pk).heroTitle, 'C')
+    
+    def test_only_the_owner_flushes(self):
+        self.autosave({'heroTitle': 'T'})
+        other = User.objects.create_user(username='x@x.com', email='x@x.com', password='pw', firstName='X', lastName='Y')
+        client = APIClient()
+        client.force_authenticate(other)
+        self.assertEqual(client.post(f'{self.url}restore/', {'version': 1}, format='json').status_code, 404)
+        self.assertTrue(PendingAutosave.objects.exists())
+        self.assertEqual(self.client.patch('/api/websites/abc/', {'name': 'N'}, format='json').status_code, 404)
+    
+    def test_relations_are_buffered_by_id(self):
+        self.autosave({'template_id': 'default', 'template_name': 'Default'})
+        website, = overlay_pending([Website.objects.get(pk=self.website.pk)])
+        flush_autosave(self.website.pk)
+        stored = Website.objects.get(pk=self.website.pk)
+        self.assertEqual(
+            (stored.templateVersion_id, stored.templateOverrides),
+            (website.templateVersion_id, website.templateOverrides),
+        )
+
+class TemplateRegistryTests(TestCase):
+    def setUp(self):
+        template_registry.clear()
+        self.addCleanup(template_registry.clear)
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def create_site(self, slug, **template):
+        data = {'name': 'Site', 'slug': slug, 'category': 'other', **template}
+        return self.client.post('/api/websites/', data, format='json')
+    
+    def register(self, key, metadata, name='Modern'):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump(metadata, f)
+            f.flush()
+            call_command('register_template', key, f.name, name=name, stdout=io.StringIO())
+    
+    def test_site_content_never_registers_a_template(self):
+        response = self.create_site('a', template_id='mine', template_name='Mine', template_metadata={'color': 'red'})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertFalse(Template.objects.exists())
+        self.assertEqual(self.client.get('/api/templates/').json(), [])
+        website = Website.objects.get(slug='a')
+        self.assertIsNone(website.templateVersion)
+        template = self.client.get(f'/api/websites/{website.id}/').json()['template']
+        self.assertEqual(
+            (template['id'], template['name'], template['metadata'], template['version']),
+            ('mine', 'Mine', {'color': 'red'}, None),
+        )
+    
+    def test_registered_templates_are_shared(self):
+        self.register('modern', {'color': 'red'})
+        self.create_site('a', template_id='modern', template_name='Modern', template_metadata={'color': 'red'})
+        website = Website.objects.get(slug='a')
+        self.assertEqual((website.templateVersion.key, website.templateOverrides), ('modern', []))
+        self.assertEqual([template['id'] for template in self.client.get('/api/templates/').json()], ['modern'])
+    
+    def test_metadata_is_limited(self):
+        response = self.create_site('a', template_id='mine', template_metadata={'blob': 'x' * 40_000})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('template_metadata', response.json())
+        response = self.create_site('b', template_id='mine', template_metadata={'deep': [[[[['too far']]]]]})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Website.objects.exists())
+    
+    def test_command_rejects_invalid_metadata(self):
+        with self.assertRaises(CommandError):
+            self.register('modern', {'deep': [[[[['too far']]]]]})
+        with self.assertRaises(CommandError):
+            self.register('default', {})
+        self.assertFalse(Template.objects.exists())
+
+class CartBatchEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def operations(self, count, op='add'):
+        return [
+            {
+                'op': op, 'product_id': str(index), 'websiteSlug': 'shop', 'quantity': 2, 'product_name': f'P{index}',
+                'product_price': '1.50', 'product_sku': f'S{index}', 'websiteId': '1', 'websiteName': 'Shop',
+            }
+            for index in range(count)
+        ]
+    
+    def batch(self, operations):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/cart/batch/', {'operations': operations}, format='json')
+        return response, len(queries)
+    
+    def test_query_count_does_not_grow_with_the_batch(self):
+        response, small = self.batch(self.operations(3))
+        self.assertEqual(len(response.json()), 3)
+        response, large = self.batch(self.operations(30))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(small, large)
+        self.assertEqual(
+            sorted(Cart.objects.values_list('product_id', 'quantity'), key=lambda line: int(line[0]))[:4],
+            [('0', 4), ('1', 4), ('2', 4), ('3', 2)],
+        )
+    
+    def test_remove_needs_only_the_line_key(self):
+        self.batch(self.operations(2))
+        response, _ = self.batch([{'op': 'remove', 'product_id': '0', 'websiteSlug': 'shop'}])
+        self.assertEqual([line['product_id'] for line in response.json()], ['1'])
+    
+    def test_invalid_batches_change_nothing(self):
+        operations = self.operations(2)
+        del operations[1]['product_price']
+        response, _ = self.batch(operations)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.batch([])[0].status_code, 400)
+        self.assertEqual(self.batch(self.operations(201))[0].status_code, 400)
+        self.assertFalse(Cart.objects.exists())
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        website = Website.objects.create(user=self.user, name='Shop', slug='shop', category='other')
+        self.products = [
+            Product.objects.create(
+                website=website, name=f'P{index}', slug=f'p{index}', description='d', price='2.00', category='c',
+                sku=f'S{index}', inventory=5,
+            )
+            for index in range(3)
+        ]
+        for product in self.products:
+            Cart.objects.add_item(
+                self.user, product_id=str(product.pk), websiteSlug='shop', quantity=2, product_name=product.name,
+                product_price=Decimal('2.00'), product_sku=product.sku, websiteId=str(website.pk), websiteName='Shop',
+            )
+        Cart.objects.add_item(
+            self.user, product_id='9999', websiteSlug='other', quantity=1, product_name='Gone',
+            product_price=Decimal('3.00'), product_sku='G', websiteId='0', websiteName='Other',
+        )
+    
+    def test_totals_and_issues_in_a_fixed_number_of_queries(self):
+        Product.objects.filter(pk=self.products[0].pk).update(price='2.50')
+        Product.objects.filter(pk=self.products[1].pk).update(inventory=1)
+        with self.assertNumQueries(3):
+            summary = self.client.get('/api/cart/summary/').json()
+        self.assertEqual(
+            [(website['websiteSlug'], website['item_count'], Decimal(str(website['subtotal']))) for website in summary['websites']],
+            [('other', 1, Decimal('3')), ('shop', 6, Decimal('12'))],
+        )
+        self.assertEqual(summary['item_count'], 7)
+        self.assertFalse(summary['valid'])
+        flags = {issue['product_id']: issue['flags'] for issue in summary['issues']}
+        self.assertEqual(flags, {
+            str(self.products[0].pk): ['price_changed'],
+            str(self.products[1].pk): ['out_of_stock'],
+            '9999': ['unavailable'],
+        })
+    
+    def test_summary_of_one_website(self):
+        summary = self.client.get('/api/cart/summary/?website_slug=shop').json()
+        self.assertEqual([website['websiteSlug'] for website in summary['websites']], ['shop'])
+        self.assertEqual((summary['issues'], summary['valid']), ([], True))
+
+class AbandonedCartTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        Website.objects.create(user=self.owner, name='Shop', slug='shop', category='other')
+        self.shoppers = [
+            User.objects.create_user(username=f'{name}@x.com', email=f'{name}@x.com', password='pw', firstName=name, lastName='S')
+            for name in ('a', 'b', 'c')
+        ]
+        for shopper in self.shoppers:
+            Cart.objects.add_item(
+                shopper, product_id='7', websiteSlug='shop', quantity=2, product_name='Mug',
+                product_price=Decimal('4.00'), product_sku='M1', websiteId='1', websiteName='Shop',
+            )
+        self.idle_since = timezone.now() - timedelta(days=40)
+        Cart.objects.exclude(user=self.shoppers[2]).update(updatedAt=self.idle_since)
+    
+    def purge(self, *args):
+        out = io.StringIO()
+        call_command('purge_abandoned_carts', '--batch-size', '1', *args, stdout=out)
+        return out.getvalue()
+    
+    def test_idle_lines_are_purged_into_stats(self):
+        self.assertIn('2 cart lines idle', self.purge('--dry-run'))
+        self.assertEqual(Cart.objects.count(), 3)
+        
+        self.assertIn('Purged 2 idle cart lines', self.purge())
+        self.assertEqual(list(Cart.objects.values_list('user', flat=True)), [self.shoppers[2].pk])
+        stat = AbandonedCartStat.objects.get()
+        self.assertEqual(
+            (stat.websiteSlug, stat.product_id, stat.date, stat.line_count, stat.item_count, stat.value),
+            ('shop', '7', self.idle_since.date(), 2, 4, Decimal('16.00')),
+        )
+    
+    def test_later_purges_add_to_the_day(self):
+        self.purge()
+        Cart.objects.update(updatedAt=self.idle_since)
+        self.purge()
+        self.assertEqual(AbandonedCartStat.objects.get().line_count, 3)
+    
+    def test_owners_see_their_websites_stats(self):
+        self.purge()
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get('/api/analytics/abandoned-carts/').json()
+        self.assertEqual((response['total_lines'], response['total_items']), (2, 4))
+        self.assertEqual([product['product_id'] for product in response['products']], ['7'])
+        client.force_authenticate(self.shoppers[0])
+        self.assertEqual(client.get('/api/analytics/abandoned-carts/').json()['total_lines'], 0)
+
+class RefusingEmailBackend(BaseEmailBackend):
+    """Accepts nothing, like an SMTP server rejecting every recipient"""
+    
+    def send_messages(self, email_messages):
+        return 0
+
+class BroadcastDeliveryTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.owner, name='Shop', slug='shop')
+        for index in range(5):
+            email = f'c{index}@x.com'
+            customer = User.objects.create_user(username=email, email=email, password=None, firstName='C', lastName='X')
+            WebsiteCustomer.objects.record(self.website, customer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+    
+    def test_connections_are_opened_once_per_pool_slot(self):
+        broadcast = Broadcast.objects.create(website=self.website, subject='News', text_body='Hello', status='queued')
+        with mock.patch('builderapi.email_utils.get_connection', wraps=get_connection) as opened:
+            send_broadcast(broadcast, chunk_size=1, pool_size=2)
+        self.assertEqual(opened.call_count, 2)
+        self.assertEqual(len(mail.outbox), 5)
+    
+    def test_refused_messages_are_counted_as_failed(self):
+        broadcast = Broadcast.objects.create(website=self.website, subject='News', text_body='Hello', status='queued')
+        broadcast = send_broadcast(broadcast, chunk_size=2, pool_size=1, backend='builderapi.tests.RefusingEmailBackend')
+        self.assertEqual((broadcast.status, broadcast.sent_count, broadcast.failed_count), ('sent', 0, 5))
+    
+    def test_owner_composes_sends_and_cancels(self):
+        response = self.client.post('/api/broadcasts/', {'website': self.website.id, 'subject': 'News', 'text_body': 'Hi'}, format='json')
+        self.assertEqual((response.status_code, response.json()['status']), (201, 'draft'))
+        url = f"/api/broadcasts/{response.json()['id']}/"
+        
+        response = self.client.post(f'{url}send/')
+        self.assertEqual((response.json()['status'], response.json()['total_recipients']), ('queued', 5))
+        self.assertEqual(self.client.post(f'{url}send/').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'subject': 'Late'}, format='json').status_code, 403)
+        self.assertEqual(self.client.post(f'{url}cancel/').json()['status'], 'cancelled')
+        self.assertEqual(self.client.post(f'{url}cancel/').status_code, 400)
+        
+        call_command('send_broadcasts', stdout=io.StringIO())
+        self.assertEqual(mail.outbox, [])
+    
+    def test_only_owners_email_customers(self):
+        other = User.objects.create_user(username='x@x.com', email='x@x.com', password='pw', firstName='X', lastName='Y')
+        client = APIClient()
+        client.force_authenticate(other)
+        response = client.post('/api/broadcasts/', {'website': self.website.id, 'subject': 'Spam', 'text_body': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Broadcast.objects.exists())
+    
+    def test_command_sends_queued_broadcasts(self):
+        Broadcast.objects.create(website=self.website, subject='News', text_body='Hello', status='queued')
+        out = io.StringIO()
+        call_command('send_broadcasts', '--chunk-size', '2', '--connections', '1', stdout=out)
+        self.assertIn('5 sent, 0 failed of 5 (sent)', out.getvalue())
+        self.assertEqual(len(mail.outbox), 5)
+
+class EmailTemplateTests(SimpleTestCase):
+    context = {
+        'user_name': 'Ann & <Bob>', 'user_email': 'a@x.com', 'otp_code': '654321', 'otp_expires_in': 'up to 5 minutes',
+    }
+    
+    def test_fragments_render_like_the_full_template(self):
+        subject, text, html = render_email('otp_verification', self.context)
+        self.assertEqual(html, render_to_string('emails/otp_verification.html', self.context))
+        self.assertEqual(subject, '🔐 Verify Your Corporate Portal Account - Code: 654321')
+        self.assertIn('Hello Ann & <Bob>,', text)
+        self.assertEqual(render_email('welcome', {'first_name': 'Ann'})[2], '')
+    
+    def test_templates_are_rendered_once(self):
+        template = EmailTemplate(['name'], 'Hi {name}', 'Hello {name}', 'emails/otp_verification.html')
+        with mock.patch('builderapi.email_utils.render_to_string', wraps=render_to_string) as rendered:
+            messages = template.render_many({'name': f'N{index}'} for index in range(50))
+            template.render({'name': 'Last'})
+        self.assertEqual(rendered.call_count, 1)
+        self.assertEqual([message[:2] for message in messages[:2]], [('Hi N0', 'Hello N0'), ('Hi N1', 'Hello N1')])
+    
+    def test_batch_render(self):
+        messages = render_emails('welcome', [{'first_name': 'A'}, {'first_name': 'B'}])
+        self.assertEqual([text.splitlines()[0] for _, text, _ in messages], [
+            'Welcome to Corporate Portal, A!', 'Welcome to Corporate Portal, B!',
+        ])
+
+class PasswordHashingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W', isVerified=True,
+        )
+    
+    def login(self, view, data):
+        return async_to_sync(view)(RequestFactory().post('/', data, content_type='application/json'))
+    
+    def test_authenticate_on_the_pool(self):
+        completed = password_hashing_pool.stats()['completed']
+        self.assertEqual(async_to_sync(aauthenticate)('o@x.com', 'pw'), self.user)
+        self.assertIsNone(async_to_sync(aauthenticate)('o@x.com', 'wrong'))
+        # Unknown emails cost a hash too
+        self.assertIsNone(async_to_sync(aauthenticate)('nobody@x.com', 'pw'))
+        self.assertEqual(password_hashing_pool.stats()['completed'], completed + 3)
+    
+    def test_outdated_hashes_are_upgraded(self):
+        User.objects.filter(pk=self.user.pk).update(password=PBKDF2PasswordHasher().encode('pw', 'salt', iterations=1000))
+        async_to_sync(aauthenticate)('o@x.com', 'pw')
+        self.assertFalse(PBKDF2PasswordHasher().must_update(User.objects.get(pk=self.user.pk).password))
+    
+    def test_async_login(self):
+        response = self.login(login_async, {'email': 'o@x.com', 'password': 'pw'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', json.loads(response.content)['tokens'])
+        self.assertEqual(self.login(login_async, {'email': 'o@x.com', 'password': 'bad'}).status_code, 400)
+    
+    @override_settings(PASSWORD_HASH_MAX_PENDING=0)
+    def test_full_pool_answers_503(self):
+        rejected = password_hashing_pool.stats()['rejected']
+        response = self.login(login_async, {'email': 'o@x.com', 'password': 'pw'})
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        self.assertEqual(password_hashing_pool.stats()['rejected'], rejected + 1)
+        with self.assertRaises(PasswordHashingBusy):
+            async_to_sync(amake_password)('pw')
+
+class CatalogImportTests(TestCase):
+    csv = (
+        'name,description,price,category,sku,images\n'
+        'Mug,Big mug,4.00,kitchen,M1,https://x.com/a.png|https://x.com/b.png\n'
+        'Cup,Small cup,not-a-price,kitchen,C1,\n'
+        'Bowl,Deep bowl,6.00,kitchen,M1,\n'
+        'Plate,Flat plate,3.00,kitchen,P1,\n'
+    )
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.user, name='Shop', slug='shop', category='other')
+        Product.objects.create(website=self.website, name='Old', slug='old', description='d', price='1.00', category='c', sku='P1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def upload(self, content, name='catalog.csv', website=None):
+        return self.client.post('/api/products/bulk_import/', {
+            'website': website or self.website.id, 'file': SimpleUploadedFile(name, content.encode()),
+        }, format='multipart')
+    
+    def test_csv_rows_are_created_or_reported(self):
+        response = self.upload(self.csv)
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual((report['created'], report['error_count']), (1, 3))
+        self.assertEqual({error['row']: list(error['errors']) for error in report['errors']}, {3: ['price'], 4: ['sku'], 5: ['sku']})
+        mug = Product.objects.get(sku='M1')
+        self.assertEqual((mug.slug, mug.images), ('mug', ['https://x.com/a.png', 'https://x.com/b.png']))
+    
+    def test_queries_per_chunk_do_not_grow_with_rows(self):
+        rows = ''.join(f'{{"name": "P{index}", "description": "d", "price": "1.00", "category": "c", "sku": "S{index}"}}\n' for index in range(200))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.upload(rows + 'not json\n', name='catalog.ndjson')
+        self.assertEqual(response.json()['created'], 200)
+        self.assertEqual(response.json()['errors'][0]['row'], 201)
+        self.assertLess(len(queries), 10)
+    
+    def test_only_own_websites(self):
+        other = User.objects.create_user(username='x@x.com', email='x@x.com', password='pw', firstName='X', lastName='Y')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.upload(self.csv).status_code, 404)
+        self.assertEqual(Product.objects.count(), 1)
+    
+    def test_command_validates_in_process(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+            f.write(self.csv)
+            f.flush()
+            out, err = io.StringIO(), io.StringIO()
+            call_command('import_catalog', f.name, '--website', 'shop', '--workers', '1', stdout=out, stderr=err)
+        self.assertIn('Created 1 products, 3 rows rejected', out.getvalue())
+        self.assertIn('Row 3:', err.getvalue())
+
+class ProductBulkTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.user, name='Shop', slug='shop', category='other')
+        self.products = [
+            Product.objects.create(
+                website=self.website, name=f'P{index}', slug=f'p{index}', description='d', price='10.00',
+                category='shoes' if index < 2 else 'hats', sku=f'S{index}', inventory=3,
+            )
+            for index in range(4)
+        ]
+        other = User.objects.create_user(username='x@x.com', email='x@x.com', password='pw', firstName='X', lastName='Y')
+        other_site = Website.objects.create(user=other, name='Other', slug='other', category='other')
+        self.foreign = Product.objects.create(
+            website=other_site, name='F', slug='f', description='d', price='10.00', category='shoes', sku='F1',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def bulk(self, data):
+        return self.client.post('/api/products/bulk/', data, format='json')
+    
+    def prices(self):
+        return {product.sku: (product.price, product.inventory, product.status) for product in Product.objects.all()}
+    
+    def test_updates_rules_and_deletes_in_one_request(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.bulk({
+                'updates': [{'id': self.products[0].id, 'status': 'inactive'}, {'id': self.products[1].id, 'inventory': 9}],
+                'rules': [{'filter': {'category': 'shoes'}, 'price_percent': '10', 'inventory_delta': -5}],
+                'delete': {'category': 'hats'},
+            })
+        self.assertEqual(response.json(), {'updated': 2, 'rules': [2], 'deleted': 2})
+        self.assertLess(len(queries), 12)
+        self.assertEqual(self.prices(), {
+            'S0': (Decimal('11.00'), 0, 'inactive'),
+            'S1': (Decimal('11.00'), 4, 'active'),
+            'F1': (Decimal('10.00'), 0, 'active'),
+        })
+        self.assertEqual(Product.objects.get(sku='S0').version, 3)
+    
+    def test_other_users_products_are_never_touched(self):
+        response = self.bulk({'updates': [{'id': self.foreign.id, 'price': '1.00'}, {'id': self.products[0].id, 'price': '1.00'}]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Product.objects.get(sku='S0').price, Decimal('10.00'))
+        self.assertEqual(self.bulk({'rules': [{'filter': {'ids': [self.foreign.id]}, 'price_amount': '-50'}]}).json()['rules'], [0])
+        self.assertEqual(self.bulk({'delete': {'website': self.foreign.website_id}}).json()['deleted'], 0)
+        self.assertTrue(Product.objects.filter(pk=self.foreign.pk).exists())
+    
+    def test_prices_never_go_negative(self):
+        self.bulk({'rules': [{'filter': {'skus': ['S2']}, 'price_amount': '-50'}]})
+        self.assertEqual(Product.objects.get(sku='S2').price, Decimal('0'))
+    
+    def test_invalid_requests(self):
+        for data in (
+            {}, {'delete': {}}, {'rules': [{'filter': {'category': 'shoes'}}]},
+            {'updates': [{'id': self.products[0].id}]},
+            {'updates': [{'id': self.products[0].id, 'price': '1'}, {'id': self.products[0].id, 'price': '2'}]},
+        ):
+            self.assertEqual(self.bulk(data).status_code, 400, data)
+        self.assertEqual(Product.objects.count(), 5)
+
+@override_settings(REQUIRE_IF_MATCH=False)
+class WebsiteCloneTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(
+            user=self.user, name='Shop', slug='shop', category='other', status='published', theme={'color': 'red'},
+            customerCount=4,
+        )
+        Product.objects.bulk_create(
+            Product(website=self.website, name=f'P{index}', slug=f'p{index}', description='d', price='1.00', category='c', sku=f'S{index}')
+            for index in range(30)
+        )
+        BlogPost.objects.create(website=self.website, title='Live', slug='live', content='c', author='a', status='published')
+        BlogPost.objects.create(website=self.website, title='Draft', slug='draft', content='c', author='a', status='draft')
+        Order.objects.create(
+            website=self.website, websiteSlug='shop', websiteName='Shop', items=[], total=0, customerName='G',
+            customerEmail='g@x.com', customerPhone='1', customerAddress='A', customerCity='C', customerZipCode='Z',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/websites/{self.website.id}/clone/'
+    
+    def test_clone_copies_content_but_not_customers(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 20)
+        data = response.json()
+        self.assertEqual(data['copied'], {'products': 30, 'blog_posts': 2, 'orders': 0})
+        self.assertEqual((data['slug'], data['status'], data['theme'], data['customerCount']), ('shop-copy', 'draft', {'color': 'red'}, 0))
+        clone = Website.objects.get(pk=data['id'])
+        self.assertEqual(clone.products.count(), 30)
+        self.assertEqual(self.website.products.count(), 30)
+    
+    def test_options_and_unique_slugs(self):
+        self.client.post(self.url, {}, format='json')
+        data = self.client.post(self.url, {'name': 'Client', 'include_drafts': False, 'include_orders': True}, format='json').json()
+        self.assertEqual((data['slug'], data['name']), ('shop-copy-2', 'Client'))
+        self.assertEqual(data['copied'], {'products': 30, 'blog_posts': 1, 'orders': 1})
+        self.assertEqual(Order.objects.get(website_id=data['id']).websiteSlug, 'shop-copy-2')
+    
+    def test_only_the_owner_clones(self):
+        other = User.objects.create_user(username='x@x.com', email='x@x.com', password='pw', firstName='X', lastName='Y')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.post(self.url, {}, format='json').status_code, 404)
+        self.assertEqual(Website.objects.count(), 1)
+
+@override_settings(REQUIRE_IF_MATCH=False, REVISION_SNAPSHOT_INTERVAL=3)
+class RevisionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.user, name='Shop', slug='shop', category='other')
+        self.post = BlogPost.objects.create(
+            website=self.website, title='T0', slug='t', content='x' * 2000, author='a', tags=['a'],
+        )
+        record_revision(self.post)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/blogs/{self.post.id}/'
+    
+    def edit(self, count):
+        for index in range(1, count + 1):
+            self.client.patch(self.url, {'title': f'T{index}'}, format='json')
+    
+    def test_diffs_between_periodic_snapshots(self):
+        self.edit(6)
+        self.assertEqual(
+            list(revisions_for(self.post).order_by('version').values_list('version', 'isSnapshot')),
+            [(1, True), (2, False), (3, False), (4, True), (5, False), (6, False), (7, True)],
+        )
+        for version in range(1, 8):
+            with self.assertNumQueries(2):
+                state, _ = reconstruct(self.post, version)
+            self.assertEqual((state['title'], state['content']), (f'T{version - 1}', 'x' * 2000))
+        # Saving without changes records nothing
+        self.assertIsNone(record_revision(BlogPost.objects.get(pk=self.post.pk)))
+    
+    def test_large_changes_are_stored_as_snapshots(self):
+        self.client.patch(self.url, {'content': 'y' * 2000}, format='json')
+        self.assertTrue(revisions_for(self.post).get(version=2).isSnapshot)
+    
+    def test_list_and_restore(self):
+        self.edit(2)
+        response = self.client.get(f'{self.url}revisions/')
+        self.assertEqual([revision['version'] for revision in response.json()['results']], [3, 2, 1])
+        self.assertEqual(self.client.get(f'{self.url}revisions/?version=2').json()['data']['title'], 'T1')
+        
+        response = self.client.post(f'{self.url}restore/', {'version': 1}, format='json')
+        self.assertEqual((response.json()['title'], response.json()['version']), ('T0', 4))
+        self.assertEqual(reconstruct(self.post)[1], 4)
+        self.assertEqual(self.client.post(f'{self.url}restore/', {'version': 9}, format='json').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}revisions/?version=9').status_code, 404)
+    
+    def test_prune_keeps_the_edge_of_the_window(self):
+        self.edit(4)
+        revisions_for(self.post).filter(version__lte=3).update(createdAt=timezone.now() - timedelta(days=100))
+        out = io.StringIO()
+        call_command('prune_revisions', stdout=out)
+        self.assertIn('Deleted 2 revisions', out.getvalue())
+        self.assertEqual(
+            list(revisions_for(self.post).order_by('version').values_list('version', 'isSnapshot')),
+            [(3, True), (4, True), (5, False)],
+        )
+        self.assertEqual(reconstruct(self.post, 3)[0]['title'], 'T2')
+        self.assertEqual(reconstruct(self.post)[0]['title'], 'T4')
+
+class CompressedFieldTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='o@x.com', email='o@x.com', password='pw', firstName='O', lastName='W')
+        self.website = Website.objects.create(user=self.user, name='Shop', slug='shop', category='other')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def stored(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM builderapi_blogpost WHERE id = %s', [post.pk])
+            return bytes(cursor.fetchone()[0])
+    
+    def post(self, content, slug='p'):
+        return BlogPost.objects.create(website=self.website, title='T', slug=slug, content=content, author='a')
+    
+    def test_large_values_are_stored_compressed(self):
+        large, small = self.post('lorem ipsum ' * 500), self.post('short', slug='s')
+        self.assertEqual(self.stored(large)[:1], b'z')
+        self.assertLess(len(self.stored(large)), 1000)
+        self.assertEqual(self.stored(small), b'rshort')
+        self.assertEqual(BlogPost.objects.get(pk=large.pk).content, 'lorem ipsum ' * 500)
+        
+        blocks = [{'type': 'text', 'text': 'lorem ipsum ' * 200}]
+        Website.objects.filter(pk=self.website.pk).update(contentBlocks=blocks)
+        self.assertEqual(self.client.get(f'/api/websites/{self.website.id}/').json()['contentBlocks'], blocks)
+    
+    def test_decompress(self):
+        self.assertEqual(decompress('stored before the conversion'), 'stored before the conversion')
+        self.assertEqual(decompress(compress('é'.encode() * 2000)), 'é' * 2000)
+        with self.assertRaises(ValueError):
+            decompress(b'xdata')
+    
+    @override_settings(COMPRESSED_FIELD_CODEC='zstd')
+    def test_zstd_needs_its_package(self):
+        if zstandard is not None:
+            self.skipTest('zstandard is installed')
+        with self.assertRaises(ImproperlyConfigured):
+            compress(b'x' * 5000)
+    
+    def test_recompress_command(self):
+        with override_settings(COMPRESSED_FIELD_THRESHOLD=10 ** 6):
+            post = self.post('lorem ipsum ' * 500)
+        self.assertEqual(self.stored(post)[:1], b'r')
+        out = io.StringIO()
+        call_command('recompress_fields', '--model', 'BlogPost', '--batch-size', '1', stdout=out)
+        self.assertIn('BlogPost: rewrote content on 1 rows', out.getvalue())
+        self.assertEqual(self.stored(post)[:1], b'z')
+        with self.assertRaises(CommandError):
+            call_command('recompress_fields', '--model', 'User', stdout=io.StringIO())
+    
+    @override_settings(SEARCH_CONTENT_SCAN_LIMIT=1)
+    def test_search_scans_only_recent_blog_content(self):
+        old = self.post('the needle is here', slug='old')
+        self.post('the needle again', slug='new')
+        BlogPost.objects.filter(pk=old.pk).update(updatedAt=timezone.now() - timedelta(days=1))
+        results = self.client.get('/api/search/?q=needle&type=blog').json()['results']
+        self.assertEqual([result['url'] for result in results], ['/shop/blogs/new'])
@@ -0,0 +1,171 @@
+"""
+Sliding-window rate limits for the unauthenticated write endpoints
+
+Each limit is a pair of fixed-window counters in the cache: the count for the
+current window plus the previous window's count weighted by how much of it
+still overlaps the sliding window. A check costs one ``add``, one ``incr``
+and one ``get`` whatever the limit. Counters live in the shared cache, so
+limits hold across worker processes; ``incr`` is atomic on Redis, while the
+database cache can lose a count under concurrent requests.
+
+Limits are configured per endpoint scope in RATE_LIMITS and keyed by client
+IP, email address and website slug, e.g.::
+
+    RATE_LIMITS = {
+        'customer_login': {'ip': '60/h', 'email': '10/15m', 'website': '1000/h'},
+    }
+
+Client IPs come from REMOTE_ADDR, or from X-Forwarded-For only as far as
+REST_FRAMEWORK['NUM_PROXIES'] trusted proxies vouch for it; clients cannot
+pick their own key by sending the header.
+
+The tightest limit is reported back in ``RateLimit-*`` response headers by
+RateLimitHeadersMiddleware.
+"""
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+from collections import namedtuple
+import math
+import re
+import time
+
+from .shared_cache import shared_cache as cache
+
+PERIOD_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_PATTERN = re.compile(r'^(\d+)/(\d*)([smhd])')
+
+# Request fields each key kind is read from (auth endpoints / checkout)
+KEY_FIELDS = {
+    'email': ('email', 'customerEmail'),
+    'website': ('website_slug', 'websiteSlug'),
+}
+
+RateLimitResult = namedtuple('RateLimitResult', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+def parse_rate(rate):
+    """
+    Parse a rate such as ``'10/h'``, ``'5/15m'`` or ``'100/day'``
+    
+    Returns:
+        tuple: (number of requests, period in seconds)
+    """
+    match = RATE_PATTERN.match(rate)
+    if not match:
+        raise ValueError(f'Invalid rate limit {rate!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIOD_SECONDS[unit]
+
+def hit(key, limit, period):
+    """
+    Count one request against a sliding-window limit
+    
+    Returns:
+        RateLimitResult
+    """
+    now = time.time()
+    window = int(now // period)
+    elapsed = now - window * period
+    current_key = f'ratelimit:{key}:{period}:{window}'
+    
+    # Counters outlive their window by one period so the next window can weigh them
+    cache.add(current_key, 0, period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Evicted between add and incr
+        cache.set(current_key, 1, period * 2)
+        current = 1
+    previous = cache.get(f'ratelimit:{key}:{period}:{window - 1}', 0)
+    
+    weight = 1 - elapsed / period
+    estimate = previous * weight + current
+    allowed = estimate <= limit
+    reset = math.ceil(period - elapsed)
+    
+    retry_after = 0
+    if not allowed:
+        # Time until one more request would fit
+        if current < limit:
+            # Enough of the previous window has to slide out
+            retry_after = math.ceil(period * (1 - (limit - current - 1) / previous) - elapsed)
+        else:
+            # This window has to become the previous one and decay enough
+            retry_after = reset + math.ceil(period * (1 - (limit - 1) / current))
+        retry_after = max(retry_after, 1)
+    
+    return RateLimitResult(allowed, limit, max(int(limit - estimate), 0), reset, retry_after)
+
+def get_client_ip(request):
+    """Client address, honouring X-Forwarded-For only behind NUM_PROXIES trusted proxies"""
+    return BaseThrottle().get_ident(request)
+
+def check_rate_limits(scope, request, data):
+    """
+    Count a request against every limit configured for ``scope``
+    
+    Args:
+        scope: key into RATE_LIMITS
+        request: Django or DRF request
+        data: parsed request body, used for the email and website keys
+    
+    Returns:
+        RateLimitResult or None: the denying result, or the one with the
+        fewest requests remaining; None if the scope has no limits
+    """
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if not limits:
+        return None
+    
+    tightest = None
+    for kind, rate in limits.items():
+        if kind == 'ip':
+            ident = get_client_ip(request)
+        else:
+            ident = next((data.get(field) for field in KEY_FIELDS[kind] if data.get(field)), None)
+        if not ident:
+            continue
+        
+        limit, period = parse_rate(rate)
+        result = hit(f'{scope}:{kind}:{str(ident).strip().lower()}', limit, period)
+        if tightest is None or (tightest.allowed, tightest.remaining) > (result.allowed, result.remaining):
+            tightest = result
+    
+    # Read by RateLimitHeadersMiddleware
+    getattr(request, '_request', request).rate_limit = tightest
+    return tightest
+
+class SlidingWindowThrottle(BaseThrottle):
+    """DRF throttle applying the RATE_LIMITS entry named by ``scope``"""
+    scope = None
+    
+    def allow_request(self, request, view):
+        try:
+            data = request.data
+        except APIException:
+            # Unparseable bodies are rejected by the view; still count the IP
+            data = {}
+        self.result = check_rate_limits(self.scope, request, data)
+        return self.result is None or self.result.allowed
+    
+    def wait(self):
+        return self.result.retry_after
+
+def scoped_throttle(scope):
+    """SlidingWindowThrottle subclass for one RATE_LIMITS scope, for @throttle_classes"""
+    return type(f'{scope.title().replace("_", "")}Throttle', (SlidingWindowThrottle,), {'scope': scope})
+
+class RateLimitHeadersMiddleware(MiddlewareMixin):
+    """Add RateLimit-Limit / -Remaining / -Reset headers to rate-limited responses"""
+    
+    def process_response(self, request, response):
+        result = getattr(request, 'rate_limit', None)
+        if result is not None:
+            response['RateLimit-Limit'] = str(result.limit)
+            response['RateLimit-Remaining'] = str(result.remaining)
+            response['RateLimit-Reset'] = str(result.reset)
+            if not result.allowed:
+                response['Retry-After'] = str(result.retry_after)
+        return response
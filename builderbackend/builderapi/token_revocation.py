@@ -0,0 +1,141 @@
+"""
+Revocation of JWTs on logout and refresh rotation
+
+Revoked token ids (JTIs) are persisted in the RevokedToken table together
+with the token expiry. Each process keeps them in memory as a compact bloom
+filter plus a bounded exact set, loaded on first use and topped up with
+newly revoked ids every REVOKED_TOKEN_SYNC_SECONDS. The filter is rebuilt
+from unexpired rows every REVOKED_TOKEN_REBUILD_SECONDS, or when it fills up,
+which drops expired ids. A token whose JTI is not in the bloom filter is
+known not to be revoked without touching the database; only bloom positives
+missing from the exact set are looked up.
+"""
+
+from django.conf import settings
+from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
+import hashlib
+import math
+import threading
+import time
+
+from .models import RevokedToken
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over strings
+    
+    Args:
+        capacity: number of items the filter is sized for
+        error_rate: false positive rate at full capacity
+    """
+    
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, item):
+        # Double hashing: k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+    
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class RevocationFilter:
+    """In-memory view of the RevokedToken table for one process"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.exact = {}
+        self.synced_at = None
+        self.next_sync = 0
+        self.next_rebuild = 0
+    
+    def _exact_limit(self):
+        return getattr(settings, 'REVOKED_TOKEN_EXACT_SET_SIZE', 10000)
+    
+    def _remember(self, jti, expires):
+        self.exact[jti] = expires
+        if len(self.exact) > self._exact_limit():
+            # Dicts keep insertion order, so this drops the oldest entry
+            self.exact.pop(next(iter(self.exact)))
+    
+    def _rebuild(self):
+        """Reload every unexpired revocation; also drops expired ids from memory"""
+        now = timezone.now()
+        rows = list(RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', 'expires_at'))
+        self.bloom = BloomFilter(max(len(rows) * 2, 1024))
+        self.exact = {}
+        for jti, expires in rows:
+            self.bloom.add(jti)
+            self._remember(jti, expires.timestamp())
+        self.synced_at = now
+        self.next_rebuild = time.monotonic() + getattr(settings, 'REVOKED_TOKEN_REBUILD_SECONDS', 3600)
+    
+    def _sync(self):
+        """Load ids revoked by any process since the last sync"""
+        if self.bloom is None or self.bloom.count >= self.bloom.capacity or time.monotonic() >= self.next_rebuild:
+            self._rebuild()
+        else:
+            now = timezone.now()
+            # Overlap the window a little to allow for clock skew between processes
+            since = self.synced_at - timedelta(seconds=5)
+            rows = RevokedToken.objects.filter(revoked_at__gte=since).values_list('jti', 'expires_at')
+            for jti, expires in rows:
+                if jti not in self.exact:
+                    self.bloom.add(jti)
+                    self._remember(jti, expires.timestamp())
+            self.synced_at = now
+        self.next_sync = time.monotonic() + getattr(settings, 'REVOKED_TOKEN_SYNC_SECONDS', 30)
+    
+    def add(self, jti, expires):
+        with self.lock:
+            if self.bloom is None:
+                self._sync()
+            self.bloom.add(jti)
+            self._remember(jti, expires)
+    
+    def is_revoked(self, jti):
+        with self.lock:
+            if self.bloom is None or time.monotonic() >= self.next_sync:
+                self._sync()
+            if jti not in self.bloom:
+                return False
+            expires = self.exact.get(jti)
+            if expires is not None:
+                return expires > time.time()
+        
+        # Bloom positive we cannot confirm from memory
+        expires_at = RevokedToken.objects.filter(jti=jti).values_list('expires_at', flat=True).first()
+        if expires_at is None:
+            return False
+        with self.lock:
+            self._remember(jti, expires_at.timestamp())
+        return True
+
+revocation_filter = RevocationFilter()
+
+def revoke_token(token):
+    """
+    Revoke a simplejwt token (access or refresh) until it expires
+    """
+    jti = token[settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti')]
+    expires_at = datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+    RevokedToken.objects.get_or_create(jti=jti, defaults={'expires_at': expires_at})
+    revocation_filter.add(jti, expires_at.timestamp())
+
+def is_token_revoked(token):
+    """True if the token's JTI has been revoked"""
+    return revocation_filter.is_revoked(token[settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti')])
@@ -1,19 +1,29 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
-    register, verify_otp, resend_otp, login, logout, profile, dashboard_analytics,
+    register, verify_otp, resend_otp, login, logout, profile, dashboard_analytics, abandoned_cart_analytics,
     search_content, search_suggestions, popular_searches,
     customer_signup, customer_login, customer_verify_otp, customer_profile, customer_logout,
-    WebsiteViewSet, BlogPostViewSet, ProductViewSet, OrderViewSet, CartViewSet
+    WebsiteViewSet, BlogPostViewSet, ProductViewSet, OrderViewSet, CartViewSet, GuestCartViewSet,
+    BroadcastViewSet, TemplateViewSet, register_async, login_async, customer_signup_async, customer_login_async
 )
 
+# Under ASGI the async auth views keep password hashing off the shared sync thread
+if getattr(settings, 'ASYNC_AUTH_VIEWS', True):
+    register, login = register_async, login_async
+    customer_signup, customer_login = customer_signup_async, customer_login_async
+
 router = DefaultRouter()
 router.register(r'websites', WebsiteViewSet, basename='website')
 router.register(r'blogs', BlogPostViewSet, basename='blog')
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'cart', CartViewSet, basename='cart')
+router.register(r'guest-cart', GuestCartViewSet, basename='guest-cart')
+router.register(r'broadcasts', BroadcastViewSet, basename='broadcast')
+router.register(r'templates', TemplateViewSet, basename='template')
 
 urlpatterns = [
     # Authentication endpoints
@@ -27,6 +37,7 @@ urlpatterns = [
     
     # Analytics
     path('analytics/dashboard/', dashboard_analytics, name='dashboard_analytics'),
+    path('analytics/abandoned-carts/', abandoned_cart_analytics, name='abandoned_cart_analytics'),
     
     # Search endpoints
     path('search/', search_content, name='search_content'),
@@ -1,40 +1,97 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import api_view, permission_classes, throttle_classes, action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework_simplejwt.tokens import RefreshToken
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from django.core.mail import send_mail
 from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Q
-import random
-import string
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db.models import Q, F, Sum, Count, Max
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from functools import partial, wraps
+import json
 
-from .models import User, Website, BlogPost, Product, Order, Cart, OTPVerification
+from .models import (
+    User, Website, WebsiteCustomer, BlogPost, Product, Order, Cart, AbandonedCartStat, Broadcast, Revision,
+    WEBSITE_DOCUMENT_COLUMNS
+)
 from .serializers import (
     UserRegistrationSerializer, UserLoginSerializer, OTPVerificationSerializer,
     UserSerializer, WebsiteSerializer, BlogPostSerializer, ProductSerializer,
-    OrderSerializer, CartSerializer, CheckoutSerializer
+    OrderSerializer, CartSerializer, CartBatchSerializer, CheckoutSerializer, BroadcastSerializer,
+    WebsiteCustomerSerializer, WebsiteCloneSerializer, ProductBulkSerializer, RevisionSerializer
+)
+from .email_utils import send_otp_email, send_welcome_email, broadcast_recipients_queryset
+from .token_revocation import revoke_token
+from .json_patch import (
+    JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE, JSONPatchError, JSONPatchParser, MergePatchParser, patch_fields
+)
+from .concurrency import VersionedUpdateMixin, PreconditionFailed, etag_for
+from .autosave import buffer_autosave, flush_autosave, get_pending, overlay_pending
+from .revisions import record_revision, reconstruct, restore_revision, revisions_for
+from .template_registry import template_changes, template_payload, template_registry, website_documents
+from .json_schema import check_website_content
+from .product_import import CatalogImporter, iter_catalog_rows
+from .throttling import scoped_throttle, check_rate_limits
+from .password_hashing import aauthenticate, amake_password, PasswordHashingBusy
+from .otp_utils import generate_otp, check_otp, OTP_VALID, OTP_INVALID, OTP_EXPIRED, OTP_USED, OTP_LOCKED
+from .guest_cart import (
+    CART_TOKEN_HEADER, get_request_cart_token, get_guest_cart, apply_guest_operations, clear_guest_cart,
+    merge_guest_cart, guest_cart_order_items, price_order_items
 )
-from .email_utils import send_otp_email, send_welcome_email
+
+OTP_ERROR_MESSAGES = {
+    OTP_INVALID: 'Invalid or expired OTP. Please request a new one.',
+    OTP_EXPIRED: 'OTP has expired. Please request a new one.',
+    OTP_USED: 'This OTP has already been used.',
+    OTP_LOCKED: 'Too many incorrect attempts. Please wait a few minutes and request a new OTP.',
+}
 
 # Authentication Views
+def create_unverified_user(save_user, website=None):
+    """
+    Create a user and queue their OTP email in one transaction
+    
+    Args:
+        save_user: callable that creates and returns the user
+        website: website to record the user as a customer of, if any
+    
+    Returns:
+        User or None: None if the email could not be queued, in which case
+        nothing is saved and the address can sign up again
+    """
+    with transaction.atomic():
+        user = save_user()
+        if website is not None:
+            # Remember which website the customer signed up through
+            WebsiteCustomer.objects.record(website, user)
+        
+        if not send_otp_email(user, generate_otp(user)):
+            transaction.set_rollback(True)
+            return None
+    return user
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('register')])
 def register(request):
     serializer = UserRegistrationSerializer(data=request.data)
     if serializer.is_valid():
-        user = serializer.save()
-        
-        # Generate OTP
-        otp = ''.join(random.choices(string.digits, k=6))
-        OTPVerification.objects.create(user=user, otp=otp)
+        # Create the user and send the OTP email together
+        user = create_unverified_user(serializer.save)
         
-        # Send beautiful OTP email
-        email_sent = send_otp_email(user, otp)
-        
-        if not email_sent:
+        if user is None:
             return Response({
                 'error': 'Failed to send verification email. Please try again.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -48,6 +105,7 @@ def register(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('resend_otp')])
 def resend_otp(request):
     """Resend OTP to user's email"""
     email = request.data.get('email')
@@ -61,12 +119,8 @@ def resend_otp(request):
         if user.isVerified:
             return Response({'error': 'User is already verified'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Mark all existing OTPs as used
-        OTPVerification.objects.filter(user=user, is_used=False).update(is_used=True)
-        
-        # Generate new OTP
-        otp = ''.join(random.choices(string.digits, k=6))
-        OTPVerification.objects.create(user=user, otp=otp)
+        # Generate OTP for the current time step
+        otp = generate_otp(user)
         
         # Send beautiful OTP email
         email_sent = send_otp_email(user, otp)
@@ -85,6 +139,7 @@ def resend_otp(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('verify_otp')])
 def verify_otp(request):
     serializer = OTPVerificationSerializer(data=request.data)
     if serializer.is_valid():
@@ -94,31 +149,17 @@ def verify_otp(request):
         try:
             user = User.objects.get(email=email)
             
-            # Get the latest unused OTP for this user
-            otp_verification = OTPVerification.objects.filter(
-                user=user, 
-                otp=otp, 
-                is_used=False
-            ).first()
-            
-            if not otp_verification:
-                return Response({
-                    'error': 'Invalid or expired OTP. Please request a new one.'
-                }, status=status.HTTP_400_BAD_REQUEST)
+            # Check and consume the OTP without touching the database
+            otp_result = check_otp(user, otp)
             
-            # Check if OTP is expired (10 minutes)
-            if otp_verification.is_expired():
+            if otp_result != OTP_VALID:
                 return Response({
-                    'error': 'OTP has expired. Please request a new one.'
+                    'error': OTP_ERROR_MESSAGES[otp_result]
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Mark OTP as used
-            otp_verification.is_used = True
-            otp_verification.save()
-            
             # Mark user as verified
             user.isVerified = True
-            user.save()
+            user.save(update_fields=['isVerified', 'updatedAt'])
             
             # Send welcome email
             send_welcome_email(user)
@@ -142,6 +183,7 @@ def verify_otp(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('login')])
 def login(request):
     serializer = UserLoginSerializer(data=request.data)
     if serializer.is_valid():
@@ -165,7 +207,9 @@ def logout(request):
     try:
         refresh_token = request.data["refresh"]
         token = RefreshToken(refresh_token)
-        token.blacklist()
+        revoke_token(token)
+        # Also end the access token this request was made with
+        revoke_token(request.auth)
         return Response({'message': 'Logout successful'}, status=status.HTTP_200_OK)
     except Exception as e:
         return Response({'error': 'Invalid token'}, status=status.HTTP_400_BAD_REQUEST)
@@ -184,14 +228,179 @@ def profile(request):
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Revision history shared by websites and blog posts
+class RevisionPagination(CursorPagination):
+    ordering = '-version'
+    page_size = 50
+
+class RevisionHistoryMixin:
+    """Records a revision on every create/update and adds revisions/restore actions"""
+    
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        record_revision(serializer.instance, self.request.user)
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        record_revision(serializer.instance, self.request.user)
+    
+    @action(detail=True, methods=['get'])
+    def revisions(self, request, pk=None):
+        """Versions newest first; ``?version=N`` returns that version's content"""
+        instance = self.get_object()
+        version = request.query_params.get('version')
+        if version is not None:
+            try:
+                state, version = reconstruct(instance, int(version))
+            except ValueError:
+                return Response({'error': 'Version must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+            except Revision.DoesNotExist:
+                return Response({'error': 'Revision not found'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'version': version, 'data': state})
+        
+        # data can be large; the list only needs the metadata
+        revisions = revisions_for(instance).select_related('user').defer('data')
+        paginator = RevisionPagination()
+        page = paginator.paginate_queryset(revisions, request, view=self)
+        return paginator.get_paginated_response(RevisionSerializer(page, many=True).data)
+    
+    @action(detail=True, methods=['post'])
+    def restore(self, request, pk=None):
+        """Bring back the content of ``version``, recorded as a new version"""
+        try:
+            version = int(request.data.get('version'))
+        except (TypeError, ValueError):
+            return Response({'error': 'Version must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        instance = self.get_object()
+        try:
+            with transaction.atomic():
+                restore_revision(instance, version, request.user)
+        except Revision.DoesNotExist:
+            return Response({'error': 'Revision not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(self.get_serializer(instance).data)
+
 # Website Management Views
-class WebsiteViewSet(viewsets.ModelViewSet):
+class WebsiteCustomerPagination(CursorPagination):
+    ordering = '-createdAt'
+    page_size = 50
+
+class WebsiteViewSet(RevisionHistoryMixin, VersionedUpdateMixin, viewsets.ModelViewSet):
     serializer_class = WebsiteSerializer
     permission_classes = [IsAuthenticated]
+    parser_classes = [*api_settings.DEFAULT_PARSER_CLASSES, JSONPatchParser, MergePatchParser]
     
     def get_queryset(self):
         return Website.objects.filter(user=self.request.user)
     
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # Buffered autosaves reach the database before anything else reads the row to change it
+        if self.action in ('update', 'partial_update', 'restore', 'clone'):
+            versions = None
+            if self.action in ('update', 'partial_update'):
+                # Read before the flush: only the owner autosaves, so an ETag
+                # from before the flush is not stale because of it
+                versions = self.get_expected_versions()
+            # 404s for other users' websites and malformed ids before anything is flushed
+            website = self.get_object()
+            written = flush_autosave(website.pk)
+            if written is not None and versions is not None and written - 1 in versions:
+                self.expected_versions = [*versions, written]
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(overlay_pending(page), many=True).data)
+        return Response(self.get_serializer(overlay_pending(queryset), many=True).data)
+    
+    def retrieve(self, request, *args, **kwargs):
+        # The editor sees its latest autosave, and the version it will be saved as, even before it is flushed
+        instance, = overlay_pending([self.get_object()])
+        return Response(self.get_serializer(instance).data)
+    
+    @action(detail=True, methods=['post', 'patch'])
+    def autosave(self, request, pk=None):
+        """
+        Buffer an edit (partial fields, or a JSON Patch / merge patch) instead of
+        writing it; it reaches the database within AUTOSAVE_FLUSH_SECONDS
+        """
+        website = self.get_object()
+        stored_version = website.version
+        # Edits build on what is already buffered, e.g. a buffered template rename
+        overlay_pending([website])
+        media_type = request.content_type.partition(';')[0].strip()
+        if media_type in (JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE):
+            try:
+                changes = patch_fields(website_documents(website), media_type, request.data)
+            except JSONPatchError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            check_website_content(changes)
+            template_changes(website, changes)
+        else:
+            serializer = self.get_serializer(website, data=request.data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            changes = dict(serializer.validated_data)
+        
+        written = buffer_autosave(website, changes, request.user) if changes else None
+        pending = sorted(get_pending(website.id))
+        # The version the row has after this flush, or will have after the next one
+        if written is not None:
+            version = written
+        else:
+            version = stored_version + 1 if pending else stored_version
+        return Response(
+            {'id': website.id, 'flushed': written is not None, 'pending': pending, 'version': version},
+            headers={'ETag': f'"{version}"'}
+        )
+    
+    @action(detail=True, methods=['post'])
+    def flush(self, request, pk=None):
+        """Explicit save: write any buffered autosave now"""
+        website = self.get_object()
+        written = flush_autosave(website.id)
+        if written is not None:
+            website.refresh_from_db()
+        data = self.get_serializer(website).data
+        data['flushed'] = written is not None
+        return Response(data, headers={'ETag': etag_for(website)})
+    
+    def partial_update(self, request, *args, **kwargs):
+        media_type = request.content_type.partition(';')[0].strip()
+        if media_type not in (JSON_PATCH_MEDIA_TYPE, MERGE_PATCH_MEDIA_TYPE):
+            return super().partial_update(request, *args, **kwargs)
+        
+        versions = self.get_expected_versions()
+        with transaction.atomic():
+            # Lock the row so concurrent patches apply one after the other
+            website = get_object_or_404(
+                self.get_queryset().select_for_update().only('id', 'user', 'version', *WEBSITE_DOCUMENT_COLUMNS),
+                pk=kwargs['pk']
+            )
+            if versions is not None and website.version not in versions:
+                raise PreconditionFailed()
+            try:
+                changed = patch_fields(website_documents(website), media_type, request.data)
+            except JSONPatchError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            check_website_content(changed)
+            updated = sorted(changed)
+            template_changes(website, changed)
+            
+            if changed:
+                for field, value in changed.items():
+                    setattr(website, field, value)
+                website.version += 1
+                # Only the changed documents are written back
+                website.save(update_fields=[*changed, 'version', 'updatedAt'])
+                record_revision(website, request.user)
+        
+        return Response(
+            {'id': website.id, 'updated': updated, 'version': website.version, 'updatedAt': website.updatedAt},
+            headers={'ETag': etag_for(website)}
+        )
+    
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def by_slug(self, request):
         slug = request.query_params.get('slug')
@@ -204,9 +413,72 @@ class WebsiteViewSet(viewsets.ModelViewSet):
             return Response(serializer.data)
         except Website.DoesNotExist:
             return Response({'error': 'Website not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        Copy the website with its products and blog posts under a new unique
+        slug; orders are only copied when ``include_orders`` is set
+        """
+        source = self.get_object()
+        serializer = WebsiteCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        website, counts = Website.objects.clone(source, request.user, **serializer.validated_data)
+        data = self.get_serializer(website).data
+        data['copied'] = counts
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'])
+    def customers(self, request, pk=None):
+        """Newest customers first; a range scan on the (website, createdAt) index"""
+        website = self.get_object()
+        memberships = WebsiteCustomer.objects.filter(website=website).select_related('user')
+        
+        paginator = WebsiteCustomerPagination()
+        page = paginator.paginate_queryset(memberships, request, view=self)
+        response = paginator.get_paginated_response(WebsiteCustomerSerializer(page, many=True).data)
+        # Kept up to date incrementally, so no COUNT query
+        response.data['count'] = website.customerCount
+        return response
+
+# Shared templates
+class TemplateViewSet(viewsets.ViewSet):
+    """
+    Public catalog of shared website templates, served from the in-process registry
+    
+    The ETag is the template's content hash. A version never changes, so
+    ``?version=N`` responses may be cached for good; the newest version of a
+    template for TEMPLATE_CACHE_SECONDS.
+    """
+    permission_classes = [AllowAny]
+    lookup_value_regex = '[^/]+'
+    
+    def list(self, request):
+        return Response([template_payload(template) for template in template_registry.all_latest()])
+    
+    def retrieve(self, request, pk=None):
+        version = request.query_params.get('version')
+        if version is None:
+            template = template_registry.latest(pk)
+            cache_control = f"public, max-age={getattr(settings, 'TEMPLATE_CACHE_SECONDS', 300)}"
+        else:
+            try:
+                template = template_registry.get_version(pk, int(version))
+            except ValueError:
+                return Response({'error': 'Version must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+            cache_control = 'public, max-age=31536000, immutable'
+        if template is None:
+            return Response({'error': 'Template not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        etag = f'"{template.contentHash}"'
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(template_payload(template), headers=headers)
 
 # Blog Management Views
-class BlogPostViewSet(viewsets.ModelViewSet):
+class BlogPostViewSet(RevisionHistoryMixin, VersionedUpdateMixin, viewsets.ModelViewSet):
     serializer_class = BlogPostSerializer
     permission_classes = [IsAuthenticated]
     
@@ -217,10 +489,10 @@ class BlogPostViewSet(viewsets.ModelViewSet):
         return BlogPost.objects.filter(website__user=self.request.user)
     
     def perform_create(self, serializer):
-        # Ensure the website belongs to the current user
-        website_id = serializer.validated_data['website'].id
-        website = Website.objects.get(id=website_id, user=self.request.user)
-        serializer.save()
+        # Ensure the website belongs to the current user; it is already loaded by the serializer
+        if serializer.validated_data['website'].user_id != self.request.user.id:
+            raise PermissionDenied('You can only add blog posts to your own websites')
+        super().perform_create(serializer)
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def by_website_slug(self, request):
@@ -237,7 +509,7 @@ class BlogPostViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Website not found'}, status=status.HTTP_404_NOT_FOUND)
 
 # Product Management Views
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(VersionedUpdateMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
     
@@ -248,11 +520,52 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Product.objects.filter(website__user=self.request.user)
     
     def perform_create(self, serializer):
-        # Ensure the website belongs to the current user
-        website_id = serializer.validated_data['website'].id
-        website = Website.objects.get(id=website_id, user=self.request.user)
+        # Ensure the website belongs to the current user; it is already loaded by the serializer
+        if serializer.validated_data['website'].user_id != self.request.user.id:
+            raise PermissionDenied('You can only add products to your own websites')
         serializer.save()
     
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """
+        Import a catalog file (multipart ``file``, CSV with a header row or NDJSON)
+        into the website given by ``website``; returns per-row errors
+        """
+        website = get_object_or_404(Website, id=request.data.get('website'), user=request.user)
+        uploaded_file = request.FILES.get('file')
+        if not uploaded_file:
+            return Response({'error': 'A catalog file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        file_format = request.data.get('format')
+        if file_format not in (None, 'csv', 'ndjson'):
+            return Response({'error': 'Format must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        report = CatalogImporter(website).run(iter_catalog_rows(uploaded_file, file_format))
+        response_status = status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+        return Response(report, status=response_status)
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Change many products at once: explicit per-product ``updates``,
+        set-based ``rules`` (e.g. +10% price for a category) and a ``delete``
+        filter, all in one transaction; returns the affected counts
+        """
+        serializer = ProductBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        
+        try:
+            result = Product.objects.bulk_change(
+                request.user,
+                updates=data.get('updates', []),
+                rules=data.get('rules', []),
+                delete=data.get('delete'),
+            )
+        except Product.DoesNotExist as e:
+            return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response(result)
+    
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def by_website_slug(self, request):
         slug = request.query_params.get('slug')
@@ -293,7 +606,8 @@ class OrderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Order.objects.filter(website__user=self.request.user)
     
-    @action(detail=False, methods=['post'], permission_classes=[AllowAny])
+    @action(detail=False, methods=['post'], permission_classes=[AllowAny],
+            throttle_classes=[scoped_throttle('create_order')])
     def create_order(self, request):
         serializer = CheckoutSerializer(data=request.data)
         if serializer.is_valid():
@@ -305,8 +619,28 @@ class OrderViewSet(viewsets.ModelViewSet):
             except Website.DoesNotExist:
                 return Response({'error': 'Website not found'}, status=status.HTTP_404_NOT_FOUND)
             
-            # For anonymous users, we'll need to handle cart items from request
-            cart_items = request.data.get('items', [])
+            # Prefer the server-side guest cart; fall back to items sent by the client.
+            # Either way every line is priced from the website's products
+            cart_token = get_request_cart_token(request)
+            cart_items = guest_cart_order_items(cart_token, website_slug)
+            if cart_items is None:
+                items = request.data.get('items', [])
+                if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+                    return Response({'error': 'Items must be a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+                
+                lines = []
+                for item in items:
+                    quantity = item.get('quantity', 1)
+                    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+                        return Response({'error': 'Item quantities must be positive integers'}, status=status.HTTP_400_BAD_REQUEST)
+                    lines.append({'product_id': str(item.get('product_id', item.get('id', ''))), 'quantity': quantity})
+                
+                cart_items, missing = price_order_items(lines, website_slug)
+                if missing:
+                    return Response({
+                        'error': 'Some products are not available on this website',
+                        'product_ids': missing,
+                    }, status=status.HTTP_400_BAD_REQUEST)
             
             if not cart_items:
                 return Response({'error': 'No items in cart'}, status=status.HTTP_400_BAD_REQUEST)
@@ -329,6 +663,8 @@ class OrderViewSet(viewsets.ModelViewSet):
                 customerZipCode=serializer.validated_data['customerZipCode'],
             )
             
+            clear_guest_cart(cart_token, website_slug)
+            
             return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -359,6 +695,54 @@ class OrderViewSet(viewsets.ModelViewSet):
                 'error': f'Failed to fetch customer orders: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Broadcast Email Views
+class BroadcastViewSet(viewsets.ModelViewSet):
+    """Emails from a website owner to the website's customers, sent by the send_broadcasts worker"""
+    serializer_class = BroadcastSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        website_id = self.request.query_params.get('website')
+        broadcasts = Broadcast.objects.filter(website__user=self.request.user).order_by('-createdAt')
+        if website_id:
+            broadcasts = broadcasts.filter(website_id=website_id)
+        return broadcasts
+    
+    def perform_create(self, serializer):
+        # Ensure the website belongs to the current user
+        if serializer.validated_data['website'].user_id != self.request.user.id:
+            raise PermissionDenied('You can only email customers of your own websites')
+        serializer.save()
+    
+    def perform_update(self, serializer):
+        if serializer.instance.status != 'draft':
+            raise PermissionDenied('Only draft broadcasts can be edited')
+        if serializer.validated_data.get('website', serializer.instance.website).user_id != self.request.user.id:
+            raise PermissionDenied('You can only email customers of your own websites')
+        serializer.save()
+    
+    @action(detail=True, methods=['post'])
+    def send(self, request, pk=None):
+        """Queue a draft broadcast for delivery"""
+        broadcast = self.get_object()
+        if broadcast.status != 'draft':
+            return Response({'error': 'Broadcast has already been sent'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        broadcast.status = 'queued'
+        broadcast.total_recipients = broadcast_recipients_queryset(broadcast.website).count()
+        broadcast.save(update_fields=['status', 'total_recipients'])
+        return Response(self.get_serializer(broadcast).data)
+    
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """Stop a queued or in-progress broadcast"""
+        updated = Broadcast.objects.filter(
+            id=self.get_object().id, status__in=['queued', 'sending']
+        ).update(status='cancelled', completedAt=timezone.now())
+        if not updated:
+            return Response({'error': 'Broadcast is not being sent'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(self.get_object()).data)
+
 # Cart Management Views
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
@@ -367,27 +751,96 @@ class CartViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Cart.objects.filter(user=self.request.user)
     
+    def perform_create(self, serializer):
+        # Same item posted twice increments the existing line instead of duplicating it
+        serializer.instance, _ = Cart.objects.add_item(user=self.request.user, **serializer.validated_data)
+    
     @action(detail=False, methods=['post'])
     def add_to_cart(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            # Check if item already exists in cart
-            existing_item = Cart.objects.filter(
-                user=request.user,
-                product_id=serializer.validated_data['product_id'],
-                websiteSlug=serializer.validated_data['websiteSlug']
-            ).first()
-            
-            if existing_item:
-                existing_item.quantity += serializer.validated_data['quantity']
-                existing_item.save()
-                return Response(CartSerializer(existing_item).data)
-            else:
-                cart_item = serializer.save()
+            # Atomic upsert: increments an existing line in place or inserts a new one
+            cart_item, created = Cart.objects.add_item(user=request.user, **serializer.validated_data)
+            
+            if created:
                 return Response(CartSerializer(cart_item).data, status=status.HTTP_201_CREATED)
+            return Response(CartSerializer(cart_item).data)
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply a list of set/add/remove operations in one transaction and return the cart"""
+        serializer = CartBatchSerializer(data=request.data)
+        if serializer.is_valid():
+            Cart.objects.apply_operations(request.user, serializer.validated_data['operations'])
+            return Response(CartSerializer(self.get_queryset(), many=True).data)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Per-website cart totals, with every line revalidated against current product price and stock"""
+        cart_items = self.get_queryset()
+        website_slug = request.query_params.get('website_slug')
+        if website_slug:
+            cart_items = cart_items.filter(websiteSlug=website_slug)
+        
+        # Subtotals and counts in one grouped aggregate query
+        websites = list(
+            cart_items.values('websiteSlug', 'websiteName')
+            .annotate(
+                line_count=Count('id'),
+                item_count=Sum('quantity'),
+                subtotal=Sum(F('product_price') * F('quantity')),
+            )
+            .order_by('websiteSlug')
+        )
+        
+        lines = list(cart_items.values_list('id', 'product_id', 'websiteSlug', 'quantity', 'product_price'))
+        
+        # Current price and stock for every line in one bulk lookup
+        product_ids = {int(product_id) for _, product_id, _, _, _ in lines if product_id.isdigit()}
+        products = {
+            (str(product['id']), product['website__slug']): product
+            for product in Product.objects.filter(
+                id__in=product_ids,
+                website__slug__in={slug for _, _, slug, _, _ in lines},
+            ).values('id', 'website__slug', 'price', 'inventory', 'status')
+        }
+        
+        issues = []
+        for item_id, product_id, slug, quantity, price in lines:
+            product = products.get((product_id, slug))
+            flags = []
+            if product is None:
+                flags.append('unavailable')
+            else:
+                if product['price'] != price:
+                    flags.append('price_changed')
+                if product['status'] != 'active' or product['inventory'] < quantity:
+                    flags.append('out_of_stock')
+            
+            if flags:
+                issues.append({
+                    'id': item_id,
+                    'product_id': product_id,
+                    'websiteSlug': slug,
+                    'quantity': quantity,
+                    'product_price': price,
+                    'current_price': product['price'] if product else None,
+                    'inventory': product['inventory'] if product else 0,
+                    'flags': flags,
+                })
+        
+        return Response({
+            'websites': websites,
+            'item_count': sum(website['item_count'] for website in websites),
+            'total': sum((website['subtotal'] for website in websites), 0),
+            'issues': issues,
+            'valid': not issues,
+        })
+    
     @action(detail=False, methods=['delete'])
     def clear_cart(self, request):
         website_slug = request.query_params.get('website_slug')
@@ -397,6 +850,30 @@ class CartViewSet(viewsets.ModelViewSet):
             Cart.objects.filter(user=request.user).delete()
         return Response({'message': 'Cart cleared successfully'}, status=status.HTTP_200_OK)
 
+class GuestCartViewSet(viewsets.ViewSet):
+    """Cache-backed cart for anonymous shoppers, identified by a signed X-Cart-Token"""
+    permission_classes = [AllowAny]
+    
+    def list(self, request):
+        cart_token = get_request_cart_token(request)
+        return Response({'cart_token': cart_token, 'items': get_guest_cart(cart_token)})
+    
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        if serializer.is_valid():
+            cart_token, items = apply_guest_operations(
+                get_request_cart_token(request), serializer.validated_data['operations']
+            )
+            return Response({'cart_token': cart_token, 'items': items})
+        
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['delete'])
+    def clear_cart(self, request):
+        clear_guest_cart(get_request_cart_token(request), request.query_params.get('website_slug'))
+        return Response({'message': 'Cart cleared successfully'}, status=status.HTTP_200_OK)
+
 # Analytics Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -405,6 +882,7 @@ def dashboard_analytics(request):
     
     analytics = {
         'total_websites': user_websites.count(),
+        'total_customers': user_websites.aggregate(total=Sum('customerCount'))['total'] or 0,
         'total_products': Product.objects.filter(website__user=request.user).count(),
         'total_orders': Order.objects.filter(website__user=request.user).count(),
         'total_revenue': sum(order.total for order in Order.objects.filter(website__user=request.user)),
@@ -414,6 +892,40 @@ def dashboard_analytics(request):
     
     return Response(analytics)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def abandoned_cart_analytics(request):
+    """Abandoned cart totals per product for the user's websites"""
+    website_slugs = Website.objects.filter(user=request.user).values_list('slug', flat=True)
+    stats = AbandonedCartStat.objects.filter(websiteSlug__in=website_slugs)
+    
+    website_slug = request.query_params.get('website_slug')
+    if website_slug:
+        stats = stats.filter(websiteSlug=website_slug)
+    
+    since = parse_date(request.query_params.get('since', ''))
+    if since:
+        stats = stats.filter(date__gte=since)
+    
+    products = (
+        stats.values('websiteSlug', 'product_id')
+        .annotate(
+            product_name=Max('product_name'),
+            line_count=Sum('line_count'),
+            item_count=Sum('item_count'),
+            value=Sum('value'),
+        )
+        .order_by('-value')[:100]
+    )
+    totals = stats.aggregate(line_count=Sum('line_count'), item_count=Sum('item_count'), value=Sum('value'))
+    
+    return Response({
+        'total_lines': totals['line_count'] or 0,
+        'total_items': totals['item_count'] or 0,
+        'total_value': totals['value'] or 0,
+        'products': list(products),
+    })
+
 # Search Views
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -478,13 +990,16 @@ def search_content(request):
     
     # Search blog posts
     if not content_type or content_type == 'blog':
-        blogs = BlogPost.objects.filter(
-            website__user=request.user,
-            title__icontains=query
-        ) | BlogPost.objects.filter(
-            website__user=request.user,
-            content__icontains=query
-        )
+        owned_blogs = BlogPost.objects.filter(website__user=request.user).select_related('website')
+        blogs = list(owned_blogs.filter(Q(title__icontains=query) | Q(excerpt__icontains=query)))
+        # content is stored compressed, so it can only be matched once loaded;
+        # only the most recently updated of the remaining posts are scanned
+        lowered_query = query.lower()
+        scan_limit = getattr(settings, 'SEARCH_CONTENT_SCAN_LIMIT', 200)
+        blogs += [
+            blog for blog in owned_blogs.exclude(pk__in=[blog.pk for blog in blogs]).order_by('-updatedAt')[:scan_limit]
+            if lowered_query in blog.content.lower()
+        ]
         
         for blog in blogs:
             results.append({
@@ -595,6 +1110,7 @@ def generate_search_suggestions(query, user):
 # Customer Authentication Views (for subsite users)
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('customer_signup')])
 def customer_signup(request):
     """Customer signup for specific website"""
     try:
@@ -646,8 +1162,9 @@ def customer_signup(request):
             first_name = name_parts[0]
             last_name = name_parts[1] if len(name_parts) > 1 else ''
         
-        # Create user
-        user = User.objects.create_user(
+        # Create user and send the OTP email together
+        user = create_unverified_user(partial(
+            User.objects.create_user,
             username=email,  # Use email as username
             email=email,
             password=password,
@@ -655,16 +1172,9 @@ def customer_signup(request):
             lastName=last_name,
             phone=phone,
             isVerified=False  # Will be verified via OTP
-        )
+        ), website)
         
-        # Generate OTP
-        otp = ''.join(random.choices(string.digits, k=6))
-        OTPVerification.objects.create(user=user, otp=otp)
-        
-        # Send OTP email
-        email_sent = send_otp_email(user, otp)
-        
-        if not email_sent:
+        if user is None:
             return Response({
                 'success': False,
                 'error': 'Failed to send verification email. Please try again.'
@@ -692,6 +1202,7 @@ def customer_signup(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('customer_login')])
 def customer_login(request):
     """Customer login for specific website"""
     try:
@@ -730,6 +1241,11 @@ def customer_login(request):
                 'requires_verification': True
             }, status=status.HTTP_401_UNAUTHORIZED)
         
+        WebsiteCustomer.objects.record(website, user)
+        
+        # Move any anonymous cart into the customer's cart
+        merge_guest_cart(user, get_request_cart_token(request))
+        
         # Generate JWT tokens
         refresh = RefreshToken.for_user(user)
         
@@ -757,6 +1273,7 @@ def customer_login(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([scoped_throttle('customer_verify_otp')])
 def customer_verify_otp(request):
     """Verify customer OTP for specific website"""
     try:
@@ -782,37 +1299,27 @@ def customer_verify_otp(request):
         try:
             user = User.objects.get(email=email)
             
-            # Get the latest unused OTP for this user
-            otp_verification = OTPVerification.objects.filter(
-                user=user, 
-                otp=otp, 
-                is_used=False
-            ).first()
+            # Check and consume the OTP without touching the database
+            otp_result = check_otp(user, otp)
             
-            if not otp_verification:
+            if otp_result != OTP_VALID:
                 return Response({
                     'success': False,
-                    'error': 'Invalid or expired OTP. Please request a new one.'
+                    'error': OTP_ERROR_MESSAGES[otp_result]
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Check if OTP is expired (10 minutes)
-            if otp_verification.is_expired():
-                return Response({
-                    'success': False,
-                    'error': 'OTP has expired. Please request a new one.'
-                }, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Mark OTP as used
-            otp_verification.is_used = True
-            otp_verification.save()
-            
             # Mark user as verified
             user.isVerified = True
-            user.save()
+            user.save(update_fields=['isVerified', 'updatedAt'])
             
             # Send welcome email
             send_welcome_email(user)
             
+            WebsiteCustomer.objects.record(website, user)
+            
+            # Move any anonymous cart into the customer's cart
+            merge_guest_cart(user, get_request_cart_token(request))
+            
             # Generate JWT tokens
             refresh = RefreshToken.for_user(user)
             
@@ -910,10 +1417,13 @@ def customer_profile(request):
 def customer_logout(request):
     """Customer logout"""
     try:
+        # End the access token this request was made with
+        revoke_token(request.auth)
+        
         refresh_token = request.data.get("refresh_token")
         if refresh_token:
             token = RefreshToken(refresh_token)
-            token.blacklist()
+            revoke_token(token)
         
         return Response({
             'success': True,
@@ -929,3 +1439,236 @@ def customer_logout(request):
                 'message': 'Logout successful'
             }
         }, status=status.HTTP_200_OK)
+
+# Async authentication views
+# Served instead of the sync views above when ASYNC_AUTH_VIEWS is on (see urls.py).
+# Password hashing runs on the bounded hashing pool, so under ASGI a burst of
+# logins no longer blocks the thread every sync view shares.
+def parse_request_data(request):
+    """Request body as a dict, for plain Django views that accept JSON or form data"""
+    if request.content_type == 'application/json':
+        return json.loads(request.body or b'{}')
+    return request.POST
+
+def async_auth_view(scope):
+    """
+    Make an async auth view POST-only and CSRF exempt like @api_view, apply
+    the RATE_LIMITS entry for ``scope``, and answer 503 instead of queueing
+    when the hashing pool is full
+    """
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                data = parse_request_data(request)
+                rate_limit = await sync_to_async(check_rate_limits)(scope, request, data)
+                if rate_limit and not rate_limit.allowed:
+                    return JsonResponse({
+                        'detail': f'Request was throttled. Expected available in {rate_limit.retry_after} seconds.'
+                    }, status=status.HTTP_429_TOO_MANY_REQUESTS)
+                return await view(request, *args, **kwargs)
+            except json.JSONDecodeError as e:
+                return JsonResponse({'detail': f'JSON parse error - {e}'}, status=status.HTTP_400_BAD_REQUEST)
+            except PasswordHashingBusy:
+                response = JsonResponse({
+                    'success': False,
+                    'error': 'Too many sign-in requests right now. Please try again shortly.'
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response['Retry-After'] = '1'
+                return response
+        return csrf_exempt(require_POST(wrapper))
+    return decorator
+
+@async_auth_view('register')
+async def register_async(request):
+    serializer = UserRegistrationSerializer(data=parse_request_data(request))
+    if not await sync_to_async(serializer.is_valid)():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST, encoder=JSONEncoder)
+    
+    password_hash = await amake_password(serializer.validated_data['password'])
+    user = await sync_to_async(create_unverified_user)(partial(serializer.save, password_hash=password_hash))
+    
+    if user is None:
+        return JsonResponse({
+            'error': 'Failed to send verification email. Please try again.'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    return JsonResponse({
+        'message': 'User registered successfully. Please check your email for OTP verification.',
+        'user': UserSerializer(user).data
+    }, status=status.HTTP_201_CREATED, encoder=JSONEncoder)
+
+@async_auth_view('login')
+async def login_async(request):
+    data = parse_request_data(request)
+    user = await aauthenticate(data.get('email'), data.get('password'))
+    
+    serializer = UserLoginSerializer(data=data, context={'user': user})
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST, encoder=JSONEncoder)
+    
+    refresh = RefreshToken.for_user(user)
+    return JsonResponse({
+        'message': 'Login successful',
+        'user': UserSerializer(user).data,
+        'tokens': {
+            'refresh': str(refresh),
+            'access': str(refresh.access_token),
+        }
+    }, status=status.HTTP_200_OK, encoder=JSONEncoder)
+
+@async_auth_view('customer_signup')
+async def customer_signup_async(request):
+    """Customer signup for specific website"""
+    data = parse_request_data(request)
+    try:
+        email = data.get('email')
+        password = data.get('password')
+        confirm_password = data.get('confirmPassword')
+        first_name = data.get('firstName', '')
+        last_name = data.get('lastName', '')
+        phone = data.get('phone', '')
+        website_slug = data.get('website_slug')
+        
+        # Handle both name formats (legacy and new)
+        name = data.get('name')
+        if not name and (first_name or last_name):
+            name = f"{first_name} {last_name}".strip()
+        
+        if not all([email, password, website_slug]):
+            return JsonResponse({
+                'success': False,
+                'error': 'Email, password, and website are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if confirm_password and password != confirm_password:
+            return JsonResponse({
+                'success': False,
+                'error': 'Passwords do not match'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        website = await Website.objects.filter(slug=website_slug).afirst()
+        if website is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Website not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        if await User.objects.filter(email=email).aexists():
+            return JsonResponse({
+                'success': False,
+                'error': 'User with this email already exists'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not first_name and not last_name and name:
+            name_parts = name.strip().split(' ', 1)
+            first_name = name_parts[0]
+            last_name = name_parts[1] if len(name_parts) > 1 else ''
+        
+        user = await sync_to_async(create_unverified_user)(partial(
+            User.objects.create,
+            username=email,
+            email=User.objects.normalize_email(email),
+            password=await amake_password(password),
+            firstName=first_name,
+            lastName=last_name,
+            phone=phone,
+            isVerified=False
+        ), website)
+        
+        if user is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Failed to send verification email. Please try again.'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        return JsonResponse({
+            'success': True,
+            'data': {
+                'message': 'Account created successfully. Please check your email for verification code.',
+                'user': {
+                    'id': user.id,
+                    'email': user.email,
+                    'name': f"{user.firstName} {user.lastName}".strip(),
+                    'isVerified': user.isVerified
+                },
+                'requires_verification': True
+            }
+        }, status=status.HTTP_201_CREATED)
+        
+    except PasswordHashingBusy:
+        raise
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@async_auth_view('customer_login')
+async def customer_login_async(request):
+    """Customer login for specific website"""
+    data = parse_request_data(request)
+    try:
+        email = data.get('email')
+        password = data.get('password')
+        website_slug = data.get('website_slug')
+        
+        if not all([email, password, website_slug]):
+            return JsonResponse({
+                'success': False,
+                'error': 'Email, password, and website are required'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        website = await Website.objects.filter(slug=website_slug).afirst()
+        if website is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Website not found'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        user = await aauthenticate(email, password)
+        
+        if not user:
+            return JsonResponse({
+                'success': False,
+                'error': 'Invalid email or password'
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        if not user.isVerified:
+            return JsonResponse({
+                'success': False,
+                'error': 'Please verify your email before logging in',
+                'requires_verification': True
+            }, status=status.HTTP_401_UNAUTHORIZED)
+        
+        await sync_to_async(WebsiteCustomer.objects.record)(website, user)
+        
+        # Move any anonymous cart into the customer's cart
+        cart_token = request.headers.get(CART_TOKEN_HEADER) or data.get('cart_token')
+        await sync_to_async(merge_guest_cart)(user, cart_token)
+        
+        refresh = RefreshToken.for_user(user)
+        
+        return JsonResponse({
+            'success': True,
+            'data': {
+                'message': 'Login successful',
+                'user': {
+                    'id': user.id,
+                    'email': user.email,
+                    'name': f"{user.firstName} {user.lastName}".strip(),
+                    'isVerified': user.isVerified
+                },
+                'access_token': str(refresh.access_token),
+                'refresh_token': str(refresh),
+                'website_slug': website_slug
+            }
+        }, status=status.HTTP_200_OK)
+        
+    except PasswordHashingBusy:
+        raise
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': 'Internal server error'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'builderapi.throttling.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'builderbackend.urls'
@@ -129,7 +131,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Django REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'builderapi.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -138,12 +140,18 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # Reverse proxies in front of the app that append to X-Forwarded-For; with 0
+    # the header is ignored and rate limits are keyed on REMOTE_ADDR
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
 }
 
 # JWT Configuration
 from datetime import timedelta
 
+# Seconds an authenticated user is served from the cache instead of the database
+AUTH_USER_CACHE_TTL = 60
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -168,8 +176,20 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_EXP_CLAIM': 'refresh_exp',
     'SLIDING_TOKEN_LIFETIME': timedelta(minutes=5),
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
+    # Refresh rejects revoked tokens and revokes the old token after rotation
+    'TOKEN_REFRESH_SERIALIZER': 'builderapi.serializers.RevocableTokenRefreshSerializer',
 }
 
+# Password hashing for login and signup (see builderapi/password_hashing.py)
+ASYNC_AUTH_VIEWS = True  # serve the async auth views, which hash on a thread pool
+PASSWORD_HASH_WORKERS = None  # pool size; defaults to the CPU count
+PASSWORD_HASH_MAX_PENDING = 64  # hashes running or queued before new requests get 503
+
+# Revoked tokens (logout and refresh rotation), see builderapi/token_revocation.py
+REVOKED_TOKEN_SYNC_SECONDS = 30  # how quickly other workers see a revocation
+REVOKED_TOKEN_REBUILD_SECONDS = 3600  # full reload, dropping expired ids from memory
+REVOKED_TOKEN_EXACT_SET_SIZE = 10000
+
 # CORS Configuration
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
@@ -182,6 +202,88 @@ CORS_ALLOW_CREDENTIALS = True
 
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 
+CORS_EXPOSE_HEADERS = ['RateLimit-Limit', 'RateLimit-Remaining', 'RateLimit-Reset', 'Retry-After', 'ETag']
+
+from corsheaders.defaults import default_headers
+
+CORS_ALLOW_HEADERS = (*default_headers, 'if-match')
+
+# Updates of websites, products and blog posts must carry If-Match with the
+# ETag last received (see builderapi/concurrency.py); False applies header-less
+# updates unconditionally
+REQUIRE_IF_MATCH = True
+
+# Rate limits for the unauthenticated write endpoints (see builderapi/throttling.py)
+# Sliding windows keyed by client IP, email and website slug; rates are
+# '<requests>/<period>' with periods such as 's', 'm', 'h', 'd' or '15m'
+RATE_LIMITS = {
+    'register': {'ip': '20/h', 'email': '5/h'},
+    'resend_otp': {'ip': '20/h', 'email': '5/h'},
+    'verify_otp': {'ip': '60/h', 'email': '10/15m'},
+    'login': {'ip': '60/h', 'email': '10/15m'},
+    'customer_signup': {'ip': '20/h', 'email': '5/h', 'website': '500/h'},
+    'customer_login': {'ip': '60/h', 'email': '10/15m', 'website': '2000/h'},
+    'customer_verify_otp': {'ip': '60/h', 'email': '10/15m'},
+    'create_order': {'ip': '30/h', 'email': '10/h', 'website': '1000/h'},
+}
+
+# Cache (per-process, disposable data)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # OTP attempts and used codes, rate limit counters, cached users and guest
+    # carts (builderapi.shared_cache): shared by all workers and never culled.
+    # Redis with a noeviction policy when REDIS_URL is set; otherwise the database
+    # (run `python manage.py createcachetable`), whose counters are not atomic
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    } if os.environ.get('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'builderapi_shared_cache',
+        'OPTIONS': {'MAX_ENTRIES': 10_000_000},
+    },
+}
+
+# Idle guest carts expire after this many seconds
+GUEST_CART_TTL = 60 * 60 * 24 * 7
+
+# purge_abandoned_carts deletes cart lines idle for longer than this
+CART_ABANDONED_AFTER_DAYS = 30
+
+# Processes validating rows during product catalog imports through the API;
+# 0 validates in the request's process (import_catalog takes --workers)
+CATALOG_IMPORT_WORKERS = 0
+
+# Website and blog post history: a full snapshot at least every N revisions,
+# JSON Patch diffs in between; prune_revisions compacts history older than the window
+REVISION_SNAPSHOT_INTERVAL = 25
+REVISION_RETENTION_DAYS = 90
+
+# Autosaves are buffered in the cache and written at most this often per website
+AUTOSAVE_FLUSH_SECONDS = 10
+
+# Large JSON/text columns (see builderapi/fields.py): values of at least this
+# many bytes are stored compressed with this codec ('zlib', or 'zstd' with the
+# zstandard package); run recompress_fields after changing either
+COMPRESSED_FIELD_THRESHOLD = 1024
+COMPRESSED_FIELD_CODEC = 'zlib'
+
+# Search matches blog titles and excerpts in SQL; compressed blog content can
+# only be searched after loading it, so just this many recent posts are scanned
+SEARCH_CONTENT_SCAN_LIMIT = 200
+
+# Browser/CDN lifetime of the newest version of a shared template (/api/templates/<id>/);
+# specific versions (?version=N) never change and are cached for good
+TEMPLATE_CACHE_SECONDS = 300
+
+# Website content documents (contentBlocks, theme, services, features, teamInfo)
+# are checked against the schemas in builderapi/json_schema.py on every save;
+# per-field size limits in bytes of JSON can be overridden, e.g. {'contentBlocks': 1048576}
+VALIDATE_WEBSITE_CONTENT = True
+WEBSITE_CONTENT_MAX_BYTES = {}
+
 # Custom User Model
 AUTH_USER_MODEL = 'builderapi.User'
 
@@ -193,3 +295,21 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'fleetyofficial@gmail.com'
 EMAIL_HOST_PASSWORD = 'cvvhhefqppsheeiv'
 DEFAULT_FROM_EMAIL = 'Corporate Portal <fleetyofficial@gmail.com>'
+
+# Email verification codes are valid for OTP_VALID_STEPS steps of OTP_STEP_SECONDS (10-15 minutes)
+OTP_STEP_SECONDS = 300
+OTP_VALID_STEPS = 3
+OTP_MAX_ATTEMPTS = 5
+
+# Email outbox (delivered by `python manage.py send_queued_emails`)
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 60  # seconds, doubled after every failed attempt
+EMAIL_OUTBOX_RATE_LIMITS = {
+    # Messages per minute per recipient domain; '*' covers all other domains
+    '*': 120,
+}
+
+# Merchant broadcasts (delivered by `python manage.py send_broadcasts`)
+EMAIL_BROADCAST_CHUNK_SIZE = 100  # recipients per send_messages call
+EMAIL_BROADCAST_CONNECTIONS = 3  # pooled SMTP connections per sender